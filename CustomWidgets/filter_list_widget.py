@@ -2,8 +2,8 @@
     Filter List Widget with add remove buttons
 """
 import sys
-from typing import Union
-from PyQt5.QtCore import pyqtSlot, pyqtSignal
+from typing import Callable, List, Optional, Union
+from PyQt5.QtCore import pyqtSlot, pyqtSignal, QTimer, QModelIndex, QAbstractItemModel
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QListView, QLineEdit,
     QSizePolicy, QListWidgetItem, QFrame, QLabel
@@ -11,6 +11,9 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtGui import QStandardItemModel, QStandardItem
 from CustomWidgets.add_remove_buttons import EDAddRemoveButtons
 
+SEARCH_DELAY = 250  # ms without typing before a search is sent
+SEARCH_LIMIT = 50
+
 
 class EDFilterListWidget(QWidget):
     """FilterListWidget Combines a QLineEdit and a QListView"""
@@ -36,7 +39,14 @@ class EDFilterListWidget(QWidget):
         filter_h_layout.addWidget(self.line_edit)
 
         h_layout.addWidget(filter_frame)
-        self.line_edit.textEdited.connect(self.filter)
+        self.line_edit.textEdited.connect(self.text_edited)
+
+        self._search: Optional[Callable[[str, int], Optional[List[int]]]] = None
+        self.search_limit = SEARCH_LIMIT
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY)
+        self.search_timer.timeout.connect(self.run_search)
 
         self.list = QListView(self)
         self.model = QStandardItemModel(self.list)
@@ -52,10 +62,56 @@ class EDFilterListWidget(QWidget):
         self.controls.rm_btn.clicked.connect(self.remove_item)
         v_layout.addWidget(self.controls)
 
+    def set_model(self, model: QAbstractItemModel):
+        """Show model instead of the built in QStandardItemModel. Connect to the list's selectionModel afterwards,
+           the view gets a new one"""
+        self.model = model
+        self.list.setModel(model)
+
+    def text(self, row: int) -> str:
+        """Text shown in row"""
+        return str(self.model.index(row, 0).data())
+
+    def _fetch_all(self):
+        while self.model.canFetchMore(QModelIndex()):
+            self.model.fetchMore(QModelIndex())
+
+    def set_search(self, search: Callable[[str, int], Optional[List[int]]], limit: int = SEARCH_LIMIT,
+                   delay: int = SEARCH_DELAY):
+        """Answer the filter with search(text, limit), the ids of the matching records best first, once typing has
+           paused for delay ms. The model, a RecordModel, shows just those records. A search that returns None falls
+           back to filtering the listed items"""
+        self._search = search
+        self.search_limit = limit
+        self.search_timer.setInterval(delay)
+
+    @pyqtSlot(str)
+    def text_edited(self, filter_text: str):
+        """Filter right away without a search, otherwise restart the debounce"""
+        if self._search is None:
+            self.filter(filter_text)
+        elif not filter_text.strip():
+            self.search_timer.stop()
+            self.model.show_all()
+        else:
+            self.search_timer.start()
+
+    @pyqtSlot()
+    def run_search(self):
+        """Send the current filter text to the search and show its hits in rank order"""
+        filter_text = self.line_edit.text()
+        hits = self._search(filter_text, self.search_limit)
+        if hits is None:
+            self.filter(filter_text)
+            return
+        self.model.show_ids(hits)
+
     def filter(self, filter_text):
         """Hides rows that do not have the pattern"""
+        filter_text = filter_text.lower()
+        self._fetch_all()
         for row in range(self.model.rowCount()):
-            if filter_text in str(self.model.item(row).text()).lower():
+            if filter_text in self.text(row).lower():
                 self.list.setRowHidden(row, False)
             else:
                 self.list.setRowHidden(row, True)
@@ -76,24 +132,25 @@ class EDFilterListWidget(QWidget):
 
     # pylint: disable=invalid-name
     def takeItem(self, row: int):
-        """Take Item from the list"""
+        """Take Item from the list. Only for the built in QStandardItemModel"""
         item = self.model.takeItem(row)
         self.model.takeRow(row)
         return item
 
     # pylint: disable=invalid-name
     def addItem(self, item: Union[QListWidgetItem, QStandardItem, str]):
-        """Add Item to the list"""
+        """Add Item to the list. Only for the built in QStandardItemModel"""
         if isinstance(item, str):
             item = QStandardItem(item)
         self.model.appendRow(item)
 
     def count(self):
-        """Convenience method"""
+        """Convenience method. Counts rows a lazy model hasn't fetched yet too"""
+        self._fetch_all()
         return self.model.rowCount()
 
     def item(self, row):
-        """Convenience method to reveal model method"""
+        """Convenience method to reveal model method. Only for the built in QStandardItemModel"""
         return self.model.item(row)
 
     # pylint: disable=invalid-name
@@ -10,7 +10,7 @@ __license__ = "MIT"
 
 from PyQt5.uic import loadUi  # noqa
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, pyqtSlot, QObject
-from PyQt5.QtGui import QPixmap, QImage, QKeySequence
+from PyQt5.QtGui import QKeySequence
 from PyQt5.QtWidgets import (
     QWidget, QApplication, QTextEdit, QGraphicsView, QGraphicsScene, QPushButton,
     QShortcut, QLabel
@@ -18,7 +18,8 @@ from PyQt5.QtWidgets import (
 
 from CustomWidgets.spinner import WaitingSpinner
 from CustomWidgets.template_widget import TemplateWidget
-from latex_data import LatexData, TemplateID
+from latex_data import LatexData, TemplateID, preview_latex_data, warm_latex_server
+from pixmap_cache import pixmap_cache
 
 
 class LatexWorker(QObject):
@@ -35,8 +36,8 @@ class LatexWorker(QObject):
 
     @pyqtSlot()
     def compile(self):
-        """Compile LaTeX"""
-        latex_obj = LatexData(latex=self.text, template_id=self.template_id)
+        """Compile LaTeX through the latex server, which only has to typeset the formula"""
+        latex_obj = preview_latex_data(self.text, template_id=self.template_id)
         self.compiled.emit(latex_obj)  # noqa
 
 
@@ -115,6 +116,7 @@ class LatexWidget(QWidget):
     def set_latex_data(self, data: LatexData):
         """Set LatexData Member. Called at initialization and after compile"""
         self.latex_data = data
+        warm_latex_server(data.template_id, my_conn=data.my_conn)
         self.text_edit.setText(data.latex)
         self.template_manager.set_template_data(data)
 
@@ -123,10 +125,10 @@ class LatexWidget(QWidget):
 
     def update_image(self):
         """Updated Image"""
-        img = QImage.fromData(self.latex_data.image)
-        pixmap = QPixmap.fromImage(img)
+        pixmap = pixmap_cache().latex_pixmap(self.latex_data)
         self.scene.clear()
-        self.scene.addPixmap(pixmap)
+        if pixmap is not None:
+            self.scene.addPixmap(pixmap)
         self.spinner.stop()
 
     def show_template_manager(self):
@@ -0,0 +1,218 @@
+"""
+Models and a delegate that show records straight from a DataFrame without a widget or item per row.
+
+RecordModel hands rows to its view in batches through canFetchMore/fetchMore, so a view asks only for the rows it
+scrolls to, and only those rows are turned into tuples. Image columns return the png bytes under IMAGE_ROLE and
+ImageDelegate decodes and paints them through pixmap_cache(), so an image is decoded only once its row is on screen
+and only once however often it is shown. show_ids shows just the records of a list of ids, such as search hits, in
+their order and with the same batched fetching.
+
+Example:
+    model = RecordModel([Column('Name', text=attrgetter('name'))])
+    view.setModel(model)
+    model.set_records(eq.selected_data_df(parent_id))
+
+https://doc.qt.io/qt-5/model-view-programming.html#fetching-data-incrementally
+"""
+
+__author__ = "William DeShazer"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+from collections import namedtuple
+from typing import Any, Callable, List, Optional
+from pandas import DataFrame
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QSize
+from PyQt5.QtGui import QPixmap
+from PyQt5.QtWidgets import QStyledItemDelegate
+from pixmap_cache import pixmap_cache
+
+FETCH_BATCH = 100  # rows handed to the view per fetchMore
+ID_ROLE = Qt.UserRole  # record id of the row
+IMAGE_ROLE = Qt.UserRole + 1  # png bytes of an image column
+IMAGE_KEY_ROLE = Qt.UserRole + 2  # (table, id, compiled_at) of the image
+IMAGE_MARGIN = 2
+IMAGE_ROW_HEIGHT = 40  # height image cells ask for, whatever their image
+
+# text, image and key take the row as a namedtuple with the record id in Index. key gives (table, id, compiled_at) of
+# the image for the pixmap cache
+Column = namedtuple('Column', ['header', 'text', 'image', 'key'], defaults=(None, None, None))
+
+
+class RecordModel(QAbstractTableModel):
+    """Records of a DataFrame indexed by record id, one row each, in the frame's order"""
+
+    def __init__(self, columns: List[Column], prefetch: Optional[Callable[[List[int]], Any]] = None,
+                 lookup: Optional[Callable[[List[int]], DataFrame]] = None, batch: int = FETCH_BATCH, parent=None):
+        """prefetch is called with the ids of every batch before it is shown, to load its images in one go. lookup
+           gives the records of ids, in that order, for show_ids. Without it show_ids picks from the records set"""
+        super().__init__(parent)
+        self.columns = columns
+        self.prefetch = prefetch
+        self.lookup = lookup
+        self.batch = batch
+        self.all_records: Optional[DataFrame] = None  # what set_records was given
+        self.shown_ids: Optional[List[int]] = None  # ids of a search being shown instead of all_records
+        self.records: Optional[DataFrame] = None  # the frame being shown
+        self.rows: List[tuple] = []  # the fetched rows, the rest of records is only converted when scrolled to
+
+    def _show(self, records: Optional[DataFrame]):
+        self.beginResetModel()
+        self.records = records
+        self.rows = []
+        self.endResetModel()
+        if self.canFetchMore():
+            self.fetchMore()
+
+    def _records_for(self, ids: List[int]) -> DataFrame:
+        if self.lookup is not None:
+            return self.lookup(ids)
+        return self.all_records.loc[[an_id for an_id in ids if an_id in self.all_records.index]]
+
+    def set_records(self, records: Optional[DataFrame]):
+        """Show records, starting over with the first batch"""
+        self.all_records = records
+        self.shown_ids = None
+        self._show(records)
+
+    def show_ids(self, ids: List[int]):
+        """Show only the records of ids, in that order, such as the hits of a search. Rows are still fetched in
+           batches, and only ids with a record are shown"""
+        self.shown_ids = [int(an_id) for an_id in ids]
+        self._show(None if self.lookup is None and self.all_records is None else self._records_for(self.shown_ids))
+
+    def show_all(self):
+        """Show all the records set again after show_ids"""
+        if self.shown_ids is not None:
+            self.shown_ids = None
+            self._show(self.all_records)
+
+    def update_records(self, records: Optional[DataFrame]):
+        """Show changed records. When the ids are the same rows the view keeps its selection and scroll position"""
+        if self.shown_ids is not None and records is not None:
+            self.all_records = records
+            records = self._records_for(self.shown_ids)
+        else:
+            self.all_records = records
+            self.shown_ids = None
+
+        if self.records is None or records is None or not self.records.index.equals(records.index):
+            self._show(records)
+            return
+
+        self.records = records
+        self.rows = list(records.iloc[:len(self.rows)].itertuples())
+        if self.rows:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.rows) - 1, len(self.columns) - 1))
+
+    def clear(self):
+        """Show nothing"""
+        self.set_records(None)
+
+    def record(self, row: int) -> tuple:
+        """Row as a namedtuple with the record id in Index"""
+        return self.rows[row]
+
+    def record_id(self, row: int) -> int:
+        """Record id of row"""
+        return int(self.rows[row].Index)
+
+    def fetch_all(self):
+        """Fetch every remaining row, for callers that have to walk all of them"""
+        while self.canFetchMore():
+            self.fetchMore()
+
+    # pylint: disable=invalid-name
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        """Rows fetched so far"""
+        return 0 if parent.isValid() else len(self.rows)
+
+    # pylint: disable=invalid-name
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        """One column per Column"""
+        return 0 if parent.isValid() else len(self.columns)
+
+    # pylint: disable=invalid-name
+    def canFetchMore(self, parent: QModelIndex = QModelIndex()) -> bool:
+        """True while records has rows the view hasn't been given"""
+        return not parent.isValid() and self.records is not None and len(self.rows) < len(self.records)
+
+    # pylint: disable=invalid-name
+    def fetchMore(self, parent: QModelIndex = QModelIndex()):
+        """Hand the view the next batch of rows"""
+        if not self.canFetchMore(parent):
+            return
+
+        start = len(self.rows)
+        new_rows = list(self.records.iloc[start:start + self.batch].itertuples())
+        if self.prefetch is not None:
+            self.prefetch([int(row.Index) for row in new_rows])
+
+        self.beginInsertRows(QModelIndex(), start, start + len(new_rows) - 1)
+        self.rows.extend(new_rows)
+        self.endInsertRows()
+
+    # pylint: disable=invalid-name
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole):
+        """Column headers"""
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal and section < len(self.columns):
+            return self.columns[section].header
+        return None
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        """Text, id, image or image key of a cell"""
+        if not index.isValid() or index.row() >= len(self.rows):
+            return None
+
+        row = self.rows[index.row()]
+        column = self.columns[index.column()]
+
+        if role == Qt.DisplayRole:
+            return None if column.text is None else column.text(row)
+        if role == ID_ROLE:
+            return int(row.Index)
+        if role == IMAGE_ROLE and column.image is not None:
+            return column.image(row)
+        if role == IMAGE_KEY_ROLE and column.image is not None:
+            return None if column.key is None else column.key(row)
+        return None
+
+
+class ImageDelegate(QStyledItemDelegate):
+    """Paints the png of an image column. A pixmap is decoded the first time its cell is painted and then kept in
+       pixmap_cache() under the column's image key"""
+
+    def __init__(self, parent=None, row_height: int = IMAGE_ROW_HEIGHT):
+        super().__init__(parent)
+        self.row_height = row_height
+
+    def pixmap(self, index: QModelIndex) -> Optional[QPixmap]:
+        """Decoded image of the cell, None when it has none"""
+        key = index.data(IMAGE_KEY_ROLE)
+        if key is not None:
+            return pixmap_cache().pixmap(*key, lambda: index.data(IMAGE_ROLE))
+
+        image = index.data(IMAGE_ROLE)
+        pixmap = QPixmap()
+        if image is None or not pixmap.loadFromData(image):
+            return None
+        return pixmap
+
+    def paint(self, painter, option, index: QModelIndex):
+        """Selection and focus as usual, then the image at the left of the cell"""
+        super().paint(painter, option, index)
+        pixmap = self.pixmap(index)
+        if pixmap is not None:
+            rect = option.rect.adjusted(IMAGE_MARGIN, IMAGE_MARGIN, -IMAGE_MARGIN, -IMAGE_MARGIN)
+            top = rect.top() + max(0, (rect.height() - pixmap.height()) // 2)
+            painter.save()
+            painter.setClipRect(rect)
+            painter.drawPixmap(rect.left(), top, pixmap)
+            painter.restore()
+
+    # pylint: disable=invalid-name
+    def sizeHint(self, option, index: QModelIndex) -> QSize:
+        """The usual hint at row_height, so sizing rows to their contents never decodes an image"""
+        size = super().sizeHint(option, index)
+        size.setHeight(self.row_height)
+        return size
@@ -8,7 +8,6 @@ __license__ = "MIT"
 
 from typing import Optional, List
 from PyQt5.uic import loadUi  # noqa
-from PyQt5.QtGui import QPixmap, QImage
 from PyQt5.QtWidgets import (
     QWidget, QApplication, QTextEdit, QListWidget,
     QLineEdit, QComboBox, QPushButton, QLabel
@@ -17,6 +16,7 @@ from CustomWidgets.latex_widget import LatexWidget
 from equations import EquationRecords
 from variables import GroupedVariableRecord
 from unit import UnitRecord
+from pixmap_cache import pixmap_cache
 
 
 class VariableDetails(QWidget):
@@ -48,8 +48,9 @@ class VariableDetails(QWidget):
                  equations: Optional[EquationRecords] = None):
         """Populate Widgets based on Record Information"""
         self.name_l_edit.setText(record.name)
-        img = QImage.fromData(unit.image)
-        self.unit_image_lbl.setPixmap(QPixmap.fromImage(img))
+        pixmap = pixmap_cache().pixmap('unit', unit.Index, unit.compiled_at, unit.image)
+        if pixmap is not None:
+            self.unit_image_lbl.setPixmap(pixmap)
         self.dimension_l_edit.setText(str(record.dimensions))
         self.notes_text_edit.setText(record.notes)
         self.variable_type_c_box.setCurrentText(record.type_name)
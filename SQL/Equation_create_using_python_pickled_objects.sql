@@ -261,12 +261,13 @@ CREATE OR REPLACE FUNCTION trigger_insertion_order_eqn() RETURNS TRIGGER
     LANGUAGE plpgsql
     AS $$
     DECLARE
-        the_count integer;
+        the_last bigint;
     BEGIN
+        -- Keys are sparse, 1024 apart, so a row can later be moved between two others without renumbering
         if new.insertion_order is NULL then
-            SELECT INTO the_count COUNT(equation_id) FROM equation_eqn_group WHERE eqn_group_id = new.eqn_group_id;
-            new.insertion_order = the_count + 1;
-            new.insertion_order_prev := the_count + 1;
+            SELECT INTO the_last COALESCE(MAX(insertion_order), 0) FROM equation_eqn_group WHERE eqn_group_id = new.eqn_group_id;
+            new.insertion_order = the_last + 1024;
+            new.insertion_order_prev := the_last + 1024;
         end if;
         RETURN new;
     END;
@@ -281,12 +282,13 @@ CREATE OR REPLACE FUNCTION trigger_insertion_order_var() RETURNS TRIGGER
     LANGUAGE plpgsql
     AS $$
     DECLARE
-        the_count integer;
+        the_last bigint;
     BEGIN
+        -- Keys are sparse, 1024 apart, so a row can later be moved between two others without renumbering
         if new.insertion_order is NULL then
-            SELECT INTO the_count COUNT(variable_id) FROM variable_equation WHERE equation_id = new.equation_id;
-            new.insertion_order = the_count + 1;
-            new.insertion_order_prev := the_count + 1;
+            SELECT INTO the_last COALESCE(MAX(insertion_order), 0) FROM variable_equation WHERE equation_id = new.equation_id;
+            new.insertion_order = the_last + 1024;
+            new.insertion_order_prev := the_last + 1024;
         end if;
         RETURN new;
     END;
@@ -31,6 +31,8 @@ CREATE TABLE schema_templates.latex_object(
     latex TEXT NOT NULL,
     notes text, -- For a more detailed description
     image BYTEA DEFAULT NULL,
+    thumbnail BYTEA DEFAULT NULL, -- image scaled down for lists and tables
+    svg BYTEA DEFAULT NULL, -- gzip compressed SVG of the same render, kept when EQ_DB_SVG is set
     template_id INT,
     image_is_dirty BOOL DEFAULT FALSE, -- Image load inconsistent with last latex load
     created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
@@ -267,12 +269,13 @@ CREATE OR REPLACE FUNCTION trigger_insertion_order_eqn() RETURNS TRIGGER
     LANGUAGE plpgsql
     AS $$
     DECLARE
-        the_count integer;
+        the_last bigint;
     BEGIN
+        -- Keys are sparse, 1024 apart, so a row can later be moved between two others without renumbering
         if new.insertion_order is NULL then
-            SELECT INTO the_count COUNT(*) FROM equation_eqn_group WHERE eqn_group_id = new.eqn_group_id;
-            new.insertion_order = the_count + 1;
-            new.insertion_order_prev := the_count + 1;
+            SELECT INTO the_last COALESCE(MAX(insertion_order), 0) FROM equation_eqn_group WHERE eqn_group_id = new.eqn_group_id;
+            new.insertion_order = the_last + 1024;
+            new.insertion_order_prev := the_last + 1024;
         end if;
         RETURN new;
     END;
@@ -287,12 +290,13 @@ CREATE OR REPLACE FUNCTION trigger_insertion_order_var() RETURNS TRIGGER
     LANGUAGE plpgsql
     AS $$
     DECLARE
-        the_count integer;
+        the_last bigint;
     BEGIN
+        -- Keys are sparse, 1024 apart, so a row can later be moved between two others without renumbering
         if new.insertion_order is NULL then
-            SELECT INTO the_count COUNT(variable_id) FROM variable_equation WHERE equation_id = new.equation_id;
-            new.insertion_order = the_count + 1;
-            new.insertion_order_prev := the_count + 1;
+            SELECT INTO the_last COALESCE(MAX(insertion_order), 0) FROM variable_equation WHERE equation_id = new.equation_id;
+            new.insertion_order = the_last + 1024;
+            new.insertion_order_prev := the_last + 1024;
         end if;
         RETURN new;
     END;
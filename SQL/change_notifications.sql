@@ -0,0 +1,66 @@
+-- Announce every change to the shared tables on the eq_db_changes channel, so each client can refresh just the rows
+-- another client touched. The payload is a small json object:
+--     {"table": "equation", "op": "UPDATE", "id": 42, "pid": 12345}
+-- id is the primary key of the row, for the join tables it is the id of the child record. pid is the backend that
+-- made the change, which lets a client skip its own writes. Safe to run more than once.
+
+CREATE OR REPLACE FUNCTION notify_change() RETURNS TRIGGER
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        a_row jsonb;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            a_row := to_jsonb(old);
+        ELSE
+            a_row := to_jsonb(new);
+        END IF;
+
+        PERFORM pg_notify('eq_db_changes',
+                          json_build_object('table', TG_TABLE_NAME, 'op', TG_OP, 'id', a_row -> TG_ARGV[0],
+                                            'pid', pg_backend_pid())::text);
+        RETURN NULL;
+    END;
+    $$;
+
+DROP TRIGGER IF EXISTS notify_equation_change ON equation;
+CREATE TRIGGER notify_equation_change
+    AFTER INSERT OR UPDATE OR DELETE ON equation
+    FOR EACH ROW
+    EXECUTE PROCEDURE notify_change('equation_id');
+
+DROP TRIGGER IF EXISTS notify_variable_change ON variable;
+CREATE TRIGGER notify_variable_change
+    AFTER INSERT OR UPDATE OR DELETE ON variable
+    FOR EACH ROW
+    EXECUTE PROCEDURE notify_change('variable_id');
+
+DROP TRIGGER IF EXISTS notify_unit_change ON unit;
+CREATE TRIGGER notify_unit_change
+    AFTER INSERT OR UPDATE OR DELETE ON unit
+    FOR EACH ROW
+    EXECUTE PROCEDURE notify_change('unit_id');
+
+DROP TRIGGER IF EXISTS notify_eqn_group_change ON eqn_group;
+CREATE TRIGGER notify_eqn_group_change
+    AFTER INSERT OR UPDATE OR DELETE ON eqn_group
+    FOR EACH ROW
+    EXECUTE PROCEDURE notify_change('eqn_group_id');
+
+DROP TRIGGER IF EXISTS notify_template_change ON template;
+CREATE TRIGGER notify_template_change
+    AFTER INSERT OR UPDATE OR DELETE ON template
+    FOR EACH ROW
+    EXECUTE PROCEDURE notify_change('id');
+
+DROP TRIGGER IF EXISTS notify_equation_eqn_group_change ON equation_eqn_group;
+CREATE TRIGGER notify_equation_eqn_group_change
+    AFTER INSERT OR UPDATE OR DELETE ON equation_eqn_group
+    FOR EACH ROW
+    EXECUTE PROCEDURE notify_change('equation_id');
+
+DROP TRIGGER IF EXISTS notify_variable_equation_change ON variable_equation;
+CREATE TRIGGER notify_variable_equation_change
+    AFTER INSERT OR UPDATE OR DELETE ON variable_equation
+    FOR EACH ROW
+    EXECUTE PROCEDURE notify_change('variable_id');
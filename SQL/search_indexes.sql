@@ -0,0 +1,31 @@
+-- Full-text and trigram indexes behind search.py. Equations, variables and units are searched over name, notes and
+-- the words of their LaTeX, so \frac{\partial \rho}{\partial t} is found by "partial rho". Ranking uses the full-text
+-- match first and name similarity second. The indexes are on expressions, so no column is added and SELECT * stays
+-- as it was. Safe to run more than once.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- LaTeX reduced to its words and numbers: control sequences lose their backslash, everything else is a separator
+CREATE OR REPLACE FUNCTION eq_db_latex_words(latex text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$
+    SELECT regexp_replace(coalesce(latex, ''), '[^[:alnum:]]+', ' ', 'g');
+    $$;
+
+-- Names weigh most, then notes, then the LaTeX. The simple configuration keeps symbols like rho unstemmed
+CREATE OR REPLACE FUNCTION eq_db_search_vector(name text, notes text, latex text) RETURNS tsvector
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$
+    SELECT setweight(to_tsvector('simple'::regconfig, coalesce(name, '')), 'A') ||
+           setweight(to_tsvector('simple'::regconfig, coalesce(notes, '')), 'B') ||
+           setweight(to_tsvector('simple'::regconfig, eq_db_latex_words(latex)), 'C');
+    $$;
+
+CREATE INDEX IF NOT EXISTS equation_search ON equation USING GIN (eq_db_search_vector(name, notes, latex));
+CREATE INDEX IF NOT EXISTS equation_name_trgm ON equation USING GIN (name gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS variable_search ON variable USING GIN (eq_db_search_vector(name, notes, latex));
+CREATE INDEX IF NOT EXISTS variable_name_trgm ON variable USING GIN (name gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS unit_search ON unit USING GIN (eq_db_search_vector(name, notes, latex));
+CREATE INDEX IF NOT EXISTS unit_name_trgm ON unit USING GIN (name gin_trgm_ops);
@@ -0,0 +1,49 @@
+-- Move an existing database to sparse insertion_order keys.
+-- Rows get keys 1024 apart within their group, so a move or an insert only rewrites the row being placed.
+-- The create scripts already set up new databases this way.
+
+CREATE OR REPLACE FUNCTION trigger_insertion_order_eqn() RETURNS TRIGGER
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        the_last bigint;
+    BEGIN
+        -- Keys are sparse, 1024 apart, so a row can later be moved between two others without renumbering
+        if new.insertion_order is NULL then
+            SELECT INTO the_last COALESCE(MAX(insertion_order), 0) FROM equation_eqn_group WHERE eqn_group_id = new.eqn_group_id;
+            new.insertion_order = the_last + 1024;
+            new.insertion_order_prev := the_last + 1024;
+        end if;
+        RETURN new;
+    END;
+    $$;
+
+CREATE OR REPLACE FUNCTION trigger_insertion_order_var() RETURNS TRIGGER
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        the_last bigint;
+    BEGIN
+        -- Keys are sparse, 1024 apart, so a row can later be moved between two others without renumbering
+        if new.insertion_order is NULL then
+            SELECT INTO the_last COALESCE(MAX(insertion_order), 0) FROM variable_equation WHERE equation_id = new.equation_id;
+            new.insertion_order = the_last + 1024;
+            new.insertion_order_prev := the_last + 1024;
+        end if;
+        RETURN new;
+    END;
+    $$;
+
+UPDATE equation_eqn_group SET insertion_order = data.insertion_order
+    FROM (SELECT equation_id, eqn_group_id,
+                 1024 * row_number() OVER (PARTITION BY eqn_group_id
+                                           ORDER BY insertion_order NULLS LAST, insertion_date) AS insertion_order
+          FROM equation_eqn_group) AS data
+    WHERE (equation_eqn_group.equation_id, equation_eqn_group.eqn_group_id) = (data.equation_id, data.eqn_group_id);
+
+UPDATE variable_equation SET insertion_order = data.insertion_order
+    FROM (SELECT variable_id, equation_id,
+                 1024 * row_number() OVER (PARTITION BY equation_id
+                                           ORDER BY insertion_order NULLS LAST, insertion_date) AS insertion_order
+          FROM variable_equation) AS data
+    WHERE (variable_equation.variable_id, variable_equation.equation_id) = (data.variable_id, data.equation_id);
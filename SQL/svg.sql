@@ -0,0 +1,10 @@
+-- Add the svg column to an existing database, for keeping every render as gzip compressed SVG next to the png.
+-- Run this before setting EQ_DB_SVG. The create scripts already set up new databases this way. Safe to run more
+-- than once. Renders stored before get their SVG the next time they are recompiled.
+
+ALTER TABLE schema_templates.latex_object ADD COLUMN IF NOT EXISTS svg BYTEA DEFAULT NULL;
+ALTER TABLE schema_templates.physics_object ADD COLUMN IF NOT EXISTS svg BYTEA DEFAULT NULL;
+
+ALTER TABLE equation ADD COLUMN IF NOT EXISTS svg BYTEA DEFAULT NULL;
+ALTER TABLE variable ADD COLUMN IF NOT EXISTS svg BYTEA DEFAULT NULL;
+ALTER TABLE unit ADD COLUMN IF NOT EXISTS svg BYTEA DEFAULT NULL;
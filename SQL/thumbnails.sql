@@ -0,0 +1,11 @@
+-- Add the thumbnail column to an existing database. Lists and tables read thumbnails instead of the full renders.
+-- The create scripts already set up new databases this way. Safe to run more than once.
+-- Rows stored before this read their full image in place of the thumbnail until it is made from the stored image:
+--     python -c "from image_store import backfill_thumbnails; [backfill_thumbnails(t) for t in ('equation', 'variable', 'unit')]"
+
+ALTER TABLE schema_templates.latex_object ADD COLUMN IF NOT EXISTS thumbnail BYTEA DEFAULT NULL;
+ALTER TABLE schema_templates.physics_object ADD COLUMN IF NOT EXISTS thumbnail BYTEA DEFAULT NULL;
+
+ALTER TABLE equation ADD COLUMN IF NOT EXISTS thumbnail BYTEA DEFAULT NULL;
+ALTER TABLE variable ADD COLUMN IF NOT EXISTS thumbnail BYTEA DEFAULT NULL;
+ALTER TABLE unit ADD COLUMN IF NOT EXISTS thumbnail BYTEA DEFAULT NULL;
@@ -0,0 +1,413 @@
+"""
+Benchmark the data and render layers against a throwaway schema filled with synthetic data.
+
+The schema is built from SQL/Equation_create_using_table_templates.sql with the schema names rewritten, so it sits
+next to the real tables in the same database and is dropped again afterwards. Every connection of the run gets the
+bench schema as its search_path, which points the unchanged data stores at it. LaTeX is replaced by a stub renderer
+that returns a fixed image (after an optional delay), so a run needs no TeX installation and measures our own code
+rather than xelatex.
+
+Each scenario is repeated and timed, and the results are written as JSON so runs of different versions can be
+compared.
+
+Example:
+    python benchmark.py --groups 20 --equations 2000 --variables 5000 --repeat 5 --output bench.json
+
+https://www.postgresql.org/docs/current/ddl-schemas.html#DDL-SCHEMAS-PATH
+"""
+
+__author__ = "William DeShazer"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import re
+import json
+import zlib
+import struct
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+from time import perf_counter, sleep
+from pathlib import Path
+from datetime import datetime
+from statistics import mean, median
+from functools import partial
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+from psycopg2 import connect
+from psycopg2.extras import execute_values
+import db_pool as db_pool_module
+import render_cache as render_cache_module
+import render_farm as render_farm_module
+import latex_data
+from config import config
+from db_pool import ConnectionPool
+from render_cache import RenderCache
+from render_farm import RenderFarm
+from rasterize import PNG
+from latex_data import LatexData
+from template import forget_template_data
+from image_store import image_store, THUMBNAIL
+from startup_loader import start_loading
+from equation_group import EquationGroup
+from equations import GroupedEquations
+from variables import GroupedVariables
+from unit import Unit
+
+ROOT = Path(__file__).resolve().parent
+CREATE_SCRIPT = ROOT / 'SQL' / 'Equation_create_using_table_templates.sql'
+TEMPLATE_FILE = ROOT / 'LaTeX' / 'eq_template.tex'
+DEFAULT_SCHEMA = 'eq_db_bench'
+BENCH_FORMAT = 1
+CREATED_BY = 'benchmark'
+# The create script loads the template with pg_read_file from a fixed path, the bench inserts it itself
+TEMPLATE_BLOCK = re.compile(r'^do \$\$\s*DECLARE.*?pg_read_file.*?\$\$;', re.IGNORECASE | re.MULTILINE | re.DOTALL)
+PUBLIC_SCHEMA = re.compile(r'\bSCHEMA\s+(IF\s+EXISTS\s+)?public\b', re.IGNORECASE)
+SCHEMA_NAME = re.compile(r'^[a-z_][a-z0-9_]*$')
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+
+# A valid 1x1 grey png, what the stub renderer returns for every pattern
+STUB_PNG = b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 0, 0, 0, 0)) + \
+    _png_chunk(b'IDAT', zlib.compress(b'\x00\x80')) + _png_chunk(b'IEND', b'')
+
+
+def bench_params(schema: str = DEFAULT_SCHEMA, db_params: Optional[dict] = None) -> dict:
+    """Connection parameters that resolve unqualified table names in the bench schema"""
+    if SCHEMA_NAME.match(schema) is None:
+        raise ValueError('Not a plain schema name: ' + schema)
+    db_params = config() if db_params is None else db_params
+    return dict(db_params, options='-c search_path={0},{0}_templates'.format(schema))
+
+
+def bench_schema_sql(schema: str = DEFAULT_SCHEMA) -> str:
+    """The create script rewritten to build schema and schema_templates instead of public and schema_templates"""
+    if SCHEMA_NAME.match(schema) is None or schema == 'public':
+        raise ValueError('Not a usable bench schema name: ' + schema)
+
+    script = CREATE_SCRIPT.read_text()
+    script = TEMPLATE_BLOCK.sub('', script)
+    script = script.replace('schema_templates', schema + '_templates')
+    script = PUBLIC_SCHEMA.sub(lambda match: 'SCHEMA ' + (match.group(1) or '') + schema, script)
+
+    # The original drops public, make sure none of that survived the rewrite
+    if PUBLIC_SCHEMA.search(script) is not None:
+        raise ValueError('Create script still touches the public schema')
+    return script
+
+
+def create_bench_schema(schema: str = DEFAULT_SCHEMA, db_params: Optional[dict] = None) -> int:
+    """Build an empty bench schema, replacing any left from an earlier run. Returns the template id"""
+    conn = connect(**bench_params(schema, db_params))
+    try:
+        cur = conn.cursor()
+        cur.execute(bench_schema_sql(schema))
+        cur.execute('INSERT INTO template (data, created_by) VALUES (%s, %s) RETURNING id',
+                    (TEMPLATE_FILE.read_text(), CREATED_BY))
+        template_id = cur.fetchone()[0]
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    return template_id
+
+
+def drop_bench_schema(schema: str = DEFAULT_SCHEMA, db_params: Optional[dict] = None):
+    """Remove the bench schema and its templates schema"""
+    conn = connect(**bench_params(schema, db_params))
+    try:
+        cur = conn.cursor()
+        cur.execute('DROP SCHEMA IF EXISTS {0} CASCADE; DROP SCHEMA IF EXISTS {0}_templates CASCADE'.format(schema))
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+
+
+def populate(template_id: int, groups: int = 10, equations: int = 500, variables: int = 1000, seed: int = 0,
+             schema: str = DEFAULT_SCHEMA, db_params: Optional[dict] = None) -> dict:
+    """Fill the bench schema with synthetic groups, equations and variables. Every equation is in one group and
+       one in ten in a second, every variable is in one to three equations. The same seed gives the same data"""
+    rng = random.Random(seed)
+    conn = connect(**bench_params(schema, db_params))
+    try:
+        cur = conn.cursor()
+        group_ids = [row[0] for row in execute_values(
+            cur, 'INSERT INTO eqn_group (name, notes, created_by) VALUES %s RETURNING eqn_group_id',
+            [('Group {:d}'.format(i), 'Synthetic group', CREATED_BY) for i in range(groups)], fetch=True)]
+
+        equation_ids = [row[0] for row in execute_values(
+            cur, 'INSERT INTO equation (name, latex, template_id, image, thumbnail, type_name, unit_id, created_by) '
+                 'VALUES %s RETURNING equation_id',
+            [('Equation {:d}'.format(i),
+              r'x_{{{0:d}}} = \frac{{a_{{{0:d}}}}}{{b + {1:d}}}'.format(i, rng.randrange(99)),
+              template_id, STUB_PNG, STUB_PNG, 'Unassigned', rng.randint(1, 3), CREATED_BY) for i in range(equations)],
+            fetch=True, page_size=1000)]
+
+        memberships = []
+        for i, equation_id in enumerate(equation_ids):
+            memberships.append((equation_id, group_ids[i % groups]))
+            if groups > 1 and rng.random() < 0.1:
+                memberships.append((equation_id, group_ids[(i + rng.randrange(1, groups)) % groups]))
+        execute_values(cur, 'INSERT INTO equation_eqn_group (equation_id, eqn_group_id, inserted_by) VALUES %s',
+                       [membership + (CREATED_BY,) for membership in memberships], page_size=1000)
+
+        variable_ids = [row[0] for row in execute_values(
+            cur, 'INSERT INTO variable (name, latex, template_id, image, thumbnail, type_name, unit_id, created_by) '
+                 'VALUES %s RETURNING variable_id',
+            [('Variable {:d}'.format(i), r'v_{{{:d}}}'.format(i), template_id, STUB_PNG, STUB_PNG, 'Constant',
+              rng.randint(1, 3), CREATED_BY) for i in range(variables)],
+            fetch=True, page_size=1000)]
+
+        uses = sorted({(variable_id, equation_id) for variable_id in variable_ids
+                       for equation_id in rng.sample(equation_ids, min(len(equation_ids), rng.randint(1, 3)))})
+        execute_values(cur, 'INSERT INTO variable_equation (variable_id, equation_id, inserted_by) VALUES %s',
+                       [use + (CREATED_BY,) for use in uses], page_size=1000)
+
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+
+    return dict(groups=len(group_ids), equations=len(equation_ids), equation_memberships=len(memberships),
+                variables=len(variable_ids), variable_uses=len(uses))
+
+
+class StubRenderFarm(RenderFarm):
+    """Render farm that answers every compile with STUB_PNG after delay seconds, without any worker process"""
+
+    def __init__(self, delay: float = 0.0):
+        super().__init__(max_workers=1, use_cache=False)
+        self.delay = delay
+
+    def submit(self, pattern: str, a_template: str, output: str = PNG) -> Future:
+        future: Future = Future()
+        future.set_result(stub_render(pattern, a_template, delay=self.delay))
+        return future
+
+
+def stub_render(pattern: str, a_template: str, delay: float = 0.0, **_) -> bytes:
+    """Stand-in for render_farm.render"""
+    if delay > 0:
+        sleep(delay)
+    return STUB_PNG
+
+
+def stub_render_pages(patterns: List[str], a_template: str, delay: float = 0.0, **_) -> List[bytes]:
+    """Stand-in for render_farm.render_pages. One run for the whole document, like xelatex"""
+    if delay > 0:
+        sleep(delay)
+    return [STUB_PNG] * len(patterns)
+
+
+@contextmanager
+def stub_rendering(delay: float = 0.0):
+    """Route every compile to the stub renderer, with a render cache of its own so stub images never reach the real
+       one"""
+    saved = (latex_data.render, latex_data.render_pages, render_farm_module._RENDER_FARM,
+             render_cache_module._RENDER_CACHE)
+
+    with tempfile.TemporaryDirectory(prefix='eq_db_bench_') as cache_dir:
+        latex_data.render = partial(stub_render, delay=delay)
+        latex_data.render_pages = partial(stub_render_pages, delay=delay)
+        render_farm_module._RENDER_FARM = StubRenderFarm(delay=delay)
+        render_cache_module._RENDER_CACHE = RenderCache(cache_dir=Path(cache_dir))
+        try:
+            yield
+        finally:
+            latex_data.render, latex_data.render_pages, render_farm_module._RENDER_FARM, \
+                render_cache_module._RENDER_CACHE = saved
+
+
+@contextmanager
+def bench_pool(schema: str = DEFAULT_SCHEMA, db_params: Optional[dict] = None):
+    """Make the process wide connection pool point at the bench schema for the length of the block"""
+    saved = db_pool_module._DB_POOL
+    pool = ConnectionPool(db_params=bench_params(schema, db_params))
+    db_pool_module._DB_POOL = pool
+    forget_template_data()
+    try:
+        yield pool
+    finally:
+        pool.closeall()
+        db_pool_module._DB_POOL = saved
+        forget_template_data()
+
+
+class BenchState:
+    """What the scenarios share: the loaded data stores and a seeded random source"""
+
+    def __init__(self, template_id: int, seed: int = 0):
+        self.template_id = template_id
+        self.rng = random.Random(seed)
+        self.eqn_grp: Optional[EquationGroup] = None
+        self.eq: Optional[GroupedEquations] = None
+        self.var: Optional[GroupedVariables] = None
+        self.unit: Optional[Unit] = None
+        self.counter = 0
+
+    def group_ids(self) -> List[int]:
+        """Groups that hold equations"""
+        return sorted({int(parent_id) for parent_id in self.eq.grouped_data.index.get_level_values(0)})
+
+    def any_group(self) -> int:
+        """A random group that holds equations"""
+        return self.rng.choice(self.group_ids())
+
+
+def scenario_startup_load(state: BenchState):
+    """Load the main window's stores from scratch, concurrently, the way the GUI does"""
+    for table_name in ('equation', 'variable'):
+        image_store(table_name).invalidate()
+        image_store(table_name, THUMBNAIL).invalidate()
+
+    loads = start_loading(dict(eqn_grp=EquationGroup, eq=GroupedEquations, var=GroupedVariables, unit=Unit))
+    state.eqn_grp, state.eq, state.var, state.unit = \
+        (loads[name].result() for name in ('eqn_grp', 'eq', 'var', 'unit'))
+
+
+def scenario_group_switch(state: BenchState):
+    """Select a group and fetch the images of its equations"""
+    group_id = state.any_group()
+    state.eq.set_records_for_parent(parent_id=group_id)
+    state.eq.load_images([int(an_id) for an_id in state.eq.selected_data_df(group_id).index])
+
+
+def scenario_insert(state: BenchState):
+    """Add a new equation to a group"""
+    state.counter += 1
+    latex = LatexData(latex=r'y_{{{:d}}} = 1'.format(state.counter), template_id=state.template_id, image=STUB_PNG)
+    state.eq.new_record(parent_id=state.any_group(), name='Bench insert {:d}'.format(state.counter), latex=latex,
+                        created_by=CREATED_BY)
+
+
+def scenario_reorder(state: BenchState):
+    """Move the last equation of a group to the front"""
+    group_id = state.any_group()
+    child_ids = list(state.eq.selected_data_df(group_id).sort_values('insertion_order').index)
+    if len(child_ids) > 1:
+        state.eq.move_record(int(child_ids[-1]), before_id=int(child_ids[0]), parent_id=group_id)
+
+
+def scenario_associate(state: BenchState):
+    """Put a variable into an equation it isn't used in yet"""
+    equation_id = int(state.rng.choice(list(state.eq.all_records.index)))
+    used = set()
+    if equation_id in state.var.grouped_data.index.get_level_values(0):
+        used = {int(an_id) for an_id in state.var.grouped_data.loc[equation_id, :].index}
+    candidates = [int(an_id) for an_id in state.var.all_records.index if int(an_id) not in used]
+    if candidates:
+        state.var.associate_parent(parent_id=equation_id, child_id=state.rng.choice(candidates),
+                                   inserted_by=CREATED_BY)
+
+
+def scenario_bulk_recompile(state: BenchState):
+    """Recompile every equation and write all images back"""
+    state.eq.recompile_images()
+
+
+SCENARIOS: Dict[str, Callable[[BenchState], None]] = dict(
+    startup_load=scenario_startup_load,
+    group_switch=scenario_group_switch,
+    insert=scenario_insert,
+    reorder=scenario_reorder,
+    associate=scenario_associate,
+    bulk_recompile=scenario_bulk_recompile
+)
+
+
+def time_scenario(name: str, state: BenchState, repeat: int = 5) -> dict:
+    """Run one scenario repeat times. Returns its timings in seconds"""
+    times = []
+    for _ in range(repeat):
+        started = perf_counter()
+        SCENARIOS[name](state)
+        times.append(perf_counter() - started)
+    return dict(name=name, repeat=repeat, times=times, min=min(times), median=median(times), mean=mean(times),
+                max=max(times))
+
+
+def git_revision() -> Optional[str]:
+    """Commit the tree was at, None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(groups: int = 10, equations: int = 500, variables: int = 1000, repeat: int = 5,
+                   seed: int = 0, scenarios: Optional[List[str]] = None, render_delay: float = 0.0,
+                   schema: str = DEFAULT_SCHEMA, db_params: Optional[dict] = None, keep: bool = False,
+                   verbose: bool = False) -> dict:
+    """Build and fill the bench schema, time the scenarios and drop the schema again unless keep is set. Returns
+       the results ready to be written as JSON. startup_load always runs first, the others need its stores"""
+    names = list(SCENARIOS) if scenarios is None else ['startup_load'] + [name for name in scenarios
+                                                                          if name != 'startup_load']
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise ValueError('Unknown scenarios: ' + ', '.join(unknown))
+
+    db_params = config() if db_params is None else db_params
+    started_at = datetime.now().isoformat(timespec='seconds')
+
+    template_id = create_bench_schema(schema, db_params)
+    try:
+        rows = populate(template_id, groups=groups, equations=equations, variables=variables, seed=seed,
+                        schema=schema, db_params=db_params)
+        if verbose is True:
+            print('Populated {}: {}'.format(schema, rows))
+
+        results = []
+        state = BenchState(template_id, seed=seed)
+        with bench_pool(schema, db_params) as pool, stub_rendering(delay=render_delay):
+            for name in names:
+                results.append(time_scenario(name, state, repeat=repeat))
+                if verbose is True:
+                    print('{name}: median {median:.4f} s, min {min:.4f} s'.format(**results[-1]))
+            pool_stats = pool.stats()
+    finally:
+        if keep is False:
+            drop_bench_schema(schema, db_params)
+
+    return dict(format=BENCH_FORMAT, version=__version__, revision=git_revision(), started_at=started_at,
+                python=platform.python_version(), platform=platform.platform(),
+                database=dict(host=db_params.get('host'), database=db_params.get('database'), schema=schema),
+                parameters=dict(groups=groups, equations=equations, variables=variables, repeat=repeat, seed=seed,
+                                render_delay=render_delay),
+                rows=rows, pool=pool_stats, scenarios=results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the data and render layers against synthetic data')
+    parser.add_argument("--groups", dest='groups', type=int, help='int: Number of equation groups', default=10)
+    parser.add_argument("--equations", dest='equations', type=int, help='int: Number of equations', default=500)
+    parser.add_argument("--variables", dest='variables', type=int, help='int: Number of variables', default=1000)
+    parser.add_argument("--repeat", dest='repeat', type=int, help='int: Runs of each scenario', default=5)
+    parser.add_argument("--seed", dest='seed', type=int, help='int: Seed for the synthetic data', default=0)
+    parser.add_argument("--scenario", dest='scenarios', action='append', choices=list(SCENARIOS),
+                        help='str: Scenario to run, may be repeated. Every scenario when not given', default=None)
+    parser.add_argument("--render-delay", dest='render_delay', type=float,
+                        help='float: Seconds the stub renderer takes per run', default=0.0)
+    parser.add_argument("--schema", dest='schema', help='str: Throwaway schema to build', default=DEFAULT_SCHEMA)
+    parser.add_argument("--output", dest='output', help='str: JSON file to write, stdout when not given',
+                        default=None)
+    parser.add_argument("--keep", dest='keep', help='Keep the bench schema afterwards', action='store_true')
+    parser.add_argument("--verbose", dest='verbose', help='Output run messages', action='store_true')
+    args = parser.parse_args()
+
+    report = run_benchmarks(groups=args.groups, equations=args.equations, variables=args.variables,
+                            repeat=args.repeat, seed=args.seed, scenarios=args.scenarios,
+                            render_delay=args.render_delay, schema=args.schema, keep=args.keep,
+                            verbose=args.verbose)
+
+    if args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        Path(args.output).write_text(json.dumps(report, indent=2))
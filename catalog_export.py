@@ -0,0 +1,175 @@
+"""
+Export equation groups, with their equations, variables and units, as a single LaTeX document.
+
+The whole walk is one query read through a server side (named) cursor, so rows arrive from the database a batch at a
+time and the document is produced as a generator of text chunks. Memory stays flat however large the database is.
+Equations and variables come out in insertion_order, the same order the GUI shows them in. The preamble is taken
+from the template table so the catalog typesets the patterns the same way the stored images were made.
+
+Example:
+    python catalog_export.py catalog.tex --group 1 --group 3 --compile
+
+Server side cursors: https://www.psycopg.org/docs/usage.html#server-side-cursors
+"""
+
+__author__ = "William DeShazer"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import re
+import argparse
+from pathlib import Path
+from itertools import chain, groupby
+from typing import Iterator, List, Optional, Union
+from psycopg2 import OperationalError
+from query_stats import InstrumentedNamedTupleCursor
+from db_utils import my_connect, db_connection
+from latex_data import template_data
+from render_farm import run_xelatex, pdf_path
+from time_logging import TimeLogger
+
+ITERSIZE = 500  # rows per round trip on the named cursor
+STANDALONE = re.compile(r'\\documentclass(\[[^\]]*\])?\{standalone\}')
+TEXT_SPECIALS = {'\\': r'\textbackslash{}', '&': r'\&', '%': r'\%', '$': r'\$', '#': r'\#', '_': r'\_',
+                 '{': r'\{', '}': r'\}', '~': r'\textasciitilde{}', '^': r'\textasciicircum{}'}
+
+CATALOG_QUERY = '''
+SELECT g.eqn_group_id, g.name AS group_name, g.notes AS group_notes,
+       e.equation_id, e.name AS equation_name, e.latex AS equation_latex, e.notes AS equation_notes,
+       v.variable_id, v.name AS variable_name, v.latex AS variable_latex, u.latex AS unit_latex
+FROM eqn_group g
+    JOIN equation_eqn_group eg USING (eqn_group_id)
+    JOIN equation e USING (equation_id)
+    LEFT JOIN variable_equation ve ON ve.equation_id = e.equation_id
+    LEFT JOIN variable v ON v.variable_id = ve.variable_id
+    LEFT JOIN unit u ON u.unit_id = v.unit_id
+WHERE %(all_groups)s OR g.eqn_group_id = ANY(%(group_ids)s)
+ORDER BY g.eqn_group_id, eg.insertion_order, e.created_at, e.equation_id, ve.insertion_order, v.created_at
+'''
+
+
+def escape_text(text: Optional[str]) -> str:
+    """Make a name or a note safe to typeset as text"""
+    if text is None:
+        return ''
+    return ''.join(TEXT_SPECIALS.get(char, char) for char in text)
+
+
+def catalog_template(template_id: Optional[int] = None, my_conn: Optional[dict] = None,
+                     t_log: Optional[TimeLogger] = None, verbose: bool = False) -> List[str]:
+    """Head and tail of the catalog document. The equation template is a standalone class, which is switched to
+       article so the catalog can break across pages"""
+    a_template = template_data(version=template_id, my_conn=my_conn, t_log=t_log, verbose=verbose)
+    a_template = STANDALONE.sub(lambda match: '\\documentclass{article}', a_template, count=1)
+    head, _, tail = a_template.partition('%__REPLACEMENT__TEXT')
+    return [head, tail]
+
+
+def iter_catalog(group_ids: Optional[List[int]] = None, template_id: Optional[int] = None,
+                 my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
+                 verbose: bool = False) -> Iterator[str]:
+    """Yield the catalog for the listed groups, or for every group, as LaTeX text chunks"""
+    if verbose is True and t_log is None:
+        t_log = TimeLogger()
+
+    my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
+    head, tail = catalog_template(template_id=template_id, my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    yield head
+
+    with db_connection(my_conn) as conn:
+        # A named cursor keeps the result set on the server and fetches ITERSIZE rows at a time
+        cur = conn.cursor(name='eq_db_catalog', cursor_factory=InstrumentedNamedTupleCursor)
+        cur.itersize = ITERSIZE
+
+        try:
+            cur.execute(CATALOG_QUERY, dict(all_groups=group_ids is None,
+                                            group_ids=[] if group_ids is None else [int(an_id) for an_id in group_ids]))
+        except OperationalError as error:
+            print(error)
+            cur.close()
+            yield tail
+            return
+
+        if verbose is True:
+            t_log.new_event('Streaming catalog')
+
+        for _, group_rows in groupby(cur, key=lambda row: row.eqn_group_id):
+            group_rows = iter(group_rows)
+            first = next(group_rows)
+            chunk = ['\\section{' + escape_text(first.group_name) + '}\n']
+            if first.group_notes:
+                chunk.append(escape_text(first.group_notes) + '\n')
+            yield ''.join(chunk)
+
+            for _, equation_rows in groupby(chain([first], group_rows), key=lambda row: row.equation_id):
+                yield _equation_chunk(list(equation_rows))
+
+        cur.close()
+
+    if verbose is True:
+        t_log.new_event('Finished streaming catalog')
+
+    yield tail
+
+
+def _equation_chunk(rows: list) -> str:
+    equation = rows[0]
+    chunk = ['\\subsection*{' + escape_text(equation.equation_name) + '}\n',
+             '\\begin{equation*}\n' + equation.equation_latex + '\n\\end{equation*}\n']
+    if equation.equation_notes:
+        chunk.append(escape_text(equation.equation_notes) + '\n')
+
+    variables = [row for row in rows if row.variable_id is not None]
+    if variables:
+        chunk.append('\\begin{itemize}\n')
+        for row in variables:
+            unit = ' [$' + row.unit_latex + '$]' if row.unit_latex else ''
+            chunk.append('\\item $' + row.variable_latex + '$ ' + escape_text(row.variable_name) + unit + '\n')
+        chunk.append('\\end{itemize}\n')
+
+    return ''.join(chunk)
+
+
+def write_catalog(path: Union[str, Path], group_ids: Optional[List[int]] = None, template_id: Optional[int] = None,
+                  my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None, verbose: bool = False) -> Path:
+    """Write the catalog to a .tex file as it streams in"""
+    path = Path(path)
+    with open(path, 'w', encoding='utf-8') as tex_file:
+        for chunk in iter_catalog(group_ids=group_ids, template_id=template_id, my_conn=my_conn, t_log=t_log,
+                                  verbose=verbose):
+            tex_file.write(chunk)
+    return path
+
+
+def compile_catalog(path: Union[str, Path], verbose: bool = False) -> Path:
+    """Typeset a written catalog once. Returns the PDF path"""
+    path = Path(path).resolve()
+    run_xelatex(path.stem, path.parent, verbose=verbose)
+    return pdf_path(path.stem, path.parent)
+
+
+def export_catalog(path: Union[str, Path], group_ids: Optional[List[int]] = None, template_id: Optional[int] = None,
+                   my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None, verbose: bool = False) -> Path:
+    """Write and compile the catalog. Returns the PDF path"""
+    path = write_catalog(path, group_ids=group_ids, template_id=template_id, my_conn=my_conn, t_log=t_log,
+                         verbose=verbose)
+    return compile_catalog(path, verbose=verbose)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export equation groups as a LaTeX catalog')
+    parser.add_argument("tex_file", help='str: Catalog file to write')
+    parser.add_argument("--group", dest='groups', type=int, action='append',
+                        help='int: Equation group to export, may be repeated. Every group when not given',
+                        default=None)
+    parser.add_argument("--template", dest='template', type=int, help='int: Template id, latest when not given',
+                        default=None)
+    parser.add_argument("--compile", dest='compile', help='Compile the catalog to PDF', action='store_true')
+    parser.add_argument("--verbose", dest='verbose', help='Output run messages', action='store_true')
+    args = parser.parse_args()
+
+    if args.compile is True:
+        print(export_catalog(args.tex_file, group_ids=args.groups, template_id=args.template, verbose=args.verbose))
+    else:
+        print(write_catalog(args.tex_file, group_ids=args.groups, template_id=args.template, verbose=args.verbose))
@@ -0,0 +1,183 @@
+"""
+ChangeListener keeps a client in step with writes made by other clients.
+
+The triggers in SQL/change_notifications.sql send a NOTIFY with the table and id of every changed row. The listener
+holds one dedicated connection that LISTENs on that channel from a background thread. It gathers the ids for a short
+settling time, so a burst of writes becomes one batch per table, and hands each batch to the callbacks subscribed to
+that table. Changes made through this process's own connection pool are skipped, those are already applied.
+
+A callback gets None instead of a set of ids when notifications may have been missed, after the listener had to
+reconnect, and should reload that table in full.
+
+Example:
+    listener = change_listener()
+    listener.subscribe('equation', lambda ids: print('equations changed:', ids))
+    listener.start()
+
+https://www.psycopg.org/docs/advanced.html#asynchronous-notifications
+"""
+
+__author__ = "William DeShazer"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import json
+import atexit
+import select
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, List, Optional, Set
+from psycopg2 import connect, OperationalError, InterfaceError
+from psycopg2.sql import SQL, Identifier
+from db_pool import db_pool
+
+CHANNEL = 'eq_db_changes'
+SETTLE_TIME = 0.2  # seconds without new notifications before a batch is handed on
+POLL_TIMEOUT = 5.0  # seconds between checks for stop() while nothing arrives
+RECONNECT_DELAY = 5.0  # seconds to wait before listening again after the connection was lost
+
+ChangeCallback = Callable[[Optional[Set[int]]], None]
+
+
+class ChangeListener:
+    """Background LISTEN on the change channel, dispatching changed ids per table"""
+
+    def __init__(self, db_params: Optional[dict] = None, channel: str = CHANNEL, settle_time: float = SETTLE_TIME,
+                 skip_own: bool = True):
+        self.db_params = db_pool().db_params if db_params is None else db_params
+        self.channel = channel
+        self.settle_time = settle_time
+        self.skip_own = skip_own
+        self.notifications: int = 0
+        self.batches: int = 0
+        self.reconnects: int = 0
+        self._callbacks: Dict[str, List[ChangeCallback]] = {}
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    def subscribe(self, table_name: str, callback: ChangeCallback):
+        """Call callback with the changed ids of table_name. Runs on the listener thread"""
+        with self._lock:
+            self._callbacks.setdefault(table_name, []).append(callback)
+
+    def unsubscribe(self, table_name: str, callback: ChangeCallback):
+        """Stop calling callback for table_name"""
+        with self._lock:
+            if callback in self._callbacks.get(table_name, []):
+                self._callbacks[table_name].remove(callback)
+
+    def start(self):
+        """Start listening in a daemon thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name='ChangeListener', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop listening. Returns once the thread has finished or timeout has passed"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=POLL_TIMEOUT if timeout is None else timeout)
+            self._thread = None
+
+    def is_running(self) -> bool:
+        """True while the listener thread is alive"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def _listen(self):
+        conn = connect(**self.db_params)
+        conn.autocommit = True  # a LISTEN inside an open transaction would never deliver anything
+        cur = conn.cursor()
+        cur.execute(SQL('LISTEN {}').format(Identifier(self.channel)))
+        cur.close()
+        return conn
+
+    def _run(self):
+        missed = False
+        while not self._stop.is_set():
+            try:
+                conn = self._listen()
+            except OperationalError as error:
+                print(error)
+                self._stop.wait(RECONNECT_DELAY)
+                continue
+
+            if missed is True:
+                # Anything could have changed while there was no connection
+                with self._lock:
+                    tables = list(self._callbacks)
+                self._dispatch({table_name: None for table_name in tables})
+                missed = False
+
+            try:
+                self._receive(conn)
+            except (OperationalError, InterfaceError) as error:
+                print(error)
+                self.reconnects += 1
+                missed = True
+            finally:
+                if not conn.closed:
+                    conn.close()
+
+    def _receive(self, conn):
+        pending: Dict[str, Set[int]] = {}
+        own_pids: Set[int] = set()
+
+        while not self._stop.is_set():
+            timeout = self.settle_time if pending else POLL_TIMEOUT
+            if select.select([conn], [], [], timeout) == ([], [], []):
+                if pending:
+                    self._dispatch(pending)
+                    pending = {}
+                continue
+
+            conn.poll()
+            if conn.notifies and self.skip_own is True:
+                own_pids = db_pool().backend_pids()
+
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                self.notifications += 1
+                try:
+                    payload = json.loads(notify.payload)
+                except ValueError:
+                    continue
+
+                if payload.get('pid') in own_pids or payload.get('id') is None:
+                    continue
+                pending.setdefault(payload['table'], set()).add(int(payload['id']))
+
+    def _dispatch(self, changes: Dict[str, Optional[Set[int]]]):
+        self.batches += 1
+        for table_name, ids in changes.items():
+            with self._lock:
+                callbacks = list(self._callbacks.get(table_name, []))
+            for callback in callbacks:
+                try:
+                    callback(ids)
+                except Exception as error:  # pylint: disable=broad-except
+                    # One failing subscriber mustn't stop the others, or the listener
+                    print('Change callback failed for {}: {}'.format(table_name, error))
+
+    def stats(self) -> dict:
+        """Snapshot of the listener counters"""
+        return dict(notifications=self.notifications, batches=self.batches, reconnects=self.reconnects,
+                    running=self.is_running())
+
+
+_CHANGE_LISTENER: Optional[ChangeListener] = None
+
+
+def change_listener() -> ChangeListener:
+    """Process wide change listener, created on first use. Call start() on it to begin listening"""
+    global _CHANGE_LISTENER  # pylint: disable=global-statement
+    if _CHANGE_LISTENER is None:
+        _CHANGE_LISTENER = ChangeListener()
+    return _CHANGE_LISTENER
+
+
+@atexit.register
+def _stop_change_listener():
+    if _CHANGE_LISTENER is not None:
+        _CHANGE_LISTENER.stop(timeout=0)
@@ -0,0 +1,244 @@
+"""
+ConnectionPool shares a small set of database connections across the whole process.
+
+Every query used to open its own connection, re-reading database.ini and paying the TCP and authentication handshake
+each time. The pool keeps between minconn and maxconn connections open and hands them out for the length of a with
+block. Connections that sat idle for a while are health checked before they are handed out again, and broken ones are
+replaced. Counters for checkouts, waits and new connections are kept per process.
+
+Example:
+    with db_pool().connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT 1')
+
+https://www.psycopg.org/docs/pool.html
+"""
+
+__author__ = "William DeShazer"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import atexit
+from time import monotonic
+from threading import Condition
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set, Tuple
+from psycopg2 import connect, OperationalError, InterfaceError
+from psycopg2.extensions import connection, TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+from psycopg2.pool import PoolError
+from config import config
+from query_stats import InstrumentedCursor
+
+MIN_CONNECTIONS = 1
+MAX_CONNECTIONS = 8
+CHECKOUT_TIMEOUT = 30.0  # seconds to wait for a free connection before giving up
+CHECK_AFTER = 30.0  # seconds a connection may sit idle before it is health checked on checkout
+
+
+class ConnectionPool:
+    """Thread safe pool of psycopg2 connections"""
+
+    def __init__(self, db_params: Optional[dict] = None, minconn: int = MIN_CONNECTIONS,
+                 maxconn: int = MAX_CONNECTIONS, timeout: float = CHECKOUT_TIMEOUT, check_after: float = CHECK_AFTER):
+        self.db_params = config() if db_params is None else db_params
+        self.minconn = minconn
+        self.maxconn = max(minconn, maxconn)
+        self.timeout = timeout
+        self.check_after = check_after
+        self.checkouts: int = 0
+        self.waits: int = 0
+        self.wait_time: float = 0.0
+        self.new_connections: int = 0
+        self.failed_checks: int = 0
+        self.closed: bool = False
+        self._idle: List[connection] = []
+        self._returned_at: Dict[int, float] = {}  # id(conn) -> time it went back into the pool
+        self._in_use: Dict[int, connection] = {}
+        self._pending: int = 0  # slots reserved by checkouts that are health checking or connecting
+        self._condition = Condition()
+
+        for _ in range(self.minconn):
+            self._release(self._connect())
+
+    def _connect(self) -> connection:
+        conn = connect(**self.db_params, cursor_factory=InstrumentedCursor)
+        with self._condition:
+            self.new_connections += 1
+        return conn
+
+    def _release(self, conn: connection):
+        self._idle.append(conn)
+        self._returned_at[id(conn)] = monotonic()
+
+    def _healthy(self, conn: connection, idle_for: float) -> bool:
+        """Cheap checks always, a round trip only for connections that have been idle a while"""
+        if conn.closed:
+            return False
+        if idle_for < self.check_after:
+            return True
+
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+        except (OperationalError, InterfaceError):
+            return False
+        return True
+
+    def backend_pids(self) -> Set[int]:
+        """Server process ids of every open connection, idle or in use"""
+        with self._condition:
+            return {conn.get_backend_pid() for conn in self._idle + list(self._in_use.values()) if not conn.closed}
+
+    def size(self) -> int:
+        """Number of open connections, idle or in use"""
+        with self._condition:
+            return len(self._idle) + len(self._in_use)
+
+    def getconn(self, timeout: Optional[float] = None) -> connection:
+        """Check out a connection, waiting for one to be returned when maxconn are already in use. The lock is only
+           held to pick a connection or reserve a slot, health checks and new connections happen outside it"""
+        if timeout is None:
+            timeout = self.timeout
+
+        with self._condition:
+            if self.closed:
+                raise PoolError('connection pool is closed')
+
+            if not self._idle and len(self._in_use) + self._pending >= self.maxconn:
+                self.waits += 1
+                started = monotonic()
+                ready = self._condition.wait_for(
+                    lambda: self._idle or len(self._in_use) + self._pending < self.maxconn or self.closed,
+                    timeout=timeout)
+                self.wait_time += monotonic() - started
+                if not ready:
+                    raise PoolError('no connection available after {:.1f} seconds'.format(timeout))
+                if self.closed:
+                    raise PoolError('connection pool is closed')
+
+            self._pending += 1
+            candidate, idle_for = self._take_idle()
+
+        conn = None
+        try:
+            while candidate is not None:
+                if self._healthy(candidate, idle_for):
+                    conn = candidate
+                    break
+                candidate.close()
+                with self._condition:
+                    self.failed_checks += 1
+                    candidate, idle_for = self._take_idle()
+
+            if conn is None:
+                conn = self._connect()
+        except BaseException:
+            with self._condition:
+                self._pending -= 1
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            self._pending -= 1
+            self._in_use[id(conn)] = conn
+            self.checkouts += 1
+            return conn
+
+    def _take_idle(self) -> Tuple[Optional[connection], float]:
+        """Most recently returned idle connection and how long it sat idle. Called with the lock held"""
+        if not self._idle:
+            return None, 0.0
+        candidate = self._idle.pop()
+        return candidate, monotonic() - self._returned_at.pop(id(candidate))
+
+    def putconn(self, conn: connection, close: bool = False):
+        """Return a connection. Anything left uncommitted is rolled back, broken connections are dropped. The
+           rollback runs before the lock is taken, the connection keeps its slot until then"""
+        with self._condition:
+            if id(conn) not in self._in_use:
+                raise PoolError('connection was not checked out from this pool')
+            close = close or self.closed
+
+        if not conn.closed and not close:
+            status = conn.get_transaction_status()
+            if status == TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except (OperationalError, InterfaceError):
+                    close = True
+
+        with self._condition:
+            self._in_use.pop(id(conn), None)
+
+            if conn.closed or close or self.closed or len(self._idle) >= self.maxconn:
+                if not conn.closed:
+                    conn.close()
+            else:
+                self._release(conn)
+
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """Check out a connection for the length of a with block. Commits when the block finishes and rolls back
+           when it raises, like using a psycopg2 connection as a context manager"""
+        conn = self.getconn(timeout=timeout)
+        try:
+            yield conn
+            if not conn.closed:
+                conn.commit()
+        except BaseException:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except (OperationalError, InterfaceError):
+                    pass
+            raise
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts. Connections in use are closed on return"""
+        with self._condition:
+            self.closed = True
+            for conn in self._idle:
+                conn.close()
+            self._idle.clear()
+            self._returned_at.clear()
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """Snapshot of the pool counters"""
+        with self._condition:
+            return dict(checkouts=self.checkouts, waits=self.waits, wait_time=self.wait_time,
+                        new_connections=self.new_connections, failed_checks=self.failed_checks,
+                        idle=len(self._idle), in_use=len(self._in_use), pending=self._pending,
+                        minconn=self.minconn, maxconn=self.maxconn)
+
+
+_DB_POOL: Optional[ConnectionPool] = None
+
+
+def db_pool(minconn: Optional[int] = None, maxconn: Optional[int] = None) -> ConnectionPool:
+    """Process wide connection pool, created on first use. Passing a size replaces a pool that was sized
+       differently"""
+    global _DB_POOL  # pylint: disable=global-statement
+    resize = (minconn is not None and _DB_POOL is not None and minconn != _DB_POOL.minconn) or \
+             (maxconn is not None and _DB_POOL is not None and maxconn != _DB_POOL.maxconn)
+
+    if _DB_POOL is None or _DB_POOL.closed or resize:
+        if _DB_POOL is not None:
+            _DB_POOL.closeall()
+        _DB_POOL = ConnectionPool(minconn=MIN_CONNECTIONS if minconn is None else minconn,
+                                  maxconn=MAX_CONNECTIONS if maxconn is None else maxconn)
+    return _DB_POOL
+
+
+@atexit.register
+def _close_db_pool():
+    if _DB_POOL is not None:
+        _DB_POOL.closeall()
@@ -10,15 +10,16 @@ __version__ = "0.1.0"
 __license__ = "MIT"
 
 from collections import defaultdict, namedtuple
+from contextlib import contextmanager
 from warnings import warn
-from typing import NamedTuple, Union, Optional
+from typing import NamedTuple, Union, Optional, List
 from pandas import DataFrame, read_sql
 from psycopg2.sql import SQL, Identifier, Placeholder, Composed
-from psycopg2 import connect, OperationalError, Binary
-from psycopg2.extras import NamedTupleCursor
-from config import config
+from psycopg2 import OperationalError, Binary
+from query_stats import InstrumentedNamedTupleCursor
+from db_pool import db_pool
 from latex_template import compile_pattern, template
-from time_logging import TimeLogger
+from time_logging import TimeLogger, traced
 
 
 class NoRecordIDError(UserWarning):
@@ -30,34 +31,28 @@ def get_data(table: str = None, as_columns: bool = True, verbose: bool = False):
     sql = "SELECT * FROM {tbl}"
     query = SQL(sql).format(tbl=Identifier(table))
 
-    db_params = config()
-    conn = connect(**db_params)
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-    cur = conn.cursor(cursor_factory=NamedTupleCursor)
+        if verbose:
+            print('Extracting records from Table: ' + table)
 
-    if verbose:
-        print('Extracting records from Table: ' + table)
+        try:
+            cur.execute(query)
+        except OperationalError as error:
+            print(error)
 
-    try:
-        cur.execute(query)
-    except OperationalError as error:
-        print(error)
-
-    records = cur.fetchall()
+        records = cur.fetchall()
+        cur.close()
 
     if as_columns is True:
         records = columnify(records)
 
-    cur.close()
-    conn.close()
-
     return records
 
 
 def insert(table: str = None, data: dict = None, as_column=True, verbose: bool = False):
     """Method to Insert New Equation Records"""
-    db_params = config()
-
     sql = 'INSERT INTO {table} ({}) VALUES ({}) RETURNING *'
 
     keys = data.keys()
@@ -68,24 +63,22 @@ def insert(table: str = None, data: dict = None, as_column=True, verbose: bool =
         table=Identifier(table)
     )
 
-    conn = connect(**db_params)
-
-    cur = conn.cursor(cursor_factory=NamedTupleCursor)
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-    if verbose:
-        print(query.as_string(conn))
+        if verbose:
+            print(query.as_string(conn))
 
-    try:
-        cur.execute(query, data)
-    except OperationalError as error:
-        print(error)
+        try:
+            cur.execute(query, data)
+        except OperationalError as error:
+            print(error)
 
-    conn.commit()
+        conn.commit()
 
-    new_record = cur.fetchall()
+        new_record = cur.fetchall()
 
-    cur.close()
-    conn.close()
+        cur.close()
 
     if as_column is True:
         new_record = columnify(new_record)
@@ -96,7 +89,7 @@ def update(table: str = None, an_id: id = None, where_key: str = 'id',
            data: dict = None, as_column: bool = True, verbose: bool = None):
     """Insert New Record Into math_object"""
 
-    db_params = config()
+    db_params = db_pool().db_params
 
     if 'modified_by' not in data:
         data.update(modified_by=db_params['user'])
@@ -115,24 +108,23 @@ def update(table: str = None, an_id: id = None, where_key: str = 'id',
 
     data.update(where_key=an_id)
 
-    conn = connect(**db_params)
-    cur = conn.cursor(cursor_factory=NamedTupleCursor)
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-    if verbose:
-        print(query.as_string(conn))
-        print(cur.mogrify(query, data))
+        if verbose:
+            print(query.as_string(conn))
+            print(cur.mogrify(query, data))
 
-    try:
-        cur.execute(query, data)
-    except OperationalError as error:
-        print(error)
+        try:
+            cur.execute(query, data)
+        except OperationalError as error:
+            print(error)
 
-    new_record = cur.fetchall()
+        new_record = cur.fetchall()
 
-    conn.commit()
+        conn.commit()
 
-    cur.close()
-    conn.close()
+        cur.close()
 
     if as_column is True:
         new_record = columnify(new_record)
@@ -160,10 +152,8 @@ def self_named_tuple_example(table_name: str = None, parent_table_name: str = No
         table_id=Identifier(self.table_id)
     )
 
-    db_params = config()
-    conn = connect(**db_params)
-
-    df = read_sql(query, con=conn, index_col=[self.parent_id, self.table_id])
+    with db_connection() as conn:
+        df = read_sql(query, con=conn, index_col=[self.parent_id, self.table_id])
     return df
 
 
@@ -193,20 +183,17 @@ def record_count_total(table: str = None, verbose: bool = False) -> int:
 
     query = SQL(sql).format(table=Identifier(table))
 
-    db_params = config()
-    conn = connect(**db_params)
-
-    cur = conn.cursor(cursor_factory=NamedTupleCursor)
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-    if verbose:
-        print('Getting Count of Records in table: {table}'.format(table=table))
+        if verbose:
+            print('Getting Count of Records in table: {table}'.format(table=table))
 
-    cur.execute(query)  # self.table))
+        cur.execute(query)  # self.table))
 
-    record_count = cur.fetchone()
+        record_count = cur.fetchone()
 
-    cur.close()
-    conn.close()
+        cur.close()
 
     return record_count[0]
 
@@ -261,10 +248,8 @@ def extract_db(table_name: str = None, parent_table_name: str = None) -> DataFra
         table_id=Identifier(table_id)
     )
 
-    db_params = config()
-    conn = connect(**db_params)
-
-    df = read_sql(query, con=conn, index_col=[parent_id, table_id])
+    with db_connection() as conn:
+        df = read_sql(query, con=conn, index_col=[parent_id, table_id])
     return df
 
 
@@ -282,10 +267,8 @@ def save_db(table_name: str = None, parent_table_name: str = None):
         table_id=Identifier(table_id)
     )
 
-    db_params = config()
-    conn = connect(**db_params)
-
-    df = read_sql(query, con=conn, index_col=[parent_id, table_id])
+    with db_connection() as conn:
+        df = read_sql(query, con=conn, index_col=[parent_id, table_id])
     return df
 
 
@@ -300,7 +283,7 @@ def new_record_db(parent_id: int = None, table_name: str = None, parent_table_na
     if new_record is None:
         new_record = {}
 
-    db_params = config()
+    db_params = db_pool().db_params
 
     table_id = table_name + '_id'
     next_id: int = record_count_total_db(data_df, table_id=table_id) + 1
@@ -333,24 +316,23 @@ def new_record_db(parent_id: int = None, table_name: str = None, parent_table_na
                             fields=SQL(', ').join(map(Identifier, keys)),
                             values=SQL(', ').join(map(Placeholder, keys)))
 
-    conn = connect(**db_params)
-
-    if verbose:
-        print(query.as_string(conn))
+    with db_connection() as conn:
+        if verbose:
+            print(query.as_string(conn))
 
-    cur = conn.cursor(cursor_factory=NamedTupleCursor)
+        cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-    if verbose:
-        print('Adding new record to Table: {aTable}'.format(aTable=table_name))
+        if verbose:
+            print('Adding new record to Table: {aTable}'.format(aTable=table_name))
 
-    try:
-        cur.execute(query, new_record)
-    except OperationalError as error:
-        print(error)
+        try:
+            cur.execute(query, new_record)
+        except OperationalError as error:
+            print(error)
 
-    new_records = cur.fetchall()
-    conn.commit()
-    cur.close()
+        new_records = cur.fetchall()
+        conn.commit()
+        cur.close()
 
     if parent_id is not None:
         for record in new_records:
@@ -385,7 +367,7 @@ def record_count_total_db(table_data: Optional[DataFrame] = None, table_id: str
 #     db_params = config()
 #     conn = connect(**db_params)
 #
-#     cur = conn.cursor(cursor_factory=NamedTupleCursor)
+#     cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 #
 #     if verbose:
 #         print('Getting Count of Records in table: {table} for Group ID: {gid}'.format(table=self.join_table(),
@@ -421,7 +403,7 @@ def associate_parent(parent_id: int = None, child_id: int = None,
 
     join_table = table_name + '_' + parent_table_name
 
-    db_params = config()
+    db_params = db_pool().db_params
 
     if new_record is None:
         new_record = {}
@@ -443,31 +425,31 @@ def associate_parent(parent_id: int = None, child_id: int = None,
                             fields=SQL(', ').join(map(Identifier, keys)),
                             values=SQL(', ').join(map(Placeholder, keys)))
 
-    conn = connect(**db_params)
+    with db_connection() as conn:
+        if verbose:
+            print(query.as_string(conn))
 
-    if verbose:
-        print(query.as_string(conn))
+        cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-    cur = conn.cursor(cursor_factory=NamedTupleCursor)
+        if verbose:
+            print('Adding new record to Table: {aTable}'.format(aTable=join_table))
 
-    if verbose:
-        print('Adding new record to Table: {aTable}'.format(aTable=join_table))
+        try:
+            cur.execute(query, new_record)
+        except OperationalError as error:
+            print(error)
 
-    try:
-        cur.execute(query, new_record)
-    except OperationalError as error:
-        print(error)
+        conn.commit()
 
-    conn.commit()
-
-    cur.close()
+        cur.close()
 # endregion
 
 
+@traced('my_connect', 'db')
 def my_connect(my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None, verbose: bool = False):
     """My connect is a function that initializes a database connection.
        If a connection is passed then essentally it function as a pass-through.
-       Otherwise it establishes a connection."""
+       Otherwise it attaches to the shared connection pool. Connections are checked out with db_connection."""
     if verbose is True and t_log is None:
         t_log = TimeLogger()
 
@@ -476,12 +458,49 @@ def my_connect(my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = Non
         if verbose is True:
             t_log.new_event('Attaching to Database')
 
-        db_params = config()
-        conn = connect(**db_params)
+        pool = db_pool()
 
         if verbose is True:
             t_log.new_event('Attached to Database')
 
-        my_conn = dict(db_params=db_params, conn=conn)
+        my_conn = dict(db_params=pool.db_params, pool=pool)
 
     return my_conn
+
+
+@contextmanager
+def db_connection(my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None, verbose: bool = False):
+    """Check out a connection for the length of a with block. A my_conn holding its own 'conn' is used as is"""
+    my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    if my_conn.get('pool') is None:
+        yield my_conn['conn']
+    else:
+        with my_conn['pool'].connection() as conn:
+            yield conn
+
+
+_TABLE_COLUMNS: dict = {}  # table name -> column names in table order
+
+
+def table_columns(table: str, my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
+                  verbose: bool = False) -> List[str]:
+    """Column names of a table in definition order, for the table the search_path resolves the name to.
+       Looked up once per table and process"""
+    if table not in _TABLE_COLUMNS:
+        sql = 'SELECT attname FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attnum > 0 ' \
+              'AND NOT attisdropped ORDER BY attnum'
+
+        with db_connection(my_conn, t_log=t_log, verbose=verbose) as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(sql, (table,))
+            except OperationalError as error:
+                print(error)
+                cur.close()
+                return []
+            # Loader threads can look the same table up at once, the first answer stored is the one everyone gets
+            _TABLE_COLUMNS.setdefault(table, [row[0] for row in cur.fetchall()])
+            cur.close()
+
+    return _TABLE_COLUMNS[table]
@@ -22,42 +22,53 @@ __license__ = "MIT"
 import platform
 import sys
 from collections import namedtuple
-from typing import Optional
+from functools import partial
+from operator import attrgetter
+from concurrent.futures import Future
+from typing import List, Optional
 # region Windows Task Bar Icon
 import ctypes
 import screeninfo
 
-from PyQt5.QtGui import QPainter, QColor, QIcon, QBrush, QPixmap, QImage
-from PyQt5.QtCore import QSize, Qt, QItemSelection, pyqtSlot
+from PyQt5.QtGui import QPainter, QColor, QIcon, QBrush, QPixmap
+from PyQt5.QtCore import QSize, Qt, QItemSelection, pyqtSlot, pyqtSignal
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QSplitter,
     QHBoxLayout, QVBoxLayout, QMainWindow, QGroupBox,
     QLabel, QLineEdit, QFrame, QComboBox,
     QSpacerItem, QSizePolicy, QPushButton, QGridLayout, QGraphicsScene,
-    QTextEdit, QGraphicsView, QTableWidget, QGraphicsDropShadowEffect,
-    QAction, QAbstractItemView, QTableWidgetItem, QMessageBox,
+    QTextEdit, QGraphicsView, QTableView, QGraphicsDropShadowEffect,
+    QAction, QAbstractItemView, QMessageBox,
     QAbstractButton
 )
 
 from scipy.constants import golden_ratio
-from psycopg2 import connect
+from pandas import DataFrame
 from latex_data_widget import LaTexTextEdit
-from config import config
 from equation_group import EquationGroup
 from db_utils import my_connect
 from equation_group_dialog import EquationGroupDialog
 from equation_dialog import EquationDialog
 from equations import GroupedEquations  # , EquationRecord
-from variables import GroupedVariables, GroupedVariableRecord
+from variables import GroupedVariables
+from grouped_physics_object import GroupedPhysicsObject
 from variable_dialog import VariableDialog
 from CustomWidgets.filter_list_widget import EDFilterListWidget
+from CustomWidgets.record_models import RecordModel, Column, ImageDelegate
 from unit import Unit
 from type_table import TypeTable
-from time_logging import TimeLogger
+from time_logging import TimeLogger, traced
+from startup_loader import start_loading
+from template import forget_template_data
+from change_listener import change_listener
+from pixmap_cache import pixmap_cache
+from image_store import THUMBNAIL
 
 WINDOW_LEFT_START = 300
 WINDOW_TOP_START = 300
 WINDOW_HEIGHT = 1500
+VARIABLE_ROW_HEIGHT = 40  # fixed, so sizing the rows never decodes an image
+THUMBNAIL_KEY = '.' + THUMBNAIL  # keeps thumbnails apart from full images in the pixmap cache
 
 if platform.system() == "Windows":
     outer_log = TimeLogger()
@@ -140,6 +151,11 @@ RESET: bool = False
 class Window(QMainWindow):
     """Main Window for Application"""
 
+    # Emitted from the change listener thread, delivered on the GUI thread
+    remote_change = pyqtSignal(str, object)
+    # Emitted from the startup loader threads as each data store finishes
+    store_loaded = pyqtSignal(str, object)
+
     def __init__(self, *args, **kwargs):
         self.app = QApplication(sys.argv)
         super().__init__(*args, **kwargs)
@@ -220,6 +236,9 @@ class Window(QMainWindow):
         self.analyze_frame.setSizePolicy(size_policy)
 
         self.equation_filter_list = EDFilterListWidget(self.eq_group_gbox)
+        self.equation_model = RecordModel([Column('Equation', text=attrgetter('name'))], lookup=self.equation_rows,
+                                          parent=self)
+        self.equation_filter_list.set_model(self.equation_model)
         self.equation_listbox = self.equation_filter_list.list
         # self.equation_listbox = QListWidget(self.eq_group_gbox)
         self.equation_listbox.setSelectionBehavior(QAbstractItemView.SelectItems)
@@ -227,6 +246,7 @@ class Window(QMainWindow):
         self.equation_listbox.selectionModel().selectionChanged.connect(self.select_one_equation)
         self.equation_filter_list.add.connect(self.add_equation)
         self.equation_filter_list.remove.connect(self.remove_equation)
+        self.equation_filter_list.set_search(self.search_equations)
 
         self.eq_group_v_layout.addWidget(self.equation_filter_list)
         # endregion
@@ -316,7 +336,14 @@ class Window(QMainWindow):
         self.variables_v_layout = QVBoxLayout(self.variables_gbox)
         self.variables_v_layout.setSpacing(5)
         # self.variables_gbox.setLayout(self.var_notes_v_layout)
-        self.variables_tbl = QTableWidget(self.variables_gbox)
+        self.variables_tbl = QTableView(self.variables_gbox)
+        self.variable_model = RecordModel(self.variable_columns(), prefetch=lambda ids: self.var.load_thumbnails(ids),
+                                          parent=self)
+        self.variables_tbl.setModel(self.variable_model)
+        self.image_delegate = ImageDelegate(self.variables_tbl, row_height=VARIABLE_ROW_HEIGHT)
+        self.variables_tbl.setItemDelegateForColumn(0, self.image_delegate)
+        self.variables_tbl.setItemDelegateForColumn(3, self.image_delegate)
+        self.variables_tbl.verticalHeader().setDefaultSectionSize(VARIABLE_ROW_HEIGHT)
         self.variables_v_layout.addWidget(self.variables_tbl)
 
         self.var_add_btn = QPushButton("+")
@@ -401,39 +428,143 @@ class Window(QMainWindow):
         t_log.new_event("End GUI Build")
 
         self.state_data = dict()
-        # t_log.new_event("Equation Group Load")
-        self.eqn_grp = EquationGroup(my_conn=my_conn, t_log=t_log, verbose=verbose)
-        self.eq = GroupedEquations(my_conn=my_conn, t_log=t_log, verbose=verbose)
-        self.var = GroupedVariables(my_conn=my_conn, t_log=t_log, verbose=verbose)
-        self.unit = Unit(my_conn=my_conn, t_log=t_log, verbose=verbose)
-        self.eq_type = TypeTable(name='equation_type', my_conn=my_conn, t_log=t_log, verbose=verbose)
-        self.var_type = TypeTable(name='variable_type', my_conn=my_conn, t_log=t_log, verbose=verbose)
-        self.unit_type = TypeTable(name='unit_type', my_conn=my_conn, t_log=t_log, verbose=verbose)
-
-        t_log.new_event("Data Finished Loading")
+        # Every store loads at once on its own pooled connection. The window only waits for the equation groups,
+        # the rest are filled in by store_loaded as they arrive
+        self.t_log = t_log
+        self._loading = start_loading(dict(
+            eqn_grp=partial(EquationGroup, my_conn=my_conn, t_log=t_log, verbose=verbose),
+            eq=partial(GroupedEquations, my_conn=my_conn, t_log=t_log, verbose=verbose, use_snapshot=True),
+            var=partial(GroupedVariables, my_conn=my_conn, t_log=t_log, verbose=verbose, use_snapshot=True),
+            unit=partial(Unit, my_conn=my_conn, t_log=t_log, verbose=verbose, use_snapshot=True),
+            eq_type=partial(TypeTable, name='equation_type', my_conn=my_conn, t_log=t_log, verbose=verbose),
+            var_type=partial(TypeTable, name='variable_type', my_conn=my_conn, t_log=t_log, verbose=verbose),
+            unit_type=partial(TypeTable, name='unit_type', my_conn=my_conn, t_log=t_log, verbose=verbose)
+        ), t_log=t_log)
+        self.eqn_grp = self._loading['eqn_grp'].result()
+        self.eq: Optional[GroupedEquations] = None
+        self.var: Optional[GroupedVariables] = None
+        self.unit: Optional[Unit] = None
+        self.eq_type: Optional[TypeTable] = None
+        self.var_type: Optional[TypeTable] = None
+        self.unit_type: Optional[TypeTable] = None
+
+        t_log.new_event("Equation Groups Loaded")
 
         self.eq_grp_id: int = 1  # Can envision it pulling user specified state information someday
         self.eqn_records_for_eqn_group = None  # Gets Populated when equations are present
         self.eq_id: tuple = (1,)  # Same comment as eq_grp_id
         self.var_records_for_eqns = None  # Gets populated when eqn_group_gets selected
         self.selected_equation = None  # Stores the selected equation
-        self.latex_textbox.db_ref = self.eq
         self.equation_taken: bool = False
 
         t_log.new_event("Populating Boxes")
         self.refresh_eqn_group_combo_box()
-        self.populate_equation_listbox()
         t_log.new_event("Populating Boxes")
         self.app.setStyleSheet(open('equation_db.css').read())
         t_log.new_event("Finished Style Sheet")
         print()
         print('Total Time: ', t_log.total_time())
 
+        # Keep in step with other clients writing to the same database
+        self.remote_change.connect(self.apply_remote_change)
+        listener = change_listener()
+        for table_name in ('equation', 'equation_eqn_group', 'variable', 'variable_equation', 'unit', 'eqn_group',
+                           'template'):
+            listener.subscribe(table_name, partial(self.remote_change.emit, table_name))
+        listener.start()
+
+        # Registered last, a store that has already finished calls back right away
+        self.store_loaded.connect(self.apply_loaded_store)
+        for name, future in self._loading.items():
+            future.add_done_callback(partial(self.store_loaded.emit, name))
+
         # endregion
 
+    @pyqtSlot(str, object)
+    @traced()
+    def apply_loaded_store(self, name: str, future: Future):
+        """Take a data store from the startup loader once it has arrived"""
+        if future.exception() is not None:
+            print('Failed to load {}: {}'.format(name, future.exception()))
+            return
+
+        if getattr(self, name) is None:
+            self.wait_for_stores(name)
+
+        if name == 'eq':
+            self.populate_equation_listbox()
+
+        if all(future.done() for future in self._loading.values()):
+            self.t_log.new_event("Data Finished Loading")
+
+    def wait_for_stores(self, *names: str):
+        """Make sure the named data stores are loaded, waiting for any that are still on their way"""
+        for name in names:
+            if getattr(self, name) is None:
+                setattr(self, name, self._loading[name].result())
+                if name == 'eq':
+                    self.latex_textbox.db_ref = self.eq
+
+    @pyqtSlot(str, object)
+    @traced()
+    def apply_remote_change(self, table_name: str, ids: Optional[set]):
+        """Patch in rows another client changed. ids is None when the whole table has to be reloaded"""
+        store = dict(equation='eq', equation_eqn_group='eq', variable='var', variable_equation='var', unit='unit',
+                     eqn_group='eqn_grp').get(table_name)
+        if store is not None and getattr(self, store) is None:
+            return  # Still loading, it will come back with the change in it
+
+        if table_name in ('equation', 'equation_eqn_group'):
+            eq = self.eq
+            before = [rcd.name for rcd in eq.selected_data_records] if eq.selected_data_records is not None else []
+            if table_name == 'equation':
+                for an_id in ids if ids is not None else [None]:
+                    eq.images.invalidate(an_id)
+                    eq.thumbnails.invalidate(an_id)
+                    eq.vectors.invalidate(an_id)
+            if ids is None:
+                eq.pull_grouped_data()
+            else:
+                eq.refresh_records(list(ids))
+            eq.set_records_for_parent(parent_id=self.eq_grp_id)
+            after = [rcd.name for rcd in eq.selected_data_records] if eq.selected_data_records is not None else []
+
+            # Only rebuild the list when what it shows changed, so a selection and unsaved edits survive
+            if before != after:
+                self.populate_equation_listbox()
+            else:
+                self.equation_model.update_records(eq.selected_data_df(self.eq_grp_id))
+        elif table_name in ('variable', 'variable_equation'):
+            var = self.var
+            if table_name == 'variable':
+                for an_id in ids if ids is not None else [None]:
+                    var.images.invalidate(an_id)
+                    var.thumbnails.invalidate(an_id)
+                    var.vectors.invalidate(an_id)
+            if ids is None:
+                var.pull_grouped_data()
+            else:
+                var.refresh_records(list(ids))
+            if self.selected_equation is not None:
+                var.set_records_for_parent(parent_id=self.selected_equation.Index)
+                self.show_variable_table()
+        elif table_name == 'unit':
+            self.unit.pull_data()
+            if self.selected_equation is not None:
+                self.show_variable_table()
+        elif table_name == 'eqn_group':
+            ind = self.eq_group_cbox.currentIndex()
+            self.eqn_grp.pull_data()
+            self.refresh_eqn_group_combo_box()
+            self.eq_group_cbox.setCurrentIndex(min(ind, self.eq_group_cbox.count() - 1))
+        elif table_name == 'template':
+            forget_template_data(ids)
+
     @pyqtSlot()
+    @traced()
     def new_equation_group(self):
         """Adds a new equation group"""
+        self.wait_for_stores('eq')
         dlg = EquationGroupDialog(self, eqn_group=self.eqn_grp, eqn=self.eq)
 
         if dlg.exec_():
@@ -478,7 +609,7 @@ class Window(QMainWindow):
         self.type_cbox.clear()
         self.latex_textbox.clear()
         self.scene.clear()
-        self.variables_tbl.clearContents()
+        self.variable_model.clear()
         self.notes_textbox.clear()
 
     def select_a_type_cbox(self, a_type: str = None):
@@ -493,14 +624,15 @@ class Window(QMainWindow):
 
     def populate_equation_listbox(self):
         """Populate equation listbox"""
+        if self.eq is None:
+            return  # apply_loaded_store fills the list once the equations arrive
+
         self.reset_selected_equation_data()
-        eq_fl = self.equation_filter_list
         eq = self.eq
 
         self.clear_boxes(equation_selected=False)
         if eq.selected_data_records is not None:
-            for row in eq.selected_data_records:
-                eq_fl.addItem(row.name)
+            self.equation_model.set_records(eq.selected_data_df(self.eq_grp_id))
 
     def reset_selected_equation_data(self):
         """Reset Selected Equation Data"""
@@ -517,6 +649,7 @@ class Window(QMainWindow):
         eq.set_records_for_parent(parent_id=eq_grp_id)
 
     @pyqtSlot(QItemSelection, QItemSelection)
+    @traced()
     def select_one_equation(self, selected: QItemSelection, deselected: QItemSelection):
         """This type of selection shows all equation details"""
 
@@ -597,8 +730,10 @@ class Window(QMainWindow):
         rcd = self.eqn_grp.all_records[ind]
         return rcd.eqn_group_id
 
+    @traced()
     def refresh_equation_details(self):
         """Refresh Equation Details"""
+        self.wait_for_stores('var', 'unit', 'eq_type')
         eq_lb = self.equation_listbox
         eq = self.eq
 
@@ -607,7 +742,7 @@ class Window(QMainWindow):
         ind = eq_lb.selectedIndexes()
 
         for i in ind:  # There is only one
-            selected_eqn = eq.selected_data_records[i.row()]
+            selected_eqn = self.equation_model.record(i.row())
             self.selected_equation = selected_eqn
             self.name_l_edit.setText(selected_eqn.name)
             self.codefile_l_edit.setText(selected_eqn.code_file_path)
@@ -616,7 +751,8 @@ class Window(QMainWindow):
             self.latex_textbox.setAlignment(Qt.AlignLeft)
             self.latex_textbox.latex_data = selected_eqn.latex_obj
             self.latex_textbox.db_ref_id = selected_eqn.Index
-            self.show_latex_image(selected_eqn.image)
+            self.show_latex_image(pixmap_cache().record_pixmap(eq, selected_eqn.Index, selected_eqn.compiled_at,
+                                                               self.latex_graphicbox.devicePixelRatioF()))
             self.notes_textbox.setText(selected_eqn.notes)
             self.var.set_records_for_parent(parent_id=selected_eqn.Index)
             self.show_variable_table()
@@ -627,7 +763,7 @@ class Window(QMainWindow):
         deselected = self.state_data['deselected']
 
         rcd = deselected.indexes()
-        deselected_eqn = self.eq.selected_data_records[rcd[0].row()]
+        deselected_eqn = self.equation_model.record(rcd[0].row())
 
         details_data = dict(
             name=self.name_l_edit.text(),
@@ -651,6 +787,7 @@ class Window(QMainWindow):
         self.state_data.update(dirty_data=dirty_data)
 
     @pyqtSlot(QAbstractButton)
+    @traced()
     def allow_equation_change(self, response: QAbstractButton):
         """Allow Equation Change"""
         # selected: QItemSelection = self.state_data['selected']
@@ -663,86 +800,60 @@ class Window(QMainWindow):
         elif response.text() == 'Save':
             d_rcd = deselected.indexes()
             ind = d_rcd[0].row()
-            deselected_eqn = self.eq.selected_data_records[ind]
+            deselected_eqn = self.equation_model.record(ind)
 
             new_dd: dict = dirty_data['new']
 
             eq_id = deselected_eqn.Index
             self.eq.update(an_id=eq_id, data=new_dd, verbose=True)
-            if 'name' in new_dd.keys():
-                item = self.equation_listbox.item(ind)
-                item.setText(new_dd['name'])
 
             dirty_data = dict(new=None, old=None)
             self.state_data.update(dirty_data=dirty_data)
             # response.close()
             self.reset_selected_equation_data()
+            self.equation_model.update_records(self.eq.selected_data_df(self.eq_grp_id))
             self.refresh_equation_details()
 
     def show_variable_table(self):
         """Show Variable table"""
         var = self.var
-        tbl = self.variables_tbl
-        tbl.clearContents()
-
-        if var.selected_data_records is not None:
-            var_records = var.selected_data_records
-            tbl.setRowCount(len(var_records))
-
-            header = self.table_info('header')
-
-            tbl.setColumnCount(len(header))
-            tbl.setHorizontalHeaderLabels(header)
-
-            for i, record in enumerate(var_records):
-                self.add_record_to_variable_table(record=record, row=i)
-
-    @staticmethod
-    def table_info(info):
-        """Convenience function to collocate information for the table"""
-        header = ['Variable', 'Name', 'Dimension', 'Unit', 'Unit Name', 'Type of Variable']
-        column = dict(var_image=0, var_name=1, dimension=2, unit_image=3, unit_name=4)
-        data = header if info == 'header' else column
-        return data
-
-    def add_record_to_variable_table(self, record: GroupedVariableRecord, row: int = None):  # , verbose: bool = False):
-        """Add record to variable table"""
-        tbl = self.variables_tbl
-
-        column = self.table_info('column')
-
-        # This will add a row
-        if row is None:
-            row = tbl.rowCount()
-
-        img = QImage.fromData(record.image)
-        pixmap = QPixmap.fromImage(img)
-        lbl = QLabel()
-        lbl.setPixmap(pixmap)
-        tbl.setCellWidget(row, column['var_image'], lbl)
-        tbl.setItem(row, column['var_name'], QTableWidgetItem(record.name))
-        tbl.setItem(row, column['dimension'], QTableWidgetItem(str(record.dimensions)))
-
-        un_id_for_var = record.unit_id
-
-        unit = self.unit.all_records[un_id_for_var]
-        if unit.image is not None:
-            img = QImage.fromData(unit.image)
-            pixmap = QPixmap.fromImage(img)
-            lbl = QLabel()
-            lbl.setPixmap(pixmap)
-            tbl.setCellWidget(row, column['unit_image'], lbl)
-        tbl.setItem(row, column['unit_name'], QTableWidgetItem(unit.name))
-
-    def show_latex_image(self, image: Optional[bytes] = None):
+
+        if var.selected_data_records is None:
+            self.variable_model.clear()
+        else:
+            # Same variables keep their rows, so a remote edit doesn't scroll the table back to the top
+            self.variable_model.update_records(var.selected_data_df(var.selected_parent_id))
+
+    def variable_columns(self) -> List[Column]:
+        """Columns of the variable table. Thumbnails are read when a row is painted, not when the table is filled"""
+        return [
+            Column('Variable', image=lambda rcd: self.var.thumbnail(rcd.Index),
+                   key=lambda rcd: (self.var.table_name + THUMBNAIL_KEY, rcd.Index, rcd.compiled_at)),
+            Column('Name', text=attrgetter('name')),
+            Column('Dimension', text=lambda rcd: str(rcd.dimensions)),
+            Column('Unit', image=lambda rcd: self.unit_thumbnail(rcd.unit_id),
+                   key=lambda rcd: (self.unit.table_name + THUMBNAIL_KEY, rcd.unit_id,
+                                    self.unit_record(rcd.unit_id).compiled_at)),
+            Column('Unit Name', text=lambda rcd: self.unit_record(rcd.unit_id).name),
+            Column('Type of Variable', text=attrgetter('type_name'))
+        ]
+
+    def unit_record(self, unit_id: int):
+        """Unit of a variable"""
+        return self.unit.all_records_df.loc[unit_id]
+
+    def unit_thumbnail(self, unit_id: int) -> Optional[bytes]:
+        """Thumbnail of a unit, its full image when it has no thumbnail yet"""
+        unit = self.unit_record(unit_id)
+        thumbnail = unit.get(THUMBNAIL)
+        return unit.image if thumbnail is None else thumbnail
+
+    def show_latex_image(self, pixmap: Optional[QPixmap] = None):
         """Show Latex Image"""
 
-        if image is None:
+        if pixmap is None:
             pass
         else:
-            img = QImage.fromData(image)
-            pixmap = QPixmap.fromImage(img)
-
             scene = self.scene
             scene.addPixmap(pixmap)
             # self.latex_graphicbox.setScene(scene)
@@ -755,8 +866,10 @@ class Window(QMainWindow):
         """Method to populate variables table widget"""
 
     @pyqtSlot()
+    @traced()
     def add_variable(self):
         """Add Equation to Equation Database"""
+        self.wait_for_stores('var')
         dlg = VariableDialog(var=self.var, my_conn=self.my_conn, parent=self)
 
         if dlg.exec_():
@@ -765,17 +878,11 @@ class Window(QMainWindow):
             # self.update_variable_insert_order()
 
     def update_variable_insert_order(self):
-        """Update Variable Insertion Order"""
-        var = self.var
-        var_tbl = self.variables_tbl
-
-        order = dict()
-        for i in range(var_tbl.rowCount()):
-            var_name = var_tbl.item(i, 2)
-            order.update({var_name: i})
-        var.update_insertion_order_for_selected(order=order)
+        """Move variables added to the selected equation to its end, one join row each"""
+        self._move_unordered_to_end(self.var)
 
     @pyqtSlot()
+    @traced()
     def remove_variable(self):
         """Remove variable from equation"""
         inds = self.equation_listbox.selectedIndexes()
@@ -788,33 +895,44 @@ class Window(QMainWindow):
             msg.exec_()
             return
 
-        for ind in inds:
-            i = ind.row()
-            child_id = eqn.selected_data_records[i].Index
+        child_ids = [self.equation_model.record_id(ind.row()) for ind in inds]
+        for child_id in child_ids:
             eqn.disassociate_parent(my_conn=self.my_conn, parent_id=parent_id, child_id=child_id)
             self.equation_taken = True
-            self.equation_listbox.takeItem(i)
 
         self.eq.set_records_for_parent(parent_id=self.eq.selected_parent_id)
+        self.equation_model.set_records(self.eq.selected_data_df())
+
+    def search_equations(self, text: str, limit: int) -> Optional[List[int]]:
+        """Ids of the selected group's equations that match text, best first. None until equations load"""
+        if self.eq is None:
+            return None
+        return [hit.id for hit in self.eq.search(text, parent_id=self.eq_grp_id, limit=limit)]
+
+    def equation_rows(self, ids: List[int]) -> DataFrame:
+        """Equations of the selected group in the order of ids, for showing search hits"""
+        records = self.eq.selected_data_df(self.eq_grp_id)
+        return records.loc[[an_id for an_id in ids if an_id in records.index]]
 
     def add_equation(self):
         """Add Equation to Equation Database"""
+        self.wait_for_stores('eq')
         dlg = EquationDialog(eqn=self.eq, my_conn=self.my_conn, parent=self.equation_filter_list)
 
         if dlg.exec_():
             print('Inserted')
             self.eq.set_records_for_parent()
             self.update_equation_insert_order()
+            self.equation_model.update_records(self.eq.selected_data_df(self.eq_grp_id))
 
     def update_equation_insert_order(self):
-        """Update Insertion Order"""
-        eq = self.eq
-        eq_lb = self.equation_filter_list
+        """Move equations added to the selected group to its end, one join row each"""
+        self._move_unordered_to_end(self.eq)
 
-        order = dict()
-        for i in range(eq_lb.count()):
-            order.update({eq_lb.item(i).text(): i})
-        eq.update_insertion_order_for_selected(order=order)
+    def _move_unordered_to_end(self, store: GroupedPhysicsObject):
+        df = store.selected_data_df()
+        for child_id in df.index[df.insertion_order.isnull()]:
+            store.move_record(int(child_id), my_conn=self.my_conn)
 
     def remove_equation(self):
         """Remove Equation from equation group"""
@@ -828,24 +946,19 @@ class Window(QMainWindow):
             msg.exec_()
             return
 
-        for ind in inds:
-            i = ind.row()
-            child_id = eqn.selected_data_records[i].Index
+        child_ids = [self.equation_model.record_id(ind.row()) for ind in inds]
+        for child_id in child_ids:
             eqn.disassociate_parent(my_conn=self.my_conn, parent_id=parent_id, child_id=child_id)
             self.equation_taken = True
-            self.equation_filter_list.takeItem(i)
 
         self.eq.set_records_for_parent(parent_id=self.eq.selected_parent_id)
+        self.equation_model.set_records(self.eq.selected_data_df())
 
 
 def main():
     """Main of the eqatuation database"""
-    db_params = config()
-    conn = connect(**db_params)
-
     ui = Window()  # pylint: disable=invalid-name
     ui.show()
-    conn.close()
     sys.exit(ui.app.exec_())
 
 
@@ -10,7 +10,6 @@ from typing import Optional
 # noinspection PyUnresolvedReferences
 from PyQt5.uic import loadUi
 # from PyQt5.QtGui import QPainter, QColor, QIcon, QBrush
-from PyQt5.QtGui import QPixmap, QImage
 from PyQt5.QtWidgets import (
     QApplication, QTextEdit, QMessageBox, QAbstractItemView,
     QListWidget, QDialog, QDialogButtonBox, QGraphicsView, QPushButton,
@@ -20,6 +19,7 @@ from db_utils import my_connect
 from CustomWidgets.filter_list_widget import EDFilterListWidget
 from equations import GroupedEquations
 from time_logging import TimeLogger
+from pixmap_cache import pixmap_cache
 
 
 class EquationDialog(QDialog):
@@ -78,11 +78,12 @@ class EquationDialog(QDialog):
         record = eqn.records_not_selected_unique[ind]
         self.notes_text_edit.setText(record.notes)
 
-        img = QImage.fromData(record.image)
-        pixmap = QPixmap.fromImage(img)
+        pixmap = pixmap_cache().record_pixmap(eqn, record.Index, record.compiled_at,
+                                              self.image_g_view.devicePixelRatioF())
 
         scene = self.scene
-        scene.addPixmap(pixmap)
+        if pixmap is not None:
+            scene.addPixmap(pixmap)
         # self.latex_graphicbox.setScene(scene)
         self.image_g_view.show()
 
@@ -115,9 +116,6 @@ class EquationDialog(QDialog):
             eqn.associate_parent(my_conn=self.my_conn, t_log=self.t_log,
                                  parent_id=eqn.selected_parent_id, child_id=child_id)
 
-            item = self.equation_filter_list.takeItem(ind)
-            self.parent().addItem(item)
-
         print('Accept')
         super().accept()
 
@@ -127,8 +125,6 @@ class EquationDialog(QDialog):
         eqn.new_record(my_conn=self.my_conn, t_log=self.t_log, parent_id=eqn.selected_parent_id)
         eqn.pull_grouped_data()
         eqn.set_records_for_parent()
-        new = eqn.selected_data_records[-1]
-        self.parent().addItem(new.name)
         super().accept()
 
     def reject(self) -> None:
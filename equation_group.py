@@ -13,9 +13,9 @@ from typing import Optional
 from pandas import DataFrame, read_sql
 from psycopg2.sql import SQL, Identifier, Placeholder, Composed
 from psycopg2 import OperationalError
-from psycopg2.extras import NamedTupleCursor
-from time_logging import TimeLogger
-from db_utils import my_connect
+from query_stats import InstrumentedNamedTupleCursor
+from time_logging import TimeLogger, span
+from db_utils import my_connect, db_connection
 
 
 class NoRecordIDError(UserWarning):
@@ -30,7 +30,6 @@ def generic_pull_data(table_name: str = None, my_conn: Optional[dict] = None,
         t_log = TimeLogger()
 
     my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-    conn = my_conn['conn']
 
     table_id_name: str = table_name + '_id'
 
@@ -39,7 +38,8 @@ def generic_pull_data(table_name: str = None, my_conn: Optional[dict] = None,
     if verbose is True:
         t_log.new_event('Loading Equation Group Data')
 
-    data_df = read_sql(query, con=conn, index_col=table_id_name)
+    with db_connection(my_conn) as conn, span('read_sql', 'db', table=table_name):
+        data_df = read_sql(query, con=conn, index_col=table_id_name)
 
     if verbose is True:
         t_log.new_event('Finished Equation Group Data')
@@ -62,7 +62,6 @@ def generic_new_record_db(table_name: str = None, data_df: Optional[DataFrame] =
         t_log = TimeLogger()
 
     my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-    conn = my_conn['conn']
     db_params = my_conn['db_params']
 
     if new_record is None:
@@ -82,22 +81,23 @@ def generic_new_record_db(table_name: str = None, data_df: Optional[DataFrame] =
                          fields=SQL(', ').join(map(Identifier, new_record.keys())),
                          values=SQL(', ').join(map(Placeholder, new_record.keys())))
 
-    if verbose:
-        print(query.as_string(conn))
+    with db_connection(my_conn) as conn:
+        if verbose:
+            print(query.as_string(conn))
 
-    cur = conn.cursor(cursor_factory=NamedTupleCursor)
+        cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-    if verbose:
-        t_log.new_event('Adding new record to Table: {aTable}'.format(aTable=table_name))
+        if verbose:
+            t_log.new_event('Adding new record to Table: {aTable}'.format(aTable=table_name))
 
-    try:
-        cur.execute(query, new_record)
-    except OperationalError as error:
-        print(error)
+        try:
+            cur.execute(query, new_record)
+        except OperationalError as error:
+            print(error)
 
-    # new_records = cur.fetchall()
-    conn.commit()
-    cur.close()
+        # new_records = cur.fetchall()
+        conn.commit()
+        cur.close()
 
     updated_df = \
         generic_pull_data(table_name=table_name, my_conn=my_conn, t_log=t_log, verbose=verbose)
@@ -169,7 +169,6 @@ class EquationGroup:
             t_log = TimeLogger()
 
         my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-        conn = my_conn['conn']
         db_params = my_conn['db_params']
 
         if where_key is None:
@@ -215,19 +214,20 @@ class EquationGroup:
 
                 data.update(where_key=an_id)
 
-                cur = conn.cursor(cursor_factory=NamedTupleCursor)
+                with db_connection(my_conn) as conn:
+                    cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-                if verbose:
-                    print(query.as_string(conn))
-                    print(cur.mogrify(query, data))
+                    if verbose:
+                        print(query.as_string(conn))
+                        print(cur.mogrify(query, data))
 
-                try:
-                    cur.execute(query, data)
-                except OperationalError as error:
-                    print(error)
+                    try:
+                        cur.execute(query, data)
+                    except OperationalError as error:
+                        print(error)
 
-                conn.commit()
+                    conn.commit()
 
-                cur.close()
+                    cur.close()
 
                 self.pull_data()
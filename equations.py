@@ -13,9 +13,10 @@ from physics_objects import PhysicsObject, PhysicsObjects
 from latex_data import LatexData
 from time_logging import TimeLogger
 
+# Rows of grouped_data, which leaves the image, thumbnail and svg blobs in the database
 GroupedEquationRecord = namedtuple(
     'GroupedEquationRecord', ['code_file_path', 'insertion_order', 'insertion_order_prev',
-                              'insertion_date', 'inserted_by', 'name', 'latex', 'notes', 'image',
+                              'insertion_date', 'inserted_by', 'name', 'latex', 'notes',
                               'template_id', 'image_is_dirty', 'created_at', 'created_by',
                               'modified_at', 'modified_by', 'compiled_at', 'dimensions', 'unit_id',
                               'type_name', 'associated_code_file', 'latex_obj'])
@@ -7,16 +7,30 @@ __author__ = "William DeShazer"
 __version__ = "0.1.0"
 __license__ = "MIT"
 
+import atexit
+from datetime import datetime
 from warnings import warn
-from typing import NewType, List, NamedTuple, Optional
-from pandas import DataFrame, Series, read_sql
+from functools import partial
+from concurrent.futures import Future, wait
+from typing import NewType, List, NamedTuple, Optional, Union, Dict, Iterable
+from pandas import DataFrame, Series, read_sql, concat, isna
 from psycopg2.sql import SQL, Identifier, Placeholder, Composed
 from psycopg2 import OperationalError
-from psycopg2.extras import NamedTupleCursor
+from psycopg2.extras import execute_values
+from query_stats import InstrumentedNamedTupleCursor
 
-from db_utils import my_connect
-from latex_data import LatexData
-from time_logging import TimeLogger
+from db_utils import my_connect, db_connection, table_columns
+from image_store import ImageStore, image_store, THUMBNAIL, SVG
+from latex_data import (
+    LatexData, available_templates, template_data, latex_data_column, vector_output, records_recompiled
+)
+from rasterize import make_thumbnail
+from render_farm import RenderFarm, render_farm
+from snapshot import Snapshot
+from search import SearchHit, search_records, SEARCH_LIMIT
+from time_logging import TimeLogger, span
+
+ORDER_GAP = 1024  # distance between neighbouring insertion_order keys after a renumber
 
 
 class RecordIDTypeError(UserWarning):
@@ -35,14 +49,24 @@ class NoGroupRecordAssociationsError(UserWarning):
     """UserWarning for EquationGroup"""
 
 
+class RecordNotInGroupError(UserWarning):
+    """UserWarning for EquationGroup"""
+
+
+class InsertionOrderError(UserWarning):
+    """UserWarning for EquationGroup"""
+
+
 Record = NewType("Record", NamedTuple)
 Records = NewType("Records", List[Record])
 
 
-def generic_pull_grouped_data(table_name: str = None, parent_table_name: str = None,
-                              verbose: bool = False, my_conn: Optional[dict] = None,
-                              t_log: Optional[TimeLogger] = None) -> DataFrame:
-    """Multi-index Extract DataFrame DB"""
+def generic_pull_grouped_data(table_name: str = None, parent_table_name: str = None, with_images: bool = False,
+                              ids: Optional[Iterable[int]] = None, verbose: bool = False,
+                              my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None) -> DataFrame:
+    """Multi-index Extract DataFrame DB. Images are left in the database unless with_images is set, they are
+       fetched on demand through the table's image store instead. ids limits the pull to those records, with every
+       association they have"""
 
     table_id_name: str = table_name + '_id'
     parent_id_name: str = parent_table_name + '_id'
@@ -52,11 +76,27 @@ def generic_pull_grouped_data(table_name: str = None, parent_table_name: str = N
         t_log = TimeLogger()
 
     my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-    conn = my_conn['conn']
 
-    sql = 'SELECT * FROM {join_table} RIGHT JOIN {table} USING({table_id})'
+    sql = 'SELECT {fields} FROM {join_table} RIGHT JOIN {table} USING({table_id})'
+    params = None
+    if ids is not None:
+        sql += ' WHERE {table}.{table_id} = ANY(%s)'
+        params = ([int(an_id) for an_id in ids],)
+
+    if with_images is True:
+        fields = SQL('*')
+    else:
+        # Same columns, in the same order, as SELECT * would give, less the image, thumbnail and svg blobs
+        fields = SQL(', ').join(
+            [Identifier(table_id_name)] +
+            [Identifier(join_table, column) for column in table_columns(join_table, my_conn=my_conn)
+             if column != table_id_name] +
+            [Identifier(table_name, column) for column in table_columns(table_name, my_conn=my_conn)
+             if column not in (table_id_name, 'image', THUMBNAIL, SVG)]
+        )
 
     query = SQL(sql).format(
+        fields=fields,
         table=Identifier(table_name),
         join_table=Identifier(join_table),
         table_id=Identifier(table_id_name)
@@ -65,16 +105,12 @@ def generic_pull_grouped_data(table_name: str = None, parent_table_name: str = N
     if verbose is True:
         t_log.new_event('Loading Database: ' + table_name)
 
-    data_df = read_sql(query, con=conn, index_col=[parent_id_name, table_id_name])
+    with db_connection(my_conn) as conn, span('read_sql', 'db', table=table_name):
+        data_df = read_sql(query, con=conn, params=params, index_col=[parent_id_name, table_id_name])
     # This was a good example of loading objects to file
     # data_df['latex'] = data_df['latex'].apply(loads)
 
-    data_df['latex_obj'] = None
-
-    for row in data_df.itertuples():
-        data_df.loc[row.Index, 'latex_obj'] = \
-            LatexData(my_conn=my_conn, latex=row.latex, template_id=row.template_id,
-                      image=row.image, compiled_at=row.compiled_at)
+    data_df['latex_obj'] = _latex_obj_column(data_df, table_name, my_conn=my_conn, t_log=t_log, verbose=verbose)
 
     data_df.sort_values([parent_id_name, 'insertion_order', 'created_at'], inplace=True)
 
@@ -84,12 +120,133 @@ def generic_pull_grouped_data(table_name: str = None, parent_table_name: str = N
     return data_df
 
 
+def _latex_obj_column(data_df: DataFrame, table_name: str, my_conn: Optional[dict] = None,
+                      t_log: Optional[TimeLogger] = None, verbose: bool = False) -> list:
+    images = image_store(table_name)
+    return latex_data_column(data_df, image_loader=partial(images.get, my_conn=my_conn),
+                             images_loader=partial(images.get_many, my_conn=my_conn), id_name=table_name + '_id',
+                             my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+
+def _order_key(value) -> Optional[int]:
+    # NULL comes back as None from a cursor and as NaN out of a frame
+    return None if value is None or value != value else int(value)
+
+
+def generic_snapshot_changes(data_df: DataFrame, stamp: datetime, table_name: str = None,
+                             parent_table_name: str = None, my_conn: Optional[dict] = None,
+                             t_log: Optional[TimeLogger] = None, verbose: bool = False) -> List[int]:
+    """Ids whose rows differ between a snapshot and the database. Rows modified after stamp, plus every record whose
+       associations or insertion_order changed, was added or was deleted, found by listing the ids and keys only"""
+    table_id_name: str = table_name + '_id'
+    parent_id_name: str = parent_table_name + '_id'
+    join_table: str = table_name + '_' + parent_table_name
+
+    modified_query = SQL('SELECT {table_id} FROM {table} WHERE modified_at > %s').format(
+        table=Identifier(table_name), table_id=Identifier(table_id_name))
+    membership_query = SQL('SELECT {table_id}, {join_table}.{parent_id}, {join_table}.insertion_order '
+                           'FROM {join_table} RIGHT JOIN {table} USING({table_id})').format(
+        table=Identifier(table_name), join_table=Identifier(join_table), table_id=Identifier(table_id_name),
+        parent_id=Identifier(parent_id_name))
+
+    if verbose is True:
+        t_log.new_event('Checking snapshot of: ' + table_name)
+
+    with db_connection(my_conn) as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(modified_query, (stamp,))
+            changed = {row[0] for row in cur.fetchall()}
+            cur.execute(membership_query)
+            rows = cur.fetchall()
+        except OperationalError as error:
+            print(error)
+            rows = []
+        cur.close()
+
+    current: Dict[int, set] = {}
+    for an_id, parent_id, insertion_order in rows:
+        current.setdefault(an_id, set()).add((_order_key(parent_id), _order_key(insertion_order)))
+
+    saved: Dict[int, set] = {}
+    parent_ids = data_df.index.get_level_values(parent_id_name)
+    an_ids = data_df.index.get_level_values(table_id_name)
+    for parent_id, an_id, insertion_order in zip(parent_ids, an_ids, data_df['insertion_order']):
+        saved.setdefault(int(an_id), set()).add((_order_key(parent_id), _order_key(insertion_order)))
+
+    changed.update(an_id for an_id in current.keys() | saved.keys() if current.get(an_id) != saved.get(an_id))
+
+    if verbose is True:
+        t_log.new_event('{} changed records since snapshot of: {}'.format(len(changed), table_name))
+
+    return sorted(changed)
+
+
+def generic_snapshot_pull_grouped_data(snapshot: Snapshot, table_name: str = None, parent_table_name: str = None,
+                                       verbose: bool = False, my_conn: Optional[dict] = None,
+                                       t_log: Optional[TimeLogger] = None) -> DataFrame:
+    """Grouped data from the local snapshot, brought up to date by re-reading only the rows that changed since it
+       was written. Falls back to a full pull when there is no usable snapshot"""
+    if verbose is True and t_log is None:
+        t_log = TimeLogger()
+
+    my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
+    saved = snapshot.load(my_conn['db_params'])
+    if saved is None:
+        return generic_pull_grouped_data(table_name=table_name, parent_table_name=parent_table_name,
+                                         my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    data_df: DataFrame = saved['data']
+    changed = generic_snapshot_changes(data_df, saved['stamp'], table_name=table_name,
+                                       parent_table_name=parent_table_name, my_conn=my_conn, t_log=t_log,
+                                       verbose=verbose)
+
+    changed_ids = set(changed)
+    image_store(table_name).restore({an_id: image for an_id, image in saved['images'].items()
+                                     if an_id not in changed_ids})
+    image_store(table_name, THUMBNAIL).restore({an_id: image for an_id, image in saved.get('thumbnails', {}).items()
+                                                if an_id not in changed_ids})
+
+    data_df['latex_obj'] = _latex_obj_column(data_df, table_name, my_conn=my_conn, t_log=t_log, verbose=verbose)
+    if len(changed) > 0:
+        data_df = generic_refresh_grouped_data(data_df=data_df, ids=changed, table_name=table_name,
+                                               parent_table_name=parent_table_name, my_conn=my_conn, t_log=t_log,
+                                               verbose=verbose)
+
+    return data_df
+
+
+def generic_refresh_grouped_data(data_df: Optional[DataFrame] = None, ids: Iterable[int] = None,
+                                 table_name: str = None, parent_table_name: str = None, verbose: bool = False,
+                                 my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None) -> DataFrame:
+    """Apply a change to data_df without reloading the table. Only the records in ids are read back, every row
+       data_df holds for them is replaced with what the database has now. Without a data_df the whole table is
+       pulled"""
+    if data_df is None:
+        return generic_pull_grouped_data(table_name=table_name, parent_table_name=parent_table_name,
+                                         my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    table_id_name: str = table_name + '_id'
+    parent_id_name: str = parent_table_name + '_id'
+    ids = [int(an_id) for an_id in ids]
+
+    changed_df = generic_pull_grouped_data(table_name=table_name, parent_table_name=parent_table_name, ids=ids,
+                                           my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    kept_df = data_df[~data_df.index.get_level_values(table_id_name).isin(ids)]
+    data_df = concat([kept_df, changed_df])
+    data_df.sort_values([parent_id_name, 'insertion_order', 'created_at'], inplace=True)
+
+    return data_df
+
+
 def generic_associate_parent(parent_id: int = None, child_id: int = None,
                              table_name: str = None, parent_table_name: str = None,
                              insertion_order: int = None, inserted_by: str = None,
-                             new_record: dict = None, verbose: bool = False,
+                             new_record: dict = None, data_df: Optional[DataFrame] = None, verbose: bool = False,
                              my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None):
-    """Associate the parent and child tables using parent id. Insertion_order and inserted_by are optional"""
+    """Associate the parent and child tables using parent id. Insertion_order and inserted_by are optional.
+       Passing the current data_df patches it instead of reloading the table"""
     parent_key = parent_table_name + '_id'
     self_key = table_name + '_id'
 
@@ -99,7 +256,6 @@ def generic_associate_parent(parent_id: int = None, child_id: int = None,
         t_log = TimeLogger()
 
     my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-    conn = my_conn['conn']
     db_params = my_conn['db_params']
 
     if new_record is None:
@@ -122,22 +278,23 @@ def generic_associate_parent(parent_id: int = None, child_id: int = None,
                             fields=SQL(', ').join(map(Identifier, keys)),
                             values=SQL(', ').join(map(Placeholder, keys)))
 
-    cur = conn.cursor(cursor_factory=NamedTupleCursor)
+    with db_connection(my_conn) as conn:
+        cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-    if verbose is True:
-        t_log.new_event('Associating Tables: ' + join_table)
+        if verbose is True:
+            t_log.new_event('Associating Tables: ' + join_table)
 
-    try:
-        cur.execute(query, new_record)
-    except OperationalError as error:
-        print(error)
+        try:
+            cur.execute(query, new_record)
+        except OperationalError as error:
+            print(error)
 
-    conn.commit()
-    cur.close()
+        conn.commit()
+        cur.close()
 
     data_df = \
-        generic_pull_grouped_data(table_name=table_name, parent_table_name=parent_table_name,
-                                  my_conn=my_conn, t_log=t_log, verbose=verbose)
+        generic_refresh_grouped_data(data_df=data_df, ids=[child_id], table_name=table_name,
+                                     parent_table_name=parent_table_name, my_conn=my_conn, t_log=t_log, verbose=verbose)
 
     if verbose is True:
         t_log.new_event('Finished Associating: ' + join_table)
@@ -147,9 +304,11 @@ def generic_associate_parent(parent_id: int = None, child_id: int = None,
 
 def generic_disassociate_parent(parent_id: int = None, child_id: int = None,
                                 table_name: str = None, parent_table_name: str = None,
+                                data_df: Optional[DataFrame] = None,
                                 my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
                                 verbose: bool = False):
-    """Associate the parent and child tables using parent id. Insertion_order and inserted_by are optional"""
+    """Associate the parent and child tables using parent id. Insertion_order and inserted_by are optional.
+       Passing the current data_df patches it instead of reloading the table"""
     parent_key = parent_table_name + '_id'
     self_key = table_name + '_id'
 
@@ -159,7 +318,6 @@ def generic_disassociate_parent(parent_id: int = None, child_id: int = None,
         t_log = TimeLogger()
 
     my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-    conn = my_conn['conn']
 
     sql = 'DELETE FROM {table} WHERE ({self_id}, {parent_id}) = (%s, %s)'
 
@@ -167,23 +325,24 @@ def generic_disassociate_parent(parent_id: int = None, child_id: int = None,
                             self_id=Identifier(self_key),
                             parent_id=Identifier(parent_key))
 
-    cur = conn.cursor(cursor_factory=NamedTupleCursor)
+    with db_connection(my_conn) as conn:
+        cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-    if verbose is True:
-        print(query.as_string(conn))
-        print(cur.mogrify(query, (child_id, parent_id)))
-        t_log.new_event('Disassociating Tables: ' + join_table)
+        if verbose is True:
+            print(query.as_string(conn))
+            print(cur.mogrify(query, (child_id, parent_id)))
+            t_log.new_event('Disassociating Tables: ' + join_table)
 
-    try:
-        cur.execute(query, (child_id, parent_id))
-    except OperationalError as error:
-        print(error)
+        try:
+            cur.execute(query, (child_id, parent_id))
+        except OperationalError as error:
+            print(error)
 
-    conn.commit()
+        conn.commit()
 
     data_df = \
-        generic_pull_grouped_data(table_name=table_name, parent_table_name=parent_table_name,
-                                  my_conn=my_conn, t_log=t_log, verbose=verbose)
+        generic_refresh_grouped_data(data_df=data_df, ids=[child_id], table_name=table_name,
+                                     parent_table_name=parent_table_name, my_conn=my_conn, t_log=t_log, verbose=verbose)
 
     if verbose is True:
         t_log.new_event('Finished disassociating: ' + join_table)
@@ -191,6 +350,54 @@ def generic_disassociate_parent(parent_id: int = None, child_id: int = None,
     return data_df
 
 
+def generic_order_key(lower: Optional[int] = None, upper: Optional[int] = None) -> Optional[int]:
+    """insertion_order key that sorts between lower and upper, either of which may be missing at the ends of a group.
+       None when the two are adjacent and the group needs renumbering first"""
+    if lower is None and upper is None:
+        return ORDER_GAP
+    if lower is None:
+        return upper - ORDER_GAP
+    if upper is None:
+        return lower + ORDER_GAP
+    if upper - lower < 2:
+        return None
+    return (lower + upper) // 2
+
+
+def generic_set_insertion_order(rows: List[tuple], table_name: str = None, parent_table_name: str = None,
+                                my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
+                                verbose: bool = False):
+    """Write (child_id, parent_id, insertion_order) rows to the join table in a single statement"""
+    join_table: str = table_name + '_' + parent_table_name
+
+    if verbose is True and t_log is None:
+        t_log = TimeLogger()
+
+    sql = 'UPDATE {table} SET insertion_order = data.insertion_order ' \
+          'FROM (VALUES %s) AS data ({c_table_id}, {p_table_id}, insertion_order) ' \
+          'WHERE ({table}.{c_table_id}, {table}.{p_table_id}) = (data.{c_table_id}, data.{p_table_id})'
+
+    query = SQL(sql).format(table=Identifier(join_table),
+                            c_table_id=Identifier(table_name + '_id'),
+                            p_table_id=Identifier(parent_table_name + '_id')
+                            )
+
+    with db_connection(my_conn) as conn:
+        cur = conn.cursor()
+
+        if verbose is True:
+            t_log.new_event('Updating Insertion order for: ' + join_table)
+            print(query.as_string(conn))
+
+        try:
+            execute_values(cur, query, rows, page_size=max(len(rows), 1))
+        except OperationalError as error:
+            print(error)
+
+        conn.commit()
+        cur.close()
+
+
 def generic_last_equation_number(table_data: DataFrame) -> int:
     """Record Count using dataframe"""
     if len(table_data.index) == 0:
@@ -218,7 +425,6 @@ def generic_new_record_db(parent_id: int = None, table_name: str = None, parent_
         new_record = {}
 
     my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-    conn = my_conn['conn']
     db_params = my_conn['db_params']
 
     table_id = table_name + '_id'
@@ -233,7 +439,8 @@ def generic_new_record_db(parent_id: int = None, table_name: str = None, parent_
         latex = LatexData()
 
     new_record.update(name=name, notes=notes, dimensions=dimensions, unit_id=unit_id,  type_name='Unassigned',
-                      latex=latex.latex, image=latex.image, compiled_at=latex.compiled_at,
+                      latex=latex.latex, image=latex.image, thumbnail=latex.thumbnail_image(),
+                      **add_field(SVG, latex.vector_image()), compiled_at=latex.compiled_at,
                       template_id=latex.template_id, created_by=created_by)
 
     query = SQL('INSERT INTO {table} ({fields}) VALUES ({values}) RETURNING *'
@@ -241,22 +448,23 @@ def generic_new_record_db(parent_id: int = None, table_name: str = None, parent_
                          fields=SQL(', ').join(map(Identifier, new_record.keys())),
                          values=SQL(', ').join(map(Placeholder, new_record.keys())))
 
-    if verbose:
-        print(query.as_string(conn))
+    with db_connection(my_conn) as conn:
+        if verbose:
+            print(query.as_string(conn))
 
-    cur = conn.cursor(cursor_factory=NamedTupleCursor)
+        cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-    if verbose:
-        print('Adding new record to Table: {aTable}'.format(aTable=table_name))
+        if verbose:
+            print('Adding new record to Table: {aTable}'.format(aTable=table_name))
 
-    try:
-        cur.execute(query, new_record)
-    except OperationalError as error:
-        print(error)
+        try:
+            cur.execute(query, new_record)
+        except OperationalError as error:
+            print(error)
 
-    new_records = cur.fetchall()
-    conn.commit()
-    cur.close()
+        new_records = cur.fetchall()
+        conn.commit()
+        cur.close()
     updated_df: Optional[DataFrame] = None
 
     if parent_id is not None:
@@ -265,12 +473,14 @@ def generic_new_record_db(parent_id: int = None, table_name: str = None, parent_
                                                   parent_id=parent_id, child_id=getattr(record, table_id),
                                                   insertion_order=insertion_order,
                                                   table_name=table_name, parent_table_name=parent_table_name,
-                                                  inserted_by=created_by, verbose=verbose
+                                                  inserted_by=created_by, data_df=data_df, verbose=verbose
                                                   )
+            data_df = updated_df
     else:
         updated_df = \
-            generic_pull_grouped_data(table_name=table_name, parent_table_name=parent_table_name,
-                                      my_conn=my_conn, t_log=t_log, verbose=verbose)
+            generic_refresh_grouped_data(data_df=data_df, ids=[getattr(record, table_id) for record in new_records],
+                                         table_name=table_name, parent_table_name=parent_table_name,
+                                         my_conn=my_conn, t_log=t_log, verbose=verbose)
 
     return updated_df
 
@@ -287,8 +497,8 @@ class GroupedPhysicsObject:
     """Base class for Equations, Variables, and Units"""
     def __init__(self, table_name: str, parent_table_name: str,
                  my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
-                 verbose: bool = False,):
-        """Constructor for MathObject"""
+                 verbose: bool = False, use_snapshot: bool = False):
+        """Constructor for MathObject. use_snapshot starts from the local snapshot and saves a new one at exit"""
         self.table_name = table_name
         self.parent_table_name = parent_table_name  # For equations it is eqn_group. For variables it is equations
         self.grouped_data: Optional[DataFrame] = None
@@ -296,9 +506,16 @@ class GroupedPhysicsObject:
         self.selected_parent_id: Optional[int] = None
         self.selected_data_records: Optional[Records] = None
         self.records_not_selected_unique: Optional[Records] = None
+        self.images: ImageStore = image_store(table_name)
+        self.thumbnails: ImageStore = image_store(table_name, THUMBNAIL)
+        self.vectors: ImageStore = image_store(table_name, SVG)
+        self.snapshot: Optional[Snapshot] = Snapshot(table_name) if use_snapshot is True else None
         self.my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
         self.pull_grouped_data(my_conn=my_conn, t_log=t_log, verbose=verbose)
 
+        if self.snapshot is not None:
+            atexit.register(self.save_snapshot)
+
     def id_name(self):
         """Convenience method to return id_name"""
         return self.table_name + '_id'
@@ -311,16 +528,90 @@ class GroupedPhysicsObject:
                           verbose: bool = False):
         """Extract grouped data from database"""
 
+        if my_conn is None:
+            my_conn = self.my_conn
+        else:
+            self.my_conn = my_conn
+
+        if self.snapshot is not None and self.grouped_data is None:
+            self.grouped_data = \
+                generic_snapshot_pull_grouped_data(self.snapshot, table_name=self.table_name,
+                                                   parent_table_name=self.parent_table_name,
+                                                   my_conn=my_conn, t_log=t_log, verbose=verbose)
+        else:
+            self.grouped_data = \
+                generic_pull_grouped_data(table_name=self.table_name, parent_table_name=self.parent_table_name,
+                                          my_conn=my_conn, t_log=t_log, verbose=verbose)
+        self._set_all_records()
+
+    def save_snapshot(self):
+        """Write grouped_data and the cached images and thumbnails to the local snapshot"""
+        if self.snapshot is not None and self.grouped_data is not None:
+            self.snapshot.save(self.grouped_data, self.my_conn['db_params'], images=self.images.snapshot(),
+                               thumbnails=self.thumbnails.snapshot())
+
+    def refresh_records(self, ids: List[int], my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
+                        verbose: bool = False):
+        """Re-read only the records in ids and patch them into grouped_data"""
         if my_conn is None:
             my_conn = self.my_conn
         else:
             self.my_conn = my_conn
 
         self.grouped_data = \
-            generic_pull_grouped_data(table_name=self.table_name, parent_table_name=self.parent_table_name,
-                                      my_conn=my_conn, t_log=t_log, verbose=verbose)
+            generic_refresh_grouped_data(data_df=self.grouped_data, ids=ids, table_name=self.table_name,
+                                         parent_table_name=self.parent_table_name,
+                                         my_conn=my_conn, t_log=t_log, verbose=verbose)
         self._set_all_records()
 
+    def search(self, text: str, parent_id: Optional[int] = None, limit: int = SEARCH_LIMIT,
+               my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
+               verbose: bool = False) -> List[SearchHit]:
+        """Best matches for text, searched in the database rather than grouped_data. parent_id limits the search to
+           one group"""
+        if my_conn is None:
+            my_conn = self.my_conn
+        return search_records(text, self.table_name, parent_table_name=self.parent_table_name, parent_id=parent_id,
+                              limit=limit, my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    def image(self, an_id: int, my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
+              verbose: bool = False) -> Optional[bytes]:
+        """Image for a record. Images aren't part of grouped_data, they are fetched by id and kept in a bounded
+           cache"""
+        if my_conn is None:
+            my_conn = self.my_conn
+        return self.images.get(an_id, my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    def load_images(self, ids: List[int], my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
+                    verbose: bool = False) -> Dict[int, Optional[bytes]]:
+        """Images for many records with a single query for everything not already cached"""
+        if my_conn is None:
+            my_conn = self.my_conn
+        return self.images.get_many(ids, my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    def thumbnail(self, an_id: int, my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
+                  verbose: bool = False) -> Optional[bytes]:
+        """Thumbnail for a record, what lists and tables show instead of the full image"""
+        if my_conn is None:
+            my_conn = self.my_conn
+        return self.thumbnails.get(an_id, my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    def load_thumbnails(self, ids: List[int], my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
+                        verbose: bool = False) -> Dict[int, Optional[bytes]]:
+        """Thumbnails for many records with a single query for everything not already cached"""
+        if my_conn is None:
+            my_conn = self.my_conn
+        return self.thumbnails.get_many(ids, my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    def vector(self, an_id: int, my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
+               verbose: bool = False) -> Optional[bytes]:
+        """Gzip compressed SVG for a record. None unless vector_output() is on and the record has one"""
+        if not vector_output():
+            return None
+        if my_conn is None:
+            my_conn = self.my_conn
+        return self.vectors.get(an_id, my_conn=my_conn, t_log=t_log, verbose=verbose)
+
     def associate_parent(self, parent_id: int = None, child_id: int = None, new_record: dict = None,
                          insertion_order: int = None, inserted_by: str = None,
                          my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None, verbose: bool = False):
@@ -337,7 +628,8 @@ class GroupedPhysicsObject:
             generic_associate_parent(parent_id=parent_id, child_id=child_id, new_record=new_record,
                                      table_name=table_name, parent_table_name=parent_table_name,
                                      insertion_order=insertion_order, inserted_by=inserted_by,
-                                     my_conn=my_conn, t_log=t_log, verbose=verbose)
+                                     data_df=self.grouped_data, my_conn=my_conn, t_log=t_log, verbose=verbose)
+        self._set_all_records()
 
         if self.selected_parent_id is not None:
             self.set_records_for_parent(parent_id=int(self.selected_parent_id))
@@ -357,20 +649,25 @@ class GroupedPhysicsObject:
         self.grouped_data = \
             generic_disassociate_parent(parent_id=parent_id, child_id=child_id,
                                         table_name=table_name, parent_table_name=parent_table_name,
-                                        my_conn=my_conn, t_log=t_log, verbose=verbose)
+                                        data_df=self.grouped_data, my_conn=my_conn, t_log=t_log, verbose=verbose)
+        self._set_all_records()
 
         if self.selected_parent_id is not None:
             self.set_records_for_parent(parent_id=int(self.selected_parent_id))
 
-    def new_record(self, parent_id: int = None, name: str = None, latex: LatexData = None,
+    def new_record(self, parent_id: int = None, name: str = None, latex: Union[LatexData, Future] = None,
                    new_record: dict = None, notes: str = None, dimensions: int = 1,
                    insertion_order: int = None, created_by: str = None,
                    my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
                    unit_id: int = 1, verbose: bool = None):
-        """Insert a new_record Into """
+        """Insert a new_record Into. latex may be a render farm future from submit_latex_data, in which case the
+           compile overlaps with whatever the caller did before inserting"""
         table_name = self.table_name
         parent_table_name = self.parent_table_name
 
+        if isinstance(latex, Future):
+            latex = latex.result()
+
         if my_conn is None:
             my_conn = self.my_conn
         else:
@@ -384,6 +681,84 @@ class GroupedPhysicsObject:
                 insertion_order=insertion_order, created_by=created_by,
                 my_conn=my_conn, t_log=t_log, verbose=verbose
             )
+        self._set_all_records()
+
+    def recompile_images(self, template_id: int = None, farm: Optional[RenderFarm] = None,
+                         my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None, verbose: bool = False):
+        """Recompile every record on the render farm and write all images back in one statement.
+           template_id moves every record to that template, otherwise each record keeps its own"""
+        if verbose is True and t_log is None:
+            t_log = TimeLogger()
+
+        if my_conn is None:
+            my_conn = self.my_conn
+        else:
+            self.my_conn = my_conn
+
+        if farm is None:
+            farm = render_farm()
+
+        my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+        if verbose is True:
+            t_log.new_event('Submitting {} compiles for: {}'.format(len(self.all_records), self.table_name))
+
+        # A NULL template_id reads back as NaN. Those records get the latest template, as a LatexData without one does
+        default_template_id = template_id
+        if default_template_id is None and self.all_records.template_id.isna().any():
+            default_template_id = available_templates(my_conn=my_conn, t_log=t_log, verbose=verbose)[-1]
+
+        jobs = []
+        vector_jobs = {}
+        for an_id, row in self.all_records.iterrows():
+            rcd_template_id = int(default_template_id if template_id is not None or isna(row.template_id)
+                                  else row.template_id)
+            a_template = template_data(version=rcd_template_id, my_conn=my_conn, t_log=t_log, verbose=verbose)
+            jobs.append((int(an_id), rcd_template_id, farm.submit(row.latex, a_template)))
+            if vector_output():
+                vector_jobs[int(an_id)] = farm.submit(row.latex, a_template, output=SVG)
+
+        wait([job[2] for job in jobs] + list(vector_jobs.values()))
+
+        if verbose is True:
+            t_log.new_event('Finished compiles for: ' + self.table_name)
+
+        sql = 'UPDATE {table} SET image = data.image, thumbnail = data.thumbnail, template_id = data.template_id, ' \
+              'compiled_at = now() FROM (VALUES %s) AS data ({table_id}, image, thumbnail, template_id) ' \
+              'WHERE {table}.{table_id} = data.{table_id}'
+
+        query = SQL(sql).format(table=Identifier(self.table_name), table_id=Identifier(self.id_name()))
+
+        vector_sql = 'UPDATE {table} SET svg = data.svg FROM (VALUES %s) AS data ({table_id}, svg) ' \
+                     'WHERE {table}.{table_id} = data.{table_id}'
+        vector_query = SQL(vector_sql).format(table=Identifier(self.table_name), table_id=Identifier(self.id_name()))
+
+        thumbnails = {an_id: make_thumbnail(future.result()) for an_id, _, future in jobs}
+
+        with db_connection(my_conn) as conn:
+            cur = conn.cursor()
+
+            try:
+                execute_values(cur, query, [(an_id, future.result(), thumbnails[an_id], rcd_template_id)
+                                            for an_id, rcd_template_id, future in jobs])
+                if len(vector_jobs) > 0:
+                    execute_values(cur, vector_query, [(an_id, future.result())
+                                                       for an_id, future in vector_jobs.items()])
+            except OperationalError as error:
+                print(error)
+
+            conn.commit()
+            cur.close()
+
+        for an_id, _, future in jobs:
+            self.images.put(an_id, future.result())
+            self.thumbnails.put(an_id, thumbnails[an_id])
+        for an_id, future in vector_jobs.items():
+            self.vectors.put(an_id, future.result())
+        ids = [an_id for an_id, _, _ in jobs]
+        records_recompiled(self.table_name, ids)
+
+        self.refresh_records(ids, my_conn=my_conn, t_log=t_log, verbose=verbose)
 
     def _set_all_records(self):
         self.all_records = self.grouped_data.drop_duplicates('name').droplevel(self.parent_table_id_name()).sort_index()
@@ -409,7 +784,6 @@ class GroupedPhysicsObject:
                 self.my_conn = my_conn
 
             my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-            conn = my_conn['conn']
             db_params = my_conn['db_params']
 
             data.update(add_field('name', name))
@@ -417,6 +791,8 @@ class GroupedPhysicsObject:
             if latex is not None:
                 data.update(latex=latex.latex)
                 data.update(image=latex.image)
+                data.update(thumbnail=latex.thumbnail_image())
+                data.update(add_field(SVG, latex.vector_image()))
                 data.update(template_id=latex.template_id)
                 data.update(compiled_at=latex.compiled_at)
             data.update(add_field('dimensions', dimensions))
@@ -449,22 +825,32 @@ class GroupedPhysicsObject:
 
                 data.update(where_key=an_id)
 
-                cur = conn.cursor(cursor_factory=NamedTupleCursor)
+                with db_connection(my_conn) as conn:
+                    cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
+
+                    if verbose:
+                        print(query.as_string(conn))
+                        print(cur.mogrify(query, data))
 
-                if verbose:
-                    print(query.as_string(conn))
-                    print(cur.mogrify(query, data))
+                    try:
+                        cur.execute(query, data)
+                    except OperationalError as error:
+                        print(error)
 
-                try:
-                    cur.execute(query, data)
-                except OperationalError as error:
-                    print(error)
+                    conn.commit()
 
-                conn.commit()
+                    cur.close()
 
-                cur.close()
+                if 'image' in data:
+                    # The stored image changed, so the next look up fetches it again
+                    self.images.invalidate(an_id if where_key == self.id_name() else None)
+                    self.thumbnails.invalidate(an_id if where_key == self.id_name() else None)
+                    self.vectors.invalidate(an_id if where_key == self.id_name() else None)
 
-                self.pull_grouped_data(verbose=verbose)
+                if where_key == self.id_name():
+                    self.refresh_records([an_id], my_conn=my_conn, t_log=t_log, verbose=verbose)
+                else:
+                    self.pull_grouped_data(my_conn=my_conn, t_log=t_log, verbose=verbose)
 
     def selected_data_df(self, parent_id: int = None) -> DataFrame:
         """Retern selected data in DataFrame form"""
@@ -542,7 +928,6 @@ class GroupedPhysicsObject:
                 self.my_conn = my_conn
 
             my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-            conn = my_conn['conn']
 
             sql = "SELECT * FROM {parent_table} WHERE {parent_id} IN %s;"
 
@@ -554,10 +939,11 @@ class GroupedPhysicsObject:
             if verbose is True:
                 t_log.new_event('Loading Database: ' + self.parent_table_name)
 
-            cur = conn.cursor(cursor_factory=NamedTupleCursor)
+            with db_connection(my_conn) as conn:
+                cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-            cur.execute(query, (pids, ))
-            records = cur.fetchall()
+                cur.execute(query, (pids, ))
+                records = cur.fetchall()
             if verbose is True:
                 t_log.new_event('Database Loaded: ' + self.parent_table_name)
         else:
@@ -573,8 +959,10 @@ class GroupedPhysicsObject:
 
     def update_insertion_order_for_selected(self, order: dict, my_conn: Optional[dict] = None,
                                             t_log: Optional[TimeLogger] = None, verbose: bool = False):
-        """Populates insertion_order attribute"""
-        self.pull_grouped_data()
+        """Populates insertion_order attribute. order maps names to the insertion_order written for them as is, use
+           move_record or renumber_insertion_order to get sparse keys"""
+        if self.grouped_data is None:
+            self.pull_grouped_data()
         df = self.selected_data_df()
 
         join_table: str = self.table_name + '_' + self.parent_table_name
@@ -589,38 +977,116 @@ class GroupedPhysicsObject:
 
         my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
         self.my_conn = my_conn
-        conn = my_conn['conn']
 
-        sql = 'UPDATE {table} SET insertion_order = %s WHERE ({c_table_id}, {p_table_id}) = (%s, %s)'
+        # One pass over the group instead of a boolean mask per name. The first match wins, as it did before
+        ids_by_name: Dict[str, int] = {}
+        for c_id, name in df.name.items():
+            ids_by_name.setdefault(name, int(c_id))
+        p_id = int(self.selected_parent_id)
+        rows = [(ids_by_name[eq_name], p_id, int(i)) for eq_name, i in order.items()]
+        changed_ids = [row[0] for row in rows]
 
-        query = SQL(sql).format(table=Identifier(join_table),
-                                c_table_id=Identifier(self.id_name()),
-                                p_table_id=Identifier(self.parent_table_id_name())
-                                )
+        generic_set_insertion_order(rows, table_name=self.table_name, parent_table_name=self.parent_table_name,
+                                    my_conn=my_conn, t_log=t_log, verbose=verbose)
 
-        cur = conn.cursor(cursor_factory=NamedTupleCursor)
+        self.refresh_records(changed_ids, my_conn=my_conn, t_log=t_log, verbose=verbose)
 
         if verbose is True:
-            t_log.new_event('Updating Insertion order for: ' + join_table)
-            print(query.as_string(conn))
+            t_log.new_event('Finished Updating Insertion Order: ' + join_table)
 
-        for eq_name, i in order.items():
-            p_id = self.selected_parent_id
-            c_id = int(df.name[df.name == eq_name].index[0])
+    def renumber_insertion_order(self, parent_id: int = None, my_conn: Optional[dict] = None,
+                                 t_log: Optional[TimeLogger] = None, verbose: bool = False):
+        """Spread the keys of a group back out to ORDER_GAP apart, keeping the current order"""
+        if parent_id is None:
+            parent_id = self.selected_parent_id
 
-            if verbose:
-                print(cur.mogrify(query, (i, c_id, p_id)))
-            try:
-                cur.execute(query, (i, c_id, p_id))
-            except OperationalError as error:
-                print(error)
+        if my_conn is None:
+            my_conn = self.my_conn
+        else:
+            self.my_conn = my_conn
 
-        conn.commit()
+        df = self.grouped_data.loc[parent_id, :]
+        rows = [(int(c_id), int(parent_id), (i + 1) * ORDER_GAP) for i, c_id in enumerate(df.index)]
 
-        self.pull_grouped_data()
+        generic_set_insertion_order(rows, table_name=self.table_name, parent_table_name=self.parent_table_name,
+                                    my_conn=my_conn, t_log=t_log, verbose=verbose)
 
-        if verbose is True:
-            t_log.new_event('Finished Updating Insertion Order: ' + join_table)
+        self.refresh_records([row[0] for row in rows], my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    def move_record(self, child_id: int, before_id: int = None, after_id: int = None, parent_id: int = None,
+                    my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None, verbose: bool = False):
+        """Place child_id directly before before_id or directly after after_id within a group, at its end when
+           neither is given. Only the moved join row is written, unless the keys around the new spot have run out
+           and the group is renumbered"""
+        if parent_id is None:
+            parent_id = self.selected_parent_id
+
+        if my_conn is None:
+            my_conn = self.my_conn
+        else:
+            self.my_conn = my_conn
+
+        child_id = int(child_id)
+        target_id = before_id if before_id is not None else after_id
+        if target_id is not None and int(target_id) == child_id:
+            return  # a record is already next to itself
+
+        df = self.grouped_data.loc[parent_id, :]
+        if child_id not in df.index or (target_id is not None and int(target_id) not in df.index):
+            warn('Record {} or {} is not in group {} of {}'.format(child_id, target_id, parent_id,
+                                                                   self.parent_table_name), RecordNotInGroupError)
+            return
+
+        if df.insertion_order[df.index != child_id].isnull().any():
+            self.renumber_insertion_order(parent_id=parent_id, my_conn=my_conn, t_log=t_log, verbose=verbose)
+            df = self.grouped_data.loc[parent_id, :]
+
+        key = self._move_key(df, child_id, before_id=before_id, after_id=after_id)
+        if key is None:
+            self.renumber_insertion_order(parent_id=parent_id, my_conn=my_conn, t_log=t_log, verbose=verbose)
+            key = self._move_key(self.grouped_data.loc[parent_id, :], child_id, before_id=before_id,
+                                 after_id=after_id)
+        if key is None:
+            warn('Could not renumber group {} of {}'.format(parent_id, self.parent_table_name), InsertionOrderError)
+            return
+
+        generic_set_insertion_order([(child_id, int(parent_id), key)], table_name=self.table_name,
+                                    parent_table_name=self.parent_table_name,
+                                    my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+        self.refresh_records([child_id], my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    @staticmethod
+    def _move_key(df: DataFrame, child_id: int, before_id: int = None, after_id: int = None) -> Optional[int]:
+        # Key for child_id between its new neighbours, None when they are adjacent or not numbered
+        others = df.insertion_order[df.index != child_id]
+        if others.isnull().any():
+            return None
+        ids = [int(c_id) for c_id in others.index]
+        keys = [int(key) for key in others]
+
+        if before_id is not None:
+            position = ids.index(int(before_id))
+        elif after_id is not None:
+            position = ids.index(int(after_id)) + 1
+        else:
+            position = len(ids)
+
+        lower = keys[position - 1] if position > 0 else None
+        upper = keys[position] if position < len(keys) else None
+        return generic_order_key(lower, upper)
+
+    def move_before(self, child_id: int, before_id: int, parent_id: int = None, my_conn: Optional[dict] = None,
+                    t_log: Optional[TimeLogger] = None, verbose: bool = False):
+        """Place child_id directly before before_id"""
+        self.move_record(child_id, before_id=before_id, parent_id=parent_id,
+                         my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    def move_after(self, child_id: int, after_id: int, parent_id: int = None, my_conn: Optional[dict] = None,
+                   t_log: Optional[TimeLogger] = None, verbose: bool = False):
+        """Place child_id directly after after_id"""
+        self.move_record(child_id, after_id=after_id, parent_id=parent_id,
+                         my_conn=my_conn, t_log=t_log, verbose=verbose)
 
     # def __repr__(self):
     #     return self.grouped_data.__repr__()
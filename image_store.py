@@ -0,0 +1,256 @@
+"""
+ImageStore keeps the rendered images of a table out of the bulk loads.
+
+Table loads only pull the metadata columns. Images are fetched by id when they are shown, one at a time through a
+bounded least recently used cache, or many at a time with a single WHERE id = ANY(...) query when a whole table of
+them is about to be displayed. Startup transfer and resident memory no longer grow with the total image volume.
+
+Every table has a second store for the thumbnail column, which lists and tables read instead of the full renders.
+Rows that don't have a thumbnail yet fall back to their full image until backfill_thumbnails has been run. A third
+store reads the svg column when renders are kept as SVG as well.
+
+Example:
+    store = ImageStore('variable')
+    png_data = store.get(22)
+    images = store.get_many([1, 2, 3])
+    thumbnails = image_store('variable', THUMBNAIL).get_many([1, 2, 3])
+"""
+
+__author__ = "William DeShazer"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+from collections import OrderedDict
+from threading import Lock, RLock
+from typing import Dict, Iterable, Optional
+from psycopg2.sql import SQL, Identifier
+from psycopg2.extras import execute_values
+from psycopg2 import OperationalError, DatabaseError
+from db_utils import my_connect, db_connection
+from time_logging import TimeLogger
+from rasterize import make_thumbnail
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+IMAGE = 'image'
+THUMBNAIL = 'thumbnail'
+SVG = 'svg'
+BACKFILL_BATCH = 200
+
+_NO_IMAGE = object()  # cached for ids whose image is NULL, so they aren't fetched again until invalidated
+_NOT_CACHED = object()  # what _lookup returns for ids the store knows nothing about
+
+
+class ImageStore:
+    """Size bounded, least recently used, in-memory cache of one table's images, filled from the database on demand.
+       column is the image column read, fallback_column is read for rows where column is NULL"""
+
+    def __init__(self, table_name: str, id_name: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES,
+                 column: str = IMAGE, fallback_column: Optional[str] = None):
+        self.table_name = table_name
+        self.id_name = table_name + '_id' if id_name is None else id_name
+        self.max_bytes = max_bytes
+        self.column = column
+        self.fallback_column = fallback_column
+        self.hits: int = 0
+        self.misses: int = 0
+        self.fetches: int = 0
+        self.evictions: int = 0
+        self.size: int = 0
+        self._images: OrderedDict = OrderedDict()  # id -> png data, oldest first
+        self._lock = RLock()
+
+    def _lookup(self, an_id: int):
+        with self._lock:
+            image = self._images.get(an_id, _NOT_CACHED)
+            if image is _NOT_CACHED:
+                self.misses += 1
+                return _NOT_CACHED
+            self._images.move_to_end(an_id)
+            self.hits += 1
+            return None if image is _NO_IMAGE else image
+
+    def put(self, an_id: int, image: Optional[bytes]):
+        """Store an image and evict old entries until the cache fits in max_bytes. None is kept as well, so a
+           record without an image isn't fetched again on every lookup"""
+        # psycopg2 hands BYTEA back as a memoryview over the result buffer
+        image = _NO_IMAGE if image is None else bytes(image)
+        with self._lock:
+            self.invalidate(an_id)
+            self._images[an_id] = image
+            self.size += _size(image)
+
+            while self.size > self.max_bytes and len(self._images) > 1:
+                _, old_image = self._images.popitem(last=False)
+                self.size -= _size(old_image)
+                self.evictions += 1
+
+    def invalidate(self, an_id: Optional[int] = None):
+        """Forget one image, or every image when an_id is None"""
+        with self._lock:
+            if an_id is None:
+                self._images.clear()
+                self.size = 0
+            elif an_id in self._images:
+                self.size -= _size(self._images.pop(an_id))
+
+    def _fetch(self, ids: Iterable[int], my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
+               verbose: bool = False) -> Dict[int, Optional[bytes]]:
+        ids = list(ids)
+        if self.fallback_column is None:
+            image = Identifier(self.column)
+        else:
+            image = SQL('COALESCE({}, {})').format(Identifier(self.column), Identifier(self.fallback_column))
+        sql = 'SELECT {table_id}, {image} FROM {table} WHERE {table_id} = ANY(%s)'
+        query = SQL(sql).format(table=Identifier(self.table_name), table_id=Identifier(self.id_name), image=image)
+
+        if verbose is True:
+            t_log.new_event('Fetching {} images from: {}'.format(len(ids), self.table_name))
+
+        # Only the rows actually read are returned, so a failed query isn't cached as records without images
+        images: Dict[int, Optional[bytes]] = {}
+        with db_connection(my_conn, t_log=t_log, verbose=verbose) as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(query, (ids,))
+                for an_id, image in cur.fetchall():
+                    images[an_id] = None if image is None else bytes(image)
+            except OperationalError as error:
+                print(error)
+            cur.close()
+
+        with self._lock:
+            self.fetches += 1
+        return images
+
+    def get(self, an_id: int, my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
+            verbose: bool = False) -> Optional[bytes]:
+        """Image for one id, fetched from the database on a miss. Records without an image are cached as None"""
+        an_id = int(an_id)
+        image = self._lookup(an_id)
+        if image is _NOT_CACHED:
+            fetched = self._fetch([an_id], my_conn=my_conn, t_log=t_log, verbose=verbose)
+            image = fetched.get(an_id)
+            if an_id in fetched:
+                self.put(an_id, image)
+        return image
+
+    def get_many(self, ids: Iterable[int], my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
+                 verbose: bool = False) -> Dict[int, Optional[bytes]]:
+        """Images for many ids. Every miss is fetched in a single query"""
+        images: Dict[int, Optional[bytes]] = {}
+        missing = []
+        for an_id in ids:
+            an_id = int(an_id)
+            image = self._lookup(an_id)
+            images[an_id] = None if image is _NOT_CACHED else image
+            if image is _NOT_CACHED:
+                missing.append(an_id)
+
+        if len(missing) > 0:
+            fetched = self._fetch(missing, my_conn=my_conn, t_log=t_log, verbose=verbose)
+            for an_id, image in fetched.items():
+                self.put(an_id, image)
+            images.update(fetched)
+
+        return images
+
+    def snapshot(self) -> Dict[int, bytes]:
+        """Copy of the cached images, least recently used first, for saving alongside a table snapshot. Ids cached
+           as having no image are left out"""
+        with self._lock:
+            return OrderedDict((an_id, image) for an_id, image in self._images.items() if image is not _NO_IMAGE)
+
+    def restore(self, images: Dict[int, bytes]):
+        """Fill the cache from a saved snapshot. Entries already cached in this process win"""
+        for an_id, image in images.items():
+            if an_id not in self._images and image is not None:
+                self.put(an_id, image)
+
+    def stats(self) -> dict:
+        """Snapshot of the cache counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(hits=self.hits, misses=self.misses, fetches=self.fetches, evictions=self.evictions,
+                        hit_rate=self.hits / lookups if lookups > 0 else 0.0,
+                        entries=len(self._images), size=self.size, max_bytes=self.max_bytes)
+
+    def __len__(self):
+        return len(self._images)
+
+    def __contains__(self, an_id: int):
+        return an_id in self._images
+
+
+def _size(image) -> int:
+    return 0 if image is _NO_IMAGE else len(image)
+
+
+_IMAGE_STORES: Dict[tuple, ImageStore] = {}
+_IMAGE_STORES_LOCK = Lock()  # the startup loaders ask for stores from several threads at once
+
+
+def image_store(table_name: str, column: str = IMAGE) -> ImageStore:
+    """Process wide store for an image column of a table, created on first use"""
+    with _IMAGE_STORES_LOCK:
+        if (table_name, column) not in _IMAGE_STORES:
+            _IMAGE_STORES[(table_name, column)] = \
+                ImageStore(table_name, column=column, fallback_column=IMAGE if column == THUMBNAIL else None)
+        return _IMAGE_STORES[(table_name, column)]
+
+
+def backfill_thumbnails(table_name: str, batch: int = BACKFILL_BATCH, my_conn: Optional[dict] = None,
+                        t_log: Optional[TimeLogger] = None, verbose: bool = False) -> int:
+    """Make the missing thumbnails of a table from its stored images, batch rows at a time. Returns the number made.
+       Pages through the table by id, so rows whose image can't be decoded or written are reported and skipped"""
+    if verbose is True and t_log is None:
+        t_log = TimeLogger()
+
+    my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
+    names = dict(table=Identifier(table_name), table_id=Identifier(table_name + '_id'))
+    select = SQL('SELECT {table_id}, image FROM {table} WHERE thumbnail IS NULL AND image IS NOT NULL '
+                 'AND {table_id} > %s ORDER BY {table_id} LIMIT %s').format(**names)
+    update = SQL('UPDATE {table} SET thumbnail = data.thumbnail FROM (VALUES %s) AS data ({table_id}, thumbnail) '
+                 'WHERE {table}.{table_id} = data.{table_id}').format(**names)
+
+    made = 0
+    last_id = 0
+    while True:
+        with db_connection(my_conn, t_log=t_log, verbose=verbose) as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(select, (last_id, batch))
+                images = cur.fetchall()
+            except OperationalError as error:
+                print(error)
+                cur.close()
+                break
+
+            rows = []
+            for an_id, image in images:
+                try:
+                    thumbnail = make_thumbnail(image)
+                except (OSError, ValueError) as error:
+                    print('Skipped the thumbnail of {} id {}:'.format(table_name, an_id), error)
+                    continue
+                if thumbnail is not None:
+                    rows.append((an_id, thumbnail))
+
+            try:
+                if len(rows) > 0:
+                    execute_values(cur, update, rows, page_size=len(rows))
+                conn.commit()
+                made += len(rows)
+            except DatabaseError as error:
+                print('Skipped the thumbnails of {} ids {} to {}:'.format(table_name, images[0][0], images[-1][0]),
+                      error)
+                conn.rollback()
+            cur.close()
+
+        if len(images) == 0:
+            break
+        last_id = images[-1][0]
+        if verbose is True:
+            t_log.new_event('{} thumbnails made for: {}'.format(made, table_name))
+
+    image_store(table_name, THUMBNAIL).invalidate()
+    return made
@@ -13,22 +13,31 @@ __version__ = "0.1.0"
 __license__ = "MIT"
 
 import os
-import subprocess
 import argparse
 import pprint
 from warnings import warn
 from io import BytesIO
 from datetime import datetime
 from dataclasses import dataclass
-from typing import NewType, List, Optional
-from pathlib import Path
+from typing import NewType, List, Optional, Dict, Iterable, Callable
 from pickle import dumps
+from copy import copy
+from functools import partial
+from math import isnan
+from concurrent.futures import Future
+from threading import Thread
+from pandas import DataFrame, NaT
 from psycopg2 import DatabaseError
 from psycopg2.extras import NamedTupleCursor
+from query_stats import InstrumentedNamedTupleCursor
 from PIL import Image
-from time_logging import TimeLogger
-from template import TemplateTable
-from db_utils import my_connect
+from time_logging import TimeLogger, span, traced
+from template import TemplateTable, TEMPLATE_DATA
+from db_utils import my_connect, db_connection
+from render_cache import render_cache, normalize_pattern
+from render_farm import RenderFarm, render, render_pages, render_farm
+from rasterize import PNG, SVG, VECTOR_AVAILABLE, make_thumbnail
+from latex_server import compile_interactive, start_latex_server
 
 TemplateID = NewType("TemplateID", int)
 TemplateIDs = NewType("Templates", List[TemplateID])
@@ -42,7 +51,6 @@ def available_templates(my_conn: Optional[dict] = None, t_log: Optional[TimeLogg
         t_log = TimeLogger()
 
     my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-    conn = my_conn['conn']
 
     if verbose is True:
         print('Extracting available Templates')
@@ -50,14 +58,15 @@ def available_templates(my_conn: Optional[dict] = None, t_log: Optional[TimeLogg
     if verbose is True:
         t_log.new_event('Connecting to Templates on Database')
 
-    cur = conn.cursor()
-    try:
-        cur.execute('SELECT id FROM template ORDER BY created_at')
-    except DatabaseError as error:
-        print("Couldn't retrieve templates", error)
+    with db_connection(my_conn) as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute('SELECT id FROM template ORDER BY created_at')
+        except DatabaseError as error:
+            print("Couldn't retrieve templates", error)
 
-    output = cur.fetchall()
-    cur.close()
+        output = cur.fetchall()
+        cur.close()
 
     template_ids = TemplateIDs([x[0] for x in output])
 
@@ -75,31 +84,31 @@ def template(my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
         t_log = TimeLogger()
 
     my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-    conn = my_conn['conn']
 
-    cur = conn.cursor(cursor_factory=NamedTupleCursor)
+    with db_connection(my_conn) as conn:
+        cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-    if version is None:
-        if verbose:
-            t_log.new_event('Extracting Latest Template from Database')
-
-        cur.execute('SELECT * FROM template ORDER BY created_at DESC LIMIT 1')
-    else:
-        try:
+        if version is None:
             if verbose:
-                t_log.new_event('Extracting Template with id: {} from Database'.format(version))
+                t_log.new_event('Extracting Latest Template from Database')
 
-            cur.execute('SELECT * FROM template WHERE ID=%s', (version,))
-        except DatabaseError as error:
-            print("Couldn't retrieve that template.", error)
-            print("Returning latest template.")
             cur.execute('SELECT * FROM template ORDER BY created_at DESC LIMIT 1')
+        else:
+            try:
+                if verbose:
+                    t_log.new_event('Extracting Template with id: {} from Database'.format(version))
 
-    if verbose:
-        t_log.new_event('Starting Template Extraction')
+                cur.execute('SELECT * FROM template WHERE ID=%s', (version,))
+            except DatabaseError as error:
+                print("Couldn't retrieve that template.", error)
+                print("Returning latest template.")
+                cur.execute('SELECT * FROM template ORDER BY created_at DESC LIMIT 1')
 
-    the_template = cur.fetchone()
-    cur.close()
+        if verbose:
+            t_log.new_event('Starting Template Extraction')
+
+        the_template = cur.fetchone()
+        cur.close()
 
     if verbose:
         t_log.new_event('Finished Template Extraction')
@@ -107,10 +116,70 @@ def template(my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
     return the_template
 
 
-def compile_pattern(pattern: str = 'm^3', keep: bool = True, temp_fname: str = "eq_db", version: int = None,
+VECTOR_ENV = 'EQ_DB_SVG'  # set to keep an SVG of every render next to the png, needs SQL/svg.sql
+
+
+def vector_output() -> bool:
+    """True when renders are also kept as SVG"""
+    return VECTOR_AVAILABLE and os.environ.get(VECTOR_ENV, '') not in ('', '0')
+
+
+# Called with every LatexData whose image was just recompiled
+_RECOMPILE_LISTENERS: List[Callable[['LatexData'], None]] = []
+
+
+def on_recompile(listener: Callable[['LatexData'], None]):
+    """Have listener called with every LatexData that recompiles, so whatever was made from its old image can go"""
+    if listener not in _RECOMPILE_LISTENERS:
+        _RECOMPILE_LISTENERS.append(listener)
+
+
+def _recompiled(latex_obj: 'LatexData'):
+    for listener in _RECOMPILE_LISTENERS:
+        listener(latex_obj)
+
+
+# Called with a table name and the ids of its records whose stored images were just recompiled
+_RECORD_RECOMPILE_LISTENERS: List[Callable[[str, List[int]], None]] = []
+
+
+def on_records_recompile(listener: Callable[[str, List[int]], None]):
+    """Have listener called with the table and ids of stored records that recompile outside a LatexData"""
+    if listener not in _RECORD_RECOMPILE_LISTENERS:
+        _RECORD_RECOMPILE_LISTENERS.append(listener)
+
+
+def records_recompiled(table_name: str, ids: List[int]):
+    """Report that the stored images of ids in table_name were recompiled"""
+    for listener in _RECORD_RECOMPILE_LISTENERS:
+        listener(table_name, ids)
+
+
+def template_data(my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
+                  version: int = None, verbose: bool = False) -> str:
+    """Template text for a version. Explicit versions are memoized, the latest template is always pulled"""
+    if version is not None:
+        version = int(version)
+        # get, not a membership test, so a forget_template_data from another thread can't land in between
+        a_template = TEMPLATE_DATA.get(version)
+        if a_template is not None:
+            return a_template
+
+    the_template = template(version=version, my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    if version is not None and the_template.id == version:
+        TEMPLATE_DATA.setdefault(version, the_template.data)
+
+    return the_template.data
+
+
+@traced('compile_pattern', 'render')
+def compile_pattern(pattern: str = 'm^3', keep: bool = False, temp_fname: str = "eq_db", version: int = None,
                     a_template: str = None, verbose: bool = False,
-                    my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None) -> bytes:
-    """General Latex Compile Function"""
+                    my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
+                    use_cache: bool = True, output: str = PNG) -> bytes:
+    """General Latex Compile Function. Renders are looked up in the render cache before anything is spawned.
+       Returns png data, or svgz data for the SVG output"""
 
     if verbose:
         if t_log is None:
@@ -119,67 +188,94 @@ def compile_pattern(pattern: str = 'm^3', keep: bool = True, temp_fname: str = "
         pprint.PrettyPrinter(indent=12).pprint(locals())
 
     if a_template is None:
-        a_template_record = template(version=version, my_conn=my_conn, t_log=t_log, verbose=verbose)
-        a_template = a_template_record.data
-
-    this_path = Path.cwd()
-    if this_path.name == 'CustomWidgets':
-        os.chdir('../LaTeX')
-    elif this_path.name == 'equation_database':
-        os.chdir('LaTeX')
-    else:
-        warn('Unrecognized Directory')
+        with span('template_data', 'render', version=version):
+            a_template = template_data(version=version, my_conn=my_conn, t_log=t_log, verbose=verbose)
 
     # preprocess pattern to make sure it conforms to latex
-    processed_pattern = pattern.strip()
-
-    text_file = open(temp_fname+'.tex', "w")
-    text_file.write(a_template.replace('%__REPLACEMENT__TEXT', processed_pattern))
-    text_file.close()
+    processed_pattern = normalize_pattern(pattern)
+
+    cache_key: Optional[str] = None
+    if use_cache is True:
+        with span('render_cache lookup', 'render'):
+            cache = render_cache()
+            cache_key = cache.key(processed_pattern, a_template, variant=output)
+            png_data = cache.get(cache_key)
+        if png_data is not None:
+            if verbose:
+                t_log.new_event('Render cache hit')
+            return png_data
 
-    # try:
     if verbose:
         print("Operating System: ", os.name)
         t_log.new_event('Executing XeLaTeX:')
 
-    shell = os.name == 'nt'
+    # Each compile gets a private temporary directory, so nothing here depends on or changes the working directory
+    with span('render', 'render'):
+        png_data = render(processed_pattern, a_template, stem=temp_fname, keep=keep, verbose=verbose, output=output)
 
-    try:
-        p_1 = subprocess.run(['xelatex.exe', temp_fname + '.tex', '-interaction=batchmode'],
-                             shell=shell, capture_output=True, text=True, check=True)
+    if verbose:
+        t_log.new_event('Finished compile')
 
-        if verbose:
-            pprint.PrettyPrinter(indent=8).pprint(p_1)
-    except subprocess.CalledProcessError as error:
-        print(error.output)
+    if cache_key is not None:
+        render_cache().put(cache_key, png_data)
 
-    try:
-        if verbose:
-            t_log.new_event('Converting to png')
+    return png_data
 
-        p_2 = subprocess.run(['convert.exe', '-density', '300', '-depth', '8', '-quality', '85', temp_fname + '.pdf',
-                             'png32:'+temp_fname+'.png'], shell=shell, capture_output=True, text=True, check=True)
 
-        if verbose:
-            t_log.new_event('Finished converting png')
-            pprint.PrettyPrinter(indent=8).pprint(p_2)
+def compile_patterns(patterns: Iterable[str], version: int = None, a_template: str = None,
+                     temp_fname: str = "eq_db_batch", pages_per_run: int = 500, keep: bool = False,
+                     verbose: bool = False, my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
+                     use_cache: bool = True, output: str = PNG) -> Dict[str, bytes]:
+    """Batch Latex Compile Function. Every pattern not already in the render cache is typeset as a page of one
+       document, so the whole batch costs one xelatex run and one rasterization pass per pages_per_run patterns.
+       Returns the png data, or the svgz data for the SVG output, for each input pattern"""
 
-    except subprocess.CalledProcessError as error:
-        t_log.new_event('Failed to make png:')
-        print(error.output)
+    if verbose is True and t_log is None:
+        t_log = TimeLogger()
 
-    if verbose:
-        t_log.new_event('Pulling png data into python')
+    if a_template is None:
+        a_template = template_data(version=version, my_conn=my_conn, t_log=t_log, verbose=verbose)
 
-    with open(temp_fname + '.png', 'rb') as file:
-        png_data: bytes = file.read()
+    cache = render_cache()
+    results: Dict[str, bytes] = {}
+    to_compile: Dict[str, List[str]] = {}  # processed pattern -> original patterns that share it
 
-    os.chdir(this_path)
+    for pattern in patterns:
+        processed_pattern = normalize_pattern(pattern)
+        if use_cache is True and processed_pattern not in to_compile:
+            png_data = cache.lookup(processed_pattern, a_template, variant=output)
+            if png_data is not None:
+                results[pattern] = png_data
+                continue
+        to_compile.setdefault(processed_pattern, []).append(pattern)
 
-    if keep is False:
-        clean_files(temp_fname)
+    if verbose is True:
+        t_log.new_event('Batch compile: {} cached, {} to compile'.format(len(results), len(to_compile)))
 
-    return png_data
+    unique_patterns = list(to_compile.keys())
+
+    for start in range(0, len(unique_patterns), pages_per_run):
+        chunk = unique_patterns[start:start + pages_per_run]
+        if verbose is True:
+            t_log.new_event('Executing XeLaTeX on {} pages'.format(len(chunk)))
+
+        with span('render_pages', 'render', pages=len(chunk)):
+            pages = render_pages(chunk, a_template, stem=temp_fname, keep=keep, verbose=verbose, output=output)
+
+        if pages is None or len(pages) != len(chunk):
+            # A page went missing so the mapping from page to pattern can't be trusted. Fall back to one compile per
+            # pattern, spread over the render farm
+            warn('Batch compile produced an unexpected page count, compiling individually')
+            rendered = render_farm().render_many(chunk, a_template, output=output)
+            pages = [rendered[pattern] for pattern in chunk]
+
+        for processed_pattern, png_data in zip(chunk, pages):
+            if use_cache is True:
+                cache.store(processed_pattern, a_template, png_data, variant=output)
+            for pattern in to_compile[processed_pattern]:
+                results[pattern] = png_data
+
+    return results
 
 
 def clean_files(temp_fname="LaTeX/eq_db"):
@@ -226,6 +322,8 @@ class LatexData:
     image: bytes = None
     compiled_at: datetime = None
     image_is_dirty: bool = False
+    thumbnail: bytes = None  # small copy of image, made on first use
+    svg: bytes = None  # svgz of the same LaTeX, compiled on first use
     my_conn: dict = None
     t_log: TimeLogger = None
     verbose: bool = False  # I don't like this, but I verbosity during initialization and at the moment __post_init__
@@ -253,21 +351,44 @@ class LatexData:
             else:
                 self.my_conn = my_conn
 
-            my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-            self.my_conn = my_conn
+            # A memoized template plus a render cache hit never needs the database, so only connect when the
+            # template text still has to be pulled
+            version = self.template_id if template_id is None else template_id
+            if version is None or int(version) not in TEMPLATE_DATA:
+                my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
+                self.my_conn = my_conn
 
         if latex is not None:
             self.latex = latex
         if template_id is not None:
             self.template_id = template_id
         if image is not None and image_is_dirty is False:
+            if image is not self.image:
+                self.thumbnail = None
+                self.svg = None
             self.image = image
         else:
-            self.image = \
-                compile_pattern(pattern=self.latex, version=self.template_id, my_conn=my_conn,
-                                t_log=t_log, verbose=verbose)
+            # Compiled by a render farm worker in its own temp directory, after a render cache lookup
+            a_template = template_data(version=self.template_id, my_conn=my_conn, t_log=t_log, verbose=verbose)
+            self.image = render_farm().submit(self.latex, a_template).result()
             self.compiled_at = datetime.now()
             self.image_is_dirty = False
+            self.thumbnail = None
+            self.svg = None
+            _recompiled(self)
+
+    def thumbnail_image(self) -> Optional[bytes]:
+        """Thumbnail of image, for storing next to it"""
+        if self.thumbnail is None and self.image is not None:
+            self.thumbnail = make_thumbnail(self.image)
+        return self.thumbnail
+
+    def vector_image(self) -> Optional[bytes]:
+        """Gzip compressed SVG of the LaTeX, for storing next to image. None unless vector_output() is on"""
+        if self.svg is None and vector_output():
+            a_template = template_data(version=self.template_id, my_conn=self.my_conn)
+            self.svg = render_farm().submit(self.latex, a_template, output=SVG).result()
+        return self.svg
 
     def template_table(self):
         return TemplateTable(my_conn=self.my_conn)
@@ -284,6 +405,199 @@ class LatexData:
         return dumps(self)
 
 
+class LazyLatexData:
+    """Stands in for a LatexData in a table's latex_obj column. The LatexData is built from the row the first time
+       it is used and kept afterwards, so only the rows that are looked at pay for it"""
+    __slots__ = ('_row', '_image_loader', '_latex_data')
+
+    def __init__(self, latex: str = None, template_id: TemplateID = None, image: bytes = None,
+                 compiled_at: datetime = None, my_conn: Optional[dict] = None,
+                 image_loader: Optional[Callable[[], Optional[bytes]]] = None):
+        object.__setattr__(self, '_row', dict(latex=latex, template_id=template_id, image=image,
+                                              compiled_at=compiled_at, my_conn=my_conn))
+        object.__setattr__(self, '_image_loader', image_loader)  # fetches the stored image when the load skipped it
+        object.__setattr__(self, '_latex_data', None)
+
+    def resolve(self) -> LatexData:
+        """The LatexData for this row, built on first use"""
+        if self._latex_data is None:
+            if self._row['image'] is None and self._image_loader is not None:
+                self._row['image'] = self._image_loader()
+            object.__setattr__(self, '_latex_data', LatexData(**self._row))
+            object.__setattr__(self, '_row', None)
+            object.__setattr__(self, '_image_loader', None)
+        return self._latex_data
+
+    def is_resolved(self) -> bool:
+        """True once the LatexData has been built"""
+        return self._latex_data is not None
+
+    def __getattr__(self, name):
+        # Only reached for names that aren't set. An unset slot or dunder means the instance was made without
+        # __init__, by copy or pickle, and resolving it would look the same slot up again
+        if name in LazyLatexData.__slots__ or (name.startswith('__') and name.endswith('__')):
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.resolve(), name, value)
+
+    def __reduce__(self):
+        # Copies and pickles are plain LatexData, copied so a copy never shares the resolved one
+        return copy, (self.resolve(),)
+
+    def __repr__(self):
+        if self._latex_data is None:
+            return 'LazyLatexData(latex={latex!r}, template_id={template_id!r})'.format(**self._row)
+        return repr(self._latex_data)
+
+
+def compile_latex_data(latex_objs: Iterable[LatexData], my_conn: Optional[dict] = None,
+                       t_log: Optional[TimeLogger] = None, verbose: bool = False) -> List[LatexData]:
+    """Recompile many LatexData objects with one batch compile per template. Used after a template change or a
+       bulk import where compiling each object on its own would launch xelatex once per object"""
+    latex_objs = list(latex_objs)
+    by_template: Dict[TemplateID, List[LatexData]] = {}
+    for latex_obj in latex_objs:
+        by_template.setdefault(latex_obj.template_id, []).append(latex_obj)
+
+    for template_id, group in by_template.items():
+        images = compile_patterns([latex_obj.latex for latex_obj in group], version=template_id,
+                                  my_conn=my_conn, t_log=t_log, verbose=verbose)
+        compiled_at = datetime.now()
+        for latex_obj in group:
+            latex_obj.image = images[latex_obj.latex]
+            latex_obj.compiled_at = compiled_at
+            latex_obj.image_is_dirty = False
+            latex_obj.thumbnail = None
+            latex_obj.svg = None
+            _recompiled(latex_obj)
+
+    return latex_objs
+
+
+def latex_data_column(data_df: DataFrame, lazy: bool = True, image_loader: Optional[Callable[[int], bytes]] = None,
+                      images_loader: Optional[Callable[[List[int]], Dict[int, Optional[bytes]]]] = None,
+                      id_name: Optional[str] = None, my_conn: Optional[dict] = None,
+                      t_log: Optional[TimeLogger] = None, verbose: bool = False) -> List[LatexData]:
+    """Build the LatexData for every row of a table load in one pass, in row order. By default every row gets a
+       LazyLatexData that is only built when used. Otherwise the latest template is looked up at most once, rows that
+       carry an image never touch the database and rows without one are compiled in one batch per template.
+       When the load left out the image column, image_loader fetches a row's image by its id_name index value for
+       the lazy rows, and images_loader fetches the images of all rows at once when they are built right away"""
+    if 'image' in data_df.columns:
+        images = data_df['image']
+    elif lazy is False and images_loader is not None:
+        ids = [int(an_id) for an_id in data_df.index.get_level_values(id_name)]
+        loaded = images_loader(ids)
+        images = [loaded.get(an_id) for an_id in ids]
+    else:
+        images = [None] * len(data_df)
+
+    rows = list(zip(data_df['latex'], data_df['template_id'], images, data_df['compiled_at']))
+
+    if lazy is True:
+        if 'image' in data_df.columns or image_loader is None:
+            loaders = [None] * len(rows)
+        else:
+            loaders = [partial(image_loader, int(an_id)) for an_id in data_df.index.get_level_values(id_name)]
+
+        return [LazyLatexData(latex=latex, image=None if _is_missing(image) else image,
+                              template_id=None if _is_missing(template_id) else TemplateID(int(template_id)),
+                              compiled_at=None if _is_missing(compiled_at) else compiled_at, my_conn=my_conn,
+                              image_loader=loader)
+                for (latex, template_id, image, compiled_at), loader in zip(rows, loaders)]
+
+    latest: Optional[TemplateID] = None
+    if any(_is_missing(image) and _is_missing(template_id) for _, template_id, image, _ in rows):
+        latest = available_templates(my_conn=my_conn, t_log=t_log, verbose=verbose)[-1]
+
+    to_compile: Dict[TemplateID, List[str]] = {}
+    for latex, template_id, image, _ in rows:
+        if _is_missing(image):
+            template_id = latest if _is_missing(template_id) else TemplateID(int(template_id))
+            to_compile.setdefault(template_id, []).append(latex)
+
+    compiled: Dict[TemplateID, Dict[str, bytes]] = {}
+    for template_id, patterns in to_compile.items():
+        compiled[template_id] = compile_patterns(patterns, version=template_id, my_conn=my_conn, t_log=t_log,
+                                                 verbose=verbose)
+    compiled_at = datetime.now()
+
+    latex_objs = []
+    for latex, template_id, image, rcd_compiled_at in rows:
+        template_id = latest if _is_missing(template_id) else TemplateID(int(template_id))
+        if _is_missing(image):
+            image = compiled[template_id][latex]
+            rcd_compiled_at = compiled_at
+        latex_objs.append(LatexData(latex=latex, template_id=template_id, image=image,
+                                    compiled_at=None if _is_missing(rcd_compiled_at) else rcd_compiled_at,
+                                    my_conn=my_conn))
+
+    return latex_objs
+
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and isnan(value)) or value is NaT
+
+
+def submit_latex_data(latex: str, template_id: TemplateID = None, farm: Optional[RenderFarm] = None,
+                      my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None,
+                      verbose: bool = False) -> Future:
+    """Queue a compile on the render farm. The template is resolved here, so worker processes never touch the
+       database. The future resolves to a compiled LatexData"""
+    if farm is None:
+        farm = render_farm()
+
+    if template_id is None or template_id == 'latest':
+        template_id = available_templates(my_conn=my_conn, t_log=t_log, verbose=verbose)[-1]
+
+    a_template = template_data(version=template_id, my_conn=my_conn, t_log=t_log, verbose=verbose)
+    render_future = farm.submit(latex, a_template)
+    latex_future: Future = Future()
+
+    def _done(done: Future):
+        if done.exception() is not None:
+            latex_future.set_exception(done.exception())
+        else:
+            latex_future.set_result(LatexData(latex=latex, template_id=template_id, image=done.result(),
+                                              compiled_at=datetime.now(), my_conn=my_conn))
+
+    render_future.add_done_callback(_done)
+    return latex_future
+
+
+def preview_latex_data(latex: str, template_id: TemplateID = None, my_conn: Optional[dict] = None,
+                       t_log: Optional[TimeLogger] = None, verbose: bool = False) -> LatexData:
+    """Compile for interactive editing through the latex server, which keeps the template preamble loaded"""
+    if template_id is None or template_id == 'latest':
+        template_id = available_templates(my_conn=my_conn, t_log=t_log, verbose=verbose)[-1]
+
+    a_template = template_data(version=template_id, my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    if verbose is True:
+        t_log.new_event('Interactive compile')
+
+    image = compile_interactive(latex, template_id, a_template)
+
+    if verbose is True:
+        t_log.new_event('Finished interactive compile')
+
+    return LatexData(latex=latex, template_id=template_id, image=image, compiled_at=datetime.now(), my_conn=my_conn)
+
+
+def warm_latex_server(template_id: TemplateID, my_conn: Optional[dict] = None):
+    """Start preloading a template ahead of the first interactive compile. Returns at once, the template is pulled
+       and the format built on a daemon thread, so the GUI thread can call this"""
+    if template_id is None:
+        return
+
+    def _warm():
+        start_latex_server(template_id, template_data(version=template_id, my_conn=my_conn), background=False)
+
+    Thread(target=_warm, daemon=True).start()
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='LaTeX Template Resources')
     parser.add_argument("--pattern", dest='pattern', help='str: Valid LaTeX Pattern', default="m^3")
@@ -6,10 +6,10 @@ from typing import Optional, Union
 from dataclasses import dataclass
 from PyQt5.QtWidgets import QTextEdit, QGraphicsView, QGraphicsScene
 from PyQt5.QtGui import QFocusEvent
-from PyQt5.QtGui import QPixmap, QImage
 
 from time_logging import TimeLogger
 from latex_data import LatexData
+from pixmap_cache import pixmap_cache
 from grouped_physics_object import GroupedPhysicsObject
 from unit import Unit
 
@@ -67,13 +67,11 @@ class LaTexTextEdit(QTextEdit):
 
     def show_latex_image(self):
         """Method to Display image"""
-        image = self.latex_data.image
-        if image is None:
+        table_name = None if self.db_ref is None else self.db_ref.table_name
+        pixmap = pixmap_cache().latex_pixmap(self.latex_data, table_name, self.db_ref_id)
+        if pixmap is None:
             pass
         else:
-            img = QImage.fromData(image)
-            pixmap = QPixmap.fromImage(img)
-
             self.scene.clear()
             self.scene.addPixmap(pixmap)
             # self.latex_graphicbox.setScene(scene)
@@ -0,0 +1,212 @@
+"""
+LatexServer keeps a template preamble preloaded so interactive compiles only pay for typesetting the formula.
+
+The preamble of the stored template is dumped once into a format file with mylatexformat. Every compile afterwards
+starts xelatex from that format, skipping the package loading that dominates a one-shot compile. Font selection
+(fontspec, unicode-math) can't be dumped by XeTeX, so the preamble is split at the first font command and the rest
+is read on every run by way of \\endofdump.
+
+The server is tied to one template id. Compiles for any other template fall back to the one-shot path while the
+server is rebuilt for the new template in the background.
+
+Example:
+    png_data = compile_interactive(r'\\si{\\km}^3', template_id, a_template)
+
+mylatexformat: https://ctan.org/pkg/mylatexformat
+"""
+
+__author__ = "William DeShazer"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import re
+import atexit
+import shutil
+import tempfile
+import subprocess
+from warnings import warn
+from itertools import count
+from pathlib import Path
+from threading import Condition, Lock, Thread
+from typing import Optional
+from render_cache import render_cache, normalize_pattern
+from render_farm import XELATEX, render, run_xelatex
+from rasterize import rasterize_page
+
+FORMAT_NAME = 'eq_db_fmt'
+FONT_COMMANDS = re.compile(r'^\s*\\(setmathfont|setmainfont|setsansfont|setmonofont|newfontfamily|fontspec)\b',
+                           re.MULTILINE)
+
+
+class FormatBuildError(UserWarning):
+    """UserWarning for LatexServer"""
+
+
+def dump_template(a_template: str) -> str:
+    """Template with an \\endofdump marker. Everything above it goes into the format, everything below it is
+       read on every compile"""
+    match = FONT_COMMANDS.search(a_template)
+    if match is not None:
+        position = match.start()
+    else:
+        position = a_template.find('\\begin{document}')
+
+    if position < 0:
+        return a_template
+
+    return a_template[:position] + '\\endofdump\n' + a_template[position:]
+
+
+class LatexServer:
+    """Long lived compiler for a single template"""
+
+    def __init__(self, template_id: int, a_template: str, work_dir: Optional[str] = None):
+        self.template_id = int(template_id)
+        self.a_template = a_template
+        self.dumped_template = dump_template(a_template)
+        self.work_dir = Path(tempfile.mkdtemp(prefix='eq_db_server_') if work_dir is None else work_dir)
+        self.ready: bool = False
+        self.compiles: int = 0
+        self._jobs = count()
+        self._running: int = 0  # compiles using work_dir right now, stop waits for them before removing it
+        self._idle = Condition()
+
+    def start(self) -> bool:
+        """Dump the template preamble into a format file. Returns True when the server can take compiles"""
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+
+        preamble = self.dumped_template.split('\\endofdump', 1)[0]
+        with open(self.work_dir / (FORMAT_NAME + '.tex'), 'w') as text_file:
+            text_file.write(preamble)
+
+        # No shell here, the & in &xelatex would be taken by cmd.exe
+        try:
+            subprocess.run([XELATEX, '-ini', '-interaction=batchmode', '-jobname=' + FORMAT_NAME, '&xelatex',
+                            'mylatexformat.ltx', FORMAT_NAME + '.tex'],
+                           cwd=self.work_dir, capture_output=True, text=True, check=True)
+        except (subprocess.CalledProcessError, OSError) as error:
+            print('Failed to build format:', error)
+
+        self.ready = (self.work_dir / (FORMAT_NAME + '.fmt')).exists()
+        return self.ready
+
+    def compile(self, pattern: str) -> Optional[bytes]:
+        """Typeset one pattern against the preloaded format. Returns None if the run didn't produce an image"""
+        with self._idle:
+            if self.ready is False:
+                return None
+            self._running += 1
+
+        try:
+            return self._compile(pattern)
+        finally:
+            with self._idle:
+                self._running -= 1
+                self._idle.notify_all()
+
+    def _compile(self, pattern: str) -> Optional[bytes]:
+        stem = 'eq_{}'.format(next(self._jobs))
+        png_data: Optional[bytes] = None
+        try:
+            with open(self.work_dir / (stem + '.tex'), 'w') as text_file:
+                text_file.write(self.dumped_template.replace('%__REPLACEMENT__TEXT', normalize_pattern(pattern)))
+
+            run_xelatex(stem, self.work_dir, fmt=FORMAT_NAME)
+            if (self.work_dir / (stem + '.pdf')).exists():
+                png_data = rasterize_page(self.work_dir / (stem + '.pdf'))
+
+            for job_file in self.work_dir.glob(stem + '.*'):
+                job_file.unlink()
+        except OSError as error:
+            print('Interactive compile failed:', error)
+
+        self.compiles += 1
+        return png_data
+
+    def stop(self):
+        """Take no more compiles, wait for the ones running and remove the format and any leftover job files"""
+        with self._idle:
+            self.ready = False
+            self._idle.wait_for(lambda: self._running == 0)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+_LATEX_SERVER: Optional[LatexServer] = None
+_STARTING: Optional[int] = None
+_FAILED: set = set()  # template ids whose preamble couldn't be dumped, these always use the one-shot path
+_SERVER_LOCK = Lock()
+
+
+def latex_server() -> Optional[LatexServer]:
+    """Currently running server, if any"""
+    return _LATEX_SERVER
+
+
+def start_latex_server(template_id: int, a_template: str, background: bool = True):
+    """Build a server for template_id and make it the active one. The previous server keeps serving its own
+       template until the new one is ready"""
+    global _STARTING  # pylint: disable=global-statement
+
+    template_id = int(template_id)
+    with _SERVER_LOCK:
+        if _STARTING == template_id or template_id in _FAILED or \
+                (_LATEX_SERVER is not None and _LATEX_SERVER.template_id == template_id):
+            return
+        _STARTING = template_id
+
+    def _start():
+        global _LATEX_SERVER, _STARTING  # pylint: disable=global-statement
+        server = LatexServer(template_id, a_template)
+        server.start()
+
+        with _SERVER_LOCK:
+            old_server = _LATEX_SERVER
+            if server.ready is True:
+                _LATEX_SERVER = server
+            else:
+                old_server = None
+            _STARTING = None
+
+        if server.ready is False:
+            warn('Could not preload template {}, using one-shot compiles'.format(template_id), FormatBuildError)
+            _FAILED.add(template_id)
+            server.stop()
+        if old_server is not None:
+            old_server.stop()
+
+    if background is True:
+        Thread(target=_start, daemon=True).start()
+    else:
+        _start()
+
+
+def compile_interactive(pattern: str, template_id: int, a_template: str, use_cache: bool = True) -> bytes:
+    """Compile for interactive preview. Uses the render cache, then the preloaded server for template_id, and
+       falls back to the one-shot compile when the server belongs to another template or fails"""
+    processed_pattern = normalize_pattern(pattern)
+
+    if use_cache is True:
+        png_data = render_cache().lookup(processed_pattern, a_template)
+        if png_data is not None:
+            return png_data
+
+    server = _LATEX_SERVER
+    png_data = None
+    if server is not None and server.template_id == int(template_id):
+        png_data = server.compile(processed_pattern)
+    else:
+        start_latex_server(template_id, a_template)
+
+    if png_data is None:
+        png_data = render(processed_pattern, a_template)
+
+    if use_cache is True:
+        render_cache().store(processed_pattern, a_template, png_data)
+
+    return png_data
+
+
+@atexit.register
+def _stop_latex_server():
+    if _LATEX_SERVER is not None:
+        _LATEX_SERVER.stop()
@@ -10,8 +10,7 @@ __author__ = "William DeShazer"
 __version__ = "0.1.0"
 __license__ = "MIT"
 
-from config import config
-import psycopg2
+from db_pool import db_pool
 from psycopg2.extras import NamedTupleCursor
 # import textwrap
 import subprocess
@@ -24,43 +23,42 @@ from io import BytesIO
 
 
 def template(version: int = None, verbose: bool = False) -> NamedTupleCursor:
-    db_params = config()
-    conn = psycopg2.connect(**db_params)
+    with db_pool().connection() as conn:
+        cur = conn.cursor(cursor_factory=NamedTupleCursor)
+        t: Timer = Timer()
 
-    cur = conn.cursor(cursor_factory=NamedTupleCursor)
-    t: Timer = Timer()
-
-    if version is None:
-        if verbose:
-            print('Extracting Latest Template from Database')
-            t.start()
-
-        cur.execute('SELECT * FROM show_template_manager ORDER BY created_at DESC LIMIT 1')
-
-        if verbose:
-            t.stop()
-
-    else:
-        try:
+        if version is None:
             if verbose:
-                print('Extracting Template with id: {} from Database'.format(version))
+                print('Extracting Latest Template from Database')
                 t.start()
 
-            cur.execute('SELECT * FROM show_template_manager WHERE ID=%s', version)
+            cur.execute('SELECT * FROM show_template_manager ORDER BY created_at DESC LIMIT 1')
 
             if verbose:
                 t.stop()
 
-        except Exception as error:
-            print("Couldn't retrieve that show_template_manager.", error)
-            print("Returning latest show_template_manager.")
-            cur.execute('SELECT * FROM show_template_manager ORDER BY created_at DESC LIMIT 1')
+        else:
+            try:
+                if verbose:
+                    print('Extracting Template with id: {} from Database'.format(version))
+                    t.start()
 
-    if verbose:
-        print('Fetching data from Database')
-        t.start()
+                cur.execute('SELECT * FROM show_template_manager WHERE ID=%s', version)
+
+                if verbose:
+                    t.stop()
+
+            except Exception as error:
+                print("Couldn't retrieve that show_template_manager.", error)
+                print("Returning latest show_template_manager.")
+                cur.execute('SELECT * FROM show_template_manager ORDER BY created_at DESC LIMIT 1')
+
+        if verbose:
+            print('Fetching data from Database')
+            t.start()
 
-    theTemplate = cur.fetchone()
+        theTemplate = cur.fetchone()
+        cur.close()
 
     if verbose:
         t.stop()
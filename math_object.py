@@ -15,10 +15,11 @@ from typing import Tuple
 from collections import defaultdict
 from warnings import warn
 from psycopg2.sql import SQL, Identifier, Placeholder, Composed
-from psycopg2 import connect, OperationalError, Binary
+from psycopg2 import OperationalError, Binary
 from psycopg2.extras import NamedTupleCursor
 from latex_template import compile_pattern, template
-from config import config
+from db_pool import db_pool
+from db_utils import db_connection
 
 
 class RecordIDTypeError(UserWarning):
@@ -50,23 +51,20 @@ class MathObject:
         sql = "SELECT * FROM {tbl}"
         query = SQL(sql).format(tbl=Identifier(self.table))
 
-        db_params = config()
-        conn = connect(**db_params)
+        with db_connection() as conn:
+            cur = conn.cursor(cursor_factory=NamedTupleCursor)
 
-        cur = conn.cursor(cursor_factory=NamedTupleCursor)
-
-        if verbose:
-            print('Extracting records from Table: {aTable}'.format(aTable=self.table))
+            if verbose:
+                print('Extracting records from Table: {aTable}'.format(aTable=self.table))
 
-        try:
-            cur.execute(query)
-        except OperationalError as error:
-            print(error)
+            try:
+                cur.execute(query)
+            except OperationalError as error:
+                print(error)
 
-        records = cur.fetchall()
+            records = cur.fetchall()
 
-        cur.close()
-        conn.close()
+            cur.close()
 
         if as_columns is True:
             records = self.as_columns(records)
@@ -83,7 +81,7 @@ class MathObject:
         if data is None:
             data = {}
 
-        db_params = config()
+        db_params = db_pool().db_params
 
         next_id: int = self.record_count_total(verbose=verbose) + 1
 
@@ -122,27 +120,25 @@ class MathObject:
                                 fields=SQL(', ').join(map(Identifier, keys)),
                                 values=SQL(', ').join(map(Placeholder, keys)))
 
-        conn = connect(**db_params)
-
-        if verbose:
-            print(query.as_string(conn))
+        with db_connection() as conn:
+            if verbose:
+                print(query.as_string(conn))
 
-        cur = conn.cursor(cursor_factory=NamedTupleCursor)
+            cur = conn.cursor(cursor_factory=NamedTupleCursor)
 
-        if verbose:
-            print('Adding new record to Table: {aTable}'.format(aTable=self.table))
+            if verbose:
+                print('Adding new record to Table: {aTable}'.format(aTable=self.table))
 
-        try:
-            cur.execute(query, data)
-        except OperationalError as error:
-            print(error)
+            try:
+                cur.execute(query, data)
+            except OperationalError as error:
+                print(error)
 
-        new_records = cur.fetchall()
+            new_records = cur.fetchall()
 
-        conn.commit()
+            conn.commit()
 
-        cur.close()
-        conn.close()
+            cur.close()
 
         if parent_id is not None:
             for record in new_records:
@@ -168,7 +164,7 @@ class MathObject:
             if data is None:
                 data = {}
 
-            db_params = config()
+            db_params = db_pool().db_params
 
             data.update(self._add_field('name', name))
             data.update(self._add_field('notes', notes))
@@ -202,24 +198,23 @@ class MathObject:
 
                 data.update(where_key=an_id)
 
-                conn = connect(**db_params)
-                cur = conn.cursor(cursor_factory=NamedTupleCursor)
+                with db_connection() as conn:
+                    cur = conn.cursor(cursor_factory=NamedTupleCursor)
 
-                if verbose:
-                    print(query.as_string(conn))
-                    print(cur.mogrify(query, data))
+                    if verbose:
+                        print(query.as_string(conn))
+                        print(cur.mogrify(query, data))
 
-                try:
-                    cur.execute(query, data)
-                except OperationalError as error:
-                    print(error)
+                    try:
+                        cur.execute(query, data)
+                    except OperationalError as error:
+                        print(error)
 
-                new_record = cur.fetchall()
+                    new_record = cur.fetchall()
 
-                conn.commit()
+                    conn.commit()
 
-                cur.close()
-                conn.close()
+                    cur.close()
 
                 self.last_inserted = self.as_columns(new_record)
 
@@ -292,38 +287,35 @@ class MathObject:
             if kwargs[a_key] is True:
                 fields.append(a_key)
 
-        db_params = config()
-        conn = connect(**db_params)
-
-        if where_values is None:
-            sql = "SELECT {fields} FROM {table}"
-            query = SQL(sql).format(table=Identifier(self.table),
-                                    fields=SQL(', ').join(map(Identifier, fields)))
-            if verbose:
-                print(query.as_string(conn))
-        else:
-            sql = "SELECT {fields} from {table} where {pkey} IN %s"
-            query = SQL(sql).format(table=Identifier(self.table),
-                                    fields=SQL(', ').join(map(Identifier, fields)),
-                                    pkey=Identifier(where_key)
-                                    )
-            if verbose:
-                print(query.as_string(conn))
+        with db_connection() as conn:
+            if where_values is None:
+                sql = "SELECT {fields} FROM {table}"
+                query = SQL(sql).format(table=Identifier(self.table),
+                                        fields=SQL(', ').join(map(Identifier, fields)))
+                if verbose:
+                    print(query.as_string(conn))
+            else:
+                sql = "SELECT {fields} from {table} where {pkey} IN %s"
+                query = SQL(sql).format(table=Identifier(self.table),
+                                        fields=SQL(', ').join(map(Identifier, fields)),
+                                        pkey=Identifier(where_key)
+                                        )
+                if verbose:
+                    print(query.as_string(conn))
 
-        cur = conn.cursor(cursor_factory=NamedTupleCursor)
+            cur = conn.cursor(cursor_factory=NamedTupleCursor)
 
-        if verbose:
-            print('Extracting records from Table: {aTable}'.format(aTable=self.table))
+            if verbose:
+                print('Extracting records from Table: {aTable}'.format(aTable=self.table))
 
-        try:
-            cur.execute(query, where_values)
-        except OperationalError as error:
-            print(error)
+            try:
+                cur.execute(query, where_values)
+            except OperationalError as error:
+                print(error)
 
-        records = cur.fetchall()
+            records = cur.fetchall()
 
-        cur.close()
-        conn.close()
+            cur.close()
 
         if as_column is True:
             records = self.as_columns(records)
@@ -336,20 +328,17 @@ class MathObject:
 
         query = SQL(sql).format(table=Identifier(self.table))
 
-        db_params = config()
-        conn = connect(**db_params)
+        with db_connection() as conn:
+            cur = conn.cursor(cursor_factory=NamedTupleCursor)
 
-        cur = conn.cursor(cursor_factory=NamedTupleCursor)
-
-        if verbose:
-            print('Getting Count of Records in table: {table}'.format(table=self.table))
+            if verbose:
+                print('Getting Count of Records in table: {table}'.format(table=self.table))
 
-        cur.execute(query)  # self.table))
+            cur.execute(query)  # self.table))
 
-        record_count = cur.fetchone()
+            record_count = cur.fetchone()
 
-        cur.close()
-        conn.close()
+            cur.close()
 
         return record_count[0]
 
@@ -369,31 +358,28 @@ class MathObject:
                                 parent_key=Identifier(self.parent_key())
                                 )
 
-        db_params = config()
-        conn = connect(**db_params)
+        with db_connection() as conn:
+            cur = conn.cursor(cursor_factory=NamedTupleCursor)
 
-        cur = conn.cursor(cursor_factory=NamedTupleCursor)
-
-        if verbose:
-            print('Getting Count of Records in table: {table} for Group ID: {gid}'.format(table=self.join_table(),
-                                                                                          gid=parent_id))
-            print(query.as_string(conn))
-            if isinstance(parent_id, int):
-                cur.mogrify(query, parent_id)
-            elif isinstance(parent_id, tuple):
-                cur.mogrify(query, (parent_id, ))
+            if verbose:
+                print('Getting Count of Records in table: {table} for Group ID: {gid}'.format(table=self.join_table(),
+                                                                                              gid=parent_id))
+                print(query.as_string(conn))
+                if isinstance(parent_id, int):
+                    cur.mogrify(query, parent_id)
+                elif isinstance(parent_id, tuple):
+                    cur.mogrify(query, (parent_id, ))
 
-        try:
-            cur.execute(query, (parent_id,))
-        except TypeError:
-            cur.execute(query, parent_id)  # self.table))
-        except OperationalError as error:
-            print(error)
+            try:
+                cur.execute(query, (parent_id,))
+            except TypeError:
+                cur.execute(query, parent_id)  # self.table))
+            except OperationalError as error:
+                print(error)
 
-        record_count = cur.fetchone()
+            record_count = cur.fetchone()
 
-        cur.close()
-        conn.close()
+            cur.close()
 
         return record_count[0]
 
@@ -406,7 +392,7 @@ class MathObject:
 
         join_table = self.table + '_' + self.parent_table
 
-        db_params = config()
+        db_params = db_pool().db_params
 
         if data is None:
             data = {}
@@ -428,30 +414,27 @@ class MathObject:
                                 fields=SQL(', ').join(map(Identifier, keys)),
                                 values=SQL(', ').join(map(Placeholder, keys)))
 
-        conn = connect(**db_params)
-
-        if verbose:
-            print(query.as_string(conn))
+        with db_connection() as conn:
+            if verbose:
+                print(query.as_string(conn))
 
-        cur = conn.cursor(cursor_factory=NamedTupleCursor)
+            cur = conn.cursor(cursor_factory=NamedTupleCursor)
 
-        if verbose:
-            print('Adding new record to Table: {aTable}'.format(aTable=join_table))
+            if verbose:
+                print('Adding new record to Table: {aTable}'.format(aTable=join_table))
 
-        try:
-            cur.execute(query, data)
-        except OperationalError as error:
-            print(error)
+            try:
+                cur.execute(query, data)
+            except OperationalError as error:
+                print(error)
 
-        conn.commit()
+            conn.commit()
 
-        cur.close()
-        conn.close()
+            cur.close()
 
     def get_records_for_parent(self, parent_id: Tuple[int, ...] = None, as_columns: bool = True,
                                verbose: bool = False):
         """Get the {table} records for {parent}""".format(table=self.table, parent=self.parent_table)
-        db_params = config()
 
         sql = "SELECT * FROM {child_table} c INNER JOIN {join_table} j " \
               " USING({id_name}) WHERE j.{parent_id_name} = %s ORDER BY insertion_order;"
@@ -463,28 +446,26 @@ class MathObject:
             parent_id_name=Identifier(self.parent_key())
         )
 
-        conn = connect(**db_params)
-
-        cur = conn.cursor(cursor_factory=NamedTupleCursor)
+        with db_connection() as conn:
+            cur = conn.cursor(cursor_factory=NamedTupleCursor)
 
-        if verbose:
-            print(query.as_string(conn))
-            if isinstance(parent_id, int):
-                cur.mogrify(query, parent_id)
-            elif isinstance(parent_id, tuple):
-                cur.mogrify(query, (parent_id, ))
+            if verbose:
+                print(query.as_string(conn))
+                if isinstance(parent_id, int):
+                    cur.mogrify(query, parent_id)
+                elif isinstance(parent_id, tuple):
+                    cur.mogrify(query, (parent_id, ))
 
-        try:
-            cur.execute(query, (parent_id, ))
-        except TypeError:
-            cur.execute(query, parent_id)
-        except OperationalError as error:
-            print(error)
+            try:
+                cur.execute(query, (parent_id, ))
+            except TypeError:
+                cur.execute(query, parent_id)
+            except OperationalError as error:
+                print(error)
 
-        records = cur.fetchall()
+            records = cur.fetchall()
 
-        cur.close()
-        conn.close()
+            cur.close()
 
         if as_columns is True:
             records = self.as_columns(records)
@@ -493,7 +474,6 @@ class MathObject:
 
     def records_not_in_parent(self, parent_id: Tuple[int, ...], as_columns: bool = True, verbose: bool = False):
         """Get the {table} records for {parent}""".format(table=self.table, parent=self.parent_table)
-        db_params = config()
         sql = ''
 
         sql = "SELECT * FROM {child_table} WHERE {id_name} NOT IN" \
@@ -511,31 +491,29 @@ class MathObject:
             parent_id_name=Identifier(self.parent_key())
         )
 
-        conn = connect(**db_params)
+        with db_connection() as conn:
+            cur = conn.cursor(cursor_factory=NamedTupleCursor)
 
-        cur = conn.cursor(cursor_factory=NamedTupleCursor)
-
-        if verbose:
-            print(query.as_string(conn))
-            if isinstance(parent_id, int):
-                cur.mogrify(query, (parent_id, ))
-            elif isinstance(parent_id, tuple):
-                cur.mogrify(query, parent_id)
+            if verbose:
+                print(query.as_string(conn))
+                if isinstance(parent_id, int):
+                    cur.mogrify(query, (parent_id, ))
+                elif isinstance(parent_id, tuple):
+                    cur.mogrify(query, parent_id)
 
-        try:
-            cur.execute(query, (parent_id, ))
-        except TypeError:
-            cur.execute(query, parent_id)
-        except OperationalError as error:
-            print(error)
+            try:
+                cur.execute(query, (parent_id, ))
+            except TypeError:
+                cur.execute(query, parent_id)
+            except OperationalError as error:
+                print(error)
 
-        records = cur.fetchall()
+            records = cur.fetchall()
 
-        if as_columns is True:
-            records = self.as_columns(records)
+            if as_columns is True:
+                records = self.as_columns(records)
 
-        cur.close()
-        conn.close()
+            cur.close()
         return records
 
     def parent_key(self):
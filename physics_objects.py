@@ -12,10 +12,10 @@ from typing import Optional, List, Tuple, NamedTuple
 from pandas import DataFrame, read_sql, Timestamp
 from psycopg2.sql import SQL, Identifier, Placeholder, Composed
 from psycopg2 import OperationalError
-from psycopg2.extras import NamedTupleCursor
-from latex_data import LatexData
-from time_logging import TimeLogger
-from db_utils import my_connect
+from query_stats import InstrumentedNamedTupleCursor
+from latex_data import LatexData, latex_data_column
+from time_logging import TimeLogger, span
+from db_utils import my_connect, db_connection
 
 
 class NoRecordIDError(UserWarning):
@@ -30,16 +30,11 @@ def generic_pull_data(table_name: str = None, my_conn: Optional[dict] = None,
     query = SQL('SELECT * FROM {table}').format(table=Identifier(table_name))
 
     my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-    conn = my_conn['conn']
 
-    data_df = read_sql(query, con=conn, index_col=table_id_name)
+    with db_connection(my_conn) as conn, span('read_sql', 'db', table=table_name):
+        data_df = read_sql(query, con=conn, index_col=table_id_name)
 
-    data_df['latex_obj'] = None
-
-    for row in data_df.itertuples():
-        data_df.loc[row.Index, 'latex_obj'] = \
-            LatexData(my_conn=my_conn, latex=row.latex, template_id=row.template_id,
-                      image=row.image, compiled_at=row.compiled_at)
+    data_df['latex_obj'] = latex_data_column(data_df, my_conn=my_conn, t_log=t_log, verbose=verbose)
 
     return data_df
 
@@ -59,7 +54,6 @@ def generic_new_record_db(table_name: str = None, data_df: Optional[DataFrame] =
         new_record = {}
 
     my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-    conn = my_conn['conn']
     db_params = my_conn['db_params']
 
     next_id: int = generic_record_count(data_df) + 1
@@ -72,7 +66,9 @@ def generic_new_record_db(table_name: str = None, data_df: Optional[DataFrame] =
     if latex is None:
         latex = LatexData()
 
-    new_record.update(name=name, notes=notes, latex=latex.latex, image=latex.image, compiled_at=latex.compiled_at,
+    new_record.update(name=name, notes=notes, latex=latex.latex, image=latex.image,
+                      thumbnail=latex.thumbnail_image(), **add_field('svg', latex.vector_image()),
+                      compiled_at=latex.compiled_at,
                       template_id=latex.template_id, created_by=created_by)
 
     query = SQL('INSERT INTO {table} ({fields}) VALUES ({values})'
@@ -80,21 +76,22 @@ def generic_new_record_db(table_name: str = None, data_df: Optional[DataFrame] =
                          fields=SQL(', ').join(map(Identifier, new_record.keys())),
                          values=SQL(', ').join(map(Placeholder, new_record.keys())))
 
-    if verbose:
-        print(query.as_string(conn))
+    with db_connection(my_conn) as conn:
+        if verbose:
+            print(query.as_string(conn))
 
-    cur = conn.cursor(cursor_factory=NamedTupleCursor)
+        cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-    if verbose:
-        print('Adding new record to Table: {aTable}'.format(aTable=table_name))
+        if verbose:
+            print('Adding new record to Table: {aTable}'.format(aTable=table_name))
 
-    try:
-        cur.execute(query, new_record)
-    except OperationalError as error:
-        print(error)
+        try:
+            cur.execute(query, new_record)
+        except OperationalError as error:
+            print(error)
 
-    conn.commit()
-    cur.close()
+        conn.commit()
+        cur.close()
     updated_df = \
         generic_pull_data(table_name=table_name, my_conn=my_conn, t_log=t_log, verbose=verbose)
     return updated_df
@@ -114,6 +111,8 @@ class PhysicsObject(NamedTuple):
     latex: str
     notes: str
     image: bytes
+    thumbnail: bytes
+    svg: bytes
     template_id: int
     image_is_dirty: bool
     created_at: Timestamp
@@ -121,7 +120,7 @@ class PhysicsObject(NamedTuple):
     modified_at: Timestamp
     modified_by: str
     compiled_at: Timestamp
-    dimension: int
+    dimensions: int
     unit_id: int
     type_name: str
     latex_obj: LatexData
@@ -203,7 +202,6 @@ class PhysicsObjects:
                 my_conn = self.my_conn
 
             my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-            conn = my_conn['conn']
             db_params = my_conn['db_params']
 
             data.update(add_field('name', name))
@@ -211,6 +209,8 @@ class PhysicsObjects:
             if latex is not None:
                 data.update(latex=latex.latex)
                 data.update(image=latex.image)
+                data.update(thumbnail=latex.thumbnail_image())
+                data.update(add_field('svg', latex.vector_image()))
                 data.update(template_id=latex.template_id)
                 data.update(compiled_at=latex.compiled_at)
             data.update(add_field('created_by', created_by))
@@ -241,26 +241,27 @@ class PhysicsObjects:
 
                 data.update(where_key=an_id)
 
-                cur = conn.cursor(cursor_factory=NamedTupleCursor)
+                with db_connection(my_conn) as conn:
+                    cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-                if verbose:
-                    print(query.as_string(conn))
-                    print(cur.mogrify(query, data))
+                    if verbose:
+                        print(query.as_string(conn))
+                        print(cur.mogrify(query, data))
 
-                try:
-                    cur.execute(query, data)
-                except OperationalError as error:
-                    print(error)
+                    try:
+                        cur.execute(query, data)
+                    except OperationalError as error:
+                        print(error)
 
-                conn.commit()
+                    conn.commit()
 
-                cur.close()
+                    cur.close()
 
                 self.pull_data(my_conn=my_conn, t_log=t_log, verbose=verbose)
 
     def record(self, an_id: int = None):
         """Returns individual record based on id"""
-        record_series: List = self.all_records_df.loc[an_id].to_list()
-        record_series.insert(0, an_id)
-        record = PhysicsObject(*record_series)
+        # By name, thumbnail and svg sit elsewhere in tables they were added to later, and svg may be missing
+        row = self.all_records_df.loc[an_id]
+        record = PhysicsObject(an_id, *[row.get(field) for field in PhysicsObject._fields[1:]])
         return record
@@ -0,0 +1,237 @@
+"""
+PixmapCache keeps decoded equation, variable and unit images, so an image shown again is painted without decoding
+its png again.
+
+Entries are keyed by (table, id, compiled_at) and a record holds one entry at a time: a lookup with a newer
+compiled_at misses and replaces the old pixmap, so a recompiled image is never served stale. LatexData also reports
+every recompile, and the pixmap shown for that LatexData is dropped right away instead of waiting to be evicted. The
+cache is bounded by the memory the decoded pixmaps take, width * height * depth, and evicts the least recently shown
+first.
+
+When renders are kept as SVG, record_pixmap draws the full image from the SVG at the device pixel ratio of the
+widget showing it, so it is sharp on any screen and a change of display scale only draws it again from the SVG.
+
+Pixmaps are made and used on the GUI thread only. Recompiles can be reported from any thread.
+
+Example:
+    pixmap = pixmap_cache().pixmap('equation', 12, record.compiled_at, lambda: eq.image(12))
+    pixmap = pixmap_cache().latex_pixmap(latex_obj, 'equation', 12)
+    pixmap = pixmap_cache().record_pixmap(eq, 12, record.compiled_at, view.devicePixelRatioF())
+"""
+
+__author__ = "William DeShazer"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import weakref
+from collections import OrderedDict
+from functools import partial
+from itertools import count
+from threading import RLock
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from PyQt5.QtCore import Qt, QByteArray
+from PyQt5.QtGui import QPixmap, QImage, QPainter
+from PyQt5.QtSvg import QSvgRenderer
+from latex_data import LatexData, LazyLatexData, on_recompile, on_records_recompile, vector_output
+from rasterize import DENSITY, SVG
+
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+LATEX_TABLE = 'latex'  # stands in for the table of a LatexData that isn't stored yet
+SVG_SCALE = DENSITY / 72  # logical pixels per point, the size the png renders are shown at
+
+ImageSource = Union[bytes, memoryview, Callable[[], Optional[bytes]], None]
+
+
+def pixmap_cost(pixmap: QPixmap) -> int:
+    """Bytes a decoded pixmap takes"""
+    return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+
+class PixmapCache:
+    """Size bounded, least recently used cache of decoded images, one per record"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+        self.decodes: int = 0
+        self.evictions: int = 0
+        self.size: int = 0
+        self._pixmaps: OrderedDict = OrderedDict()  # (table, id) -> (compiled_at, pixmap, cost), oldest first
+        # id() of a shown LatexData -> (weak reference to it, table, id of its pixmap), dropped when it is collected
+        self._sources: Dict[int, Tuple[weakref.ref, str, Any]] = {}
+        self._tokens = count(1)  # ids of pixmaps of LatexData that aren't stored yet
+        self._lock = RLock()
+
+    def _lookup(self, table: str, an_id, compiled_at) -> Optional[QPixmap]:
+        with self._lock:
+            entry = self._pixmaps.get((table, an_id))
+            if entry is None or entry[0] != compiled_at:
+                self.misses += 1
+                return None
+            self._pixmaps.move_to_end((table, an_id))
+            self.hits += 1
+            return entry[1]
+
+    def pixmap(self, table: str, an_id, compiled_at, image: ImageSource) -> Optional[QPixmap]:
+        """Decoded image of a record. image is the png data, or a callable returning it, and only used on a miss"""
+        pixmap = self._lookup(table, an_id, compiled_at)
+        if pixmap is not None:
+            return pixmap
+
+        if callable(image):
+            image = image()
+        if image is None:
+            return None
+
+        pixmap = QPixmap()
+        if not pixmap.loadFromData(bytes(image)):
+            return None
+        self.decodes += 1
+        self.put(table, an_id, compiled_at, pixmap)
+        return pixmap
+
+    def svg_pixmap(self, table: str, an_id, compiled_at, svg: ImageSource, device_pixel_ratio: float = 1.0,
+                   scale: float = SVG_SCALE) -> Optional[QPixmap]:
+        """SVG, or svgz, of a record drawn at scale logical pixels per point for a screen with device_pixel_ratio.
+           svg is only used on a miss"""
+        version = (compiled_at, SVG, device_pixel_ratio, scale)
+        pixmap = self._lookup(table, an_id, version)
+        if pixmap is not None:
+            return pixmap
+
+        if callable(svg):
+            svg = svg()
+        if svg is None:
+            return None
+
+        renderer = QSvgRenderer(QByteArray(bytes(svg)))  # gzip compressed data is recognized and inflated
+        if not renderer.isValid():
+            return None
+
+        size = renderer.defaultSize()
+        image = QImage(max(1, round(size.width() * scale * device_pixel_ratio)),
+                       max(1, round(size.height() * scale * device_pixel_ratio)), QImage.Format_ARGB32_Premultiplied)
+        image.fill(Qt.transparent)
+        painter = QPainter(image)
+        renderer.render(painter)
+        painter.end()
+
+        pixmap = QPixmap.fromImage(image)
+        pixmap.setDevicePixelRatio(device_pixel_ratio)
+        self.decodes += 1
+        self.put(table, an_id, version, pixmap)
+        return pixmap
+
+    def record_pixmap(self, store, an_id, compiled_at, device_pixel_ratio: float = 1.0) -> Optional[QPixmap]:
+        """Full image of a record of store, a GroupedPhysicsObject. Drawn from its SVG when renders are kept as SVG
+           and it has one, decoded from its png otherwise"""
+        pixmap = None
+        if vector_output():
+            pixmap = self.svg_pixmap(store.table_name, an_id, compiled_at, lambda: store.vector(an_id),
+                                     device_pixel_ratio=device_pixel_ratio)
+        if pixmap is None:
+            pixmap = self.pixmap(store.table_name, an_id, compiled_at, lambda: store.image(an_id))
+        return pixmap
+
+    def latex_pixmap(self, latex_obj: Union[LatexData, LazyLatexData], table: Optional[str] = None,
+                     an_id=None) -> Optional[QPixmap]:
+        """Decoded image of a LatexData. Without a table and id it is kept until the LatexData recompiles or is
+           collected"""
+        if isinstance(latex_obj, LazyLatexData):
+            latex_obj = latex_obj.resolve()  # recompiles are reported for the LatexData, not the stand in
+
+        with self._lock:
+            source = self._source(latex_obj)
+            if table is None or an_id is None:
+                if source is not None and source[1] == LATEX_TABLE:
+                    table, an_id = LATEX_TABLE, source[2]
+                else:
+                    table, an_id = LATEX_TABLE, next(self._tokens)
+            if source is None or source[1:] != (table, an_id):
+                self._forget(id(latex_obj))
+                ref = weakref.ref(latex_obj, partial(self._collected, id(latex_obj)))
+                self._sources[id(latex_obj)] = (ref, table, an_id)
+        return self.pixmap(table, an_id, latex_obj.compiled_at, lambda: latex_obj.image)
+
+    def _source(self, latex_obj: LatexData) -> Optional[Tuple[weakref.ref, str, Any]]:
+        # id() is reused once an object is collected, so the entry has to still point at latex_obj
+        source = self._sources.get(id(latex_obj))
+        if source is None or source[0]() is not latex_obj:
+            return None
+        return source
+
+    def _forget(self, key: int):
+        source = self._sources.pop(key, None)
+        if source is not None and source[1] == LATEX_TABLE:
+            self.invalidate(LATEX_TABLE, source[2])  # nothing else can look an unstored LatexData's pixmap up
+
+    def _collected(self, key: int, ref: weakref.ref):
+        with self._lock:
+            source = self._sources.get(key)
+            if source is not None and source[0] is ref:
+                self._forget(key)
+
+    def put(self, table: str, an_id, compiled_at, pixmap: QPixmap):
+        """Store the pixmap of a record in place of any older one and evict until the cache fits in max_bytes"""
+        cost = pixmap_cost(pixmap)
+        with self._lock:
+            self.invalidate(table, an_id)
+            self._pixmaps[(table, an_id)] = (compiled_at, pixmap, cost)
+            self.size += cost
+
+            while self.size > self.max_bytes and len(self._pixmaps) > 1:
+                _, (_, _, old_cost) = self._pixmaps.popitem(last=False)
+                self.size -= old_cost
+                self.evictions += 1
+
+    def invalidate(self, table: Optional[str] = None, an_id=None):
+        """Forget the pixmap of one record, of a whole table when an_id is None, or everything when table is None"""
+        with self._lock:
+            if table is None:
+                self._pixmaps.clear()
+                self._sources.clear()
+                self.size = 0
+            elif an_id is None:
+                for key in [key for key in self._pixmaps if key[0] == table]:
+                    self.size -= self._pixmaps.pop(key)[2]
+            elif (table, an_id) in self._pixmaps:
+                self.size -= self._pixmaps.pop((table, an_id))[2]
+
+    def recompiled(self, latex_obj: LatexData):
+        """Drop the pixmap shown for a LatexData that was just recompiled"""
+        with self._lock:
+            source = self._source(latex_obj)
+            if source is not None:
+                self._sources.pop(id(latex_obj))
+                self.invalidate(source[1], source[2])
+
+    def records_recompiled(self, table: str, ids: List[int]):
+        """Drop the pixmaps of stored records that were just recompiled"""
+        with self._lock:
+            for an_id in ids:
+                self.invalidate(table, an_id)
+
+    def stats(self) -> dict:
+        """Snapshot of the cache counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(hits=self.hits, misses=self.misses, decodes=self.decodes, evictions=self.evictions,
+                        hit_rate=self.hits / lookups if lookups > 0 else 0.0,
+                        entries=len(self._pixmaps), size=self.size, max_bytes=self.max_bytes)
+
+    def __len__(self):
+        return len(self._pixmaps)
+
+
+_PIXMAP_CACHE: Optional[PixmapCache] = None
+
+
+def pixmap_cache() -> PixmapCache:
+    """Process wide pixmap cache, created on first use"""
+    global _PIXMAP_CACHE  # pylint: disable=global-statement
+    if _PIXMAP_CACHE is None:
+        _PIXMAP_CACHE = PixmapCache()
+        on_recompile(_PIXMAP_CACHE.recompiled)
+        on_records_recompile(_PIXMAP_CACHE.records_recompiled)
+    return _PIXMAP_CACHE
@@ -0,0 +1,263 @@
+"""
+QueryStats aggregates the latency of every statement the application runs, grouped by statement fingerprint.
+
+A fingerprint is the statement text with literals replaced by ? and value lists collapsed, so the same query with
+different ids or a different number of VALUES rows lands in one entry. For each fingerprint the call count, total and
+p95 latency, rows returned and the bytes sent are kept. Sizing every fetched value costs a pass over the rows in
+Python, so an estimate of the bytes received is only kept when EQ_DB_QUERY_BYTES is set. The pooled connections create
+InstrumentedCursor by default and InstrumentedNamedTupleCursor stands in wherever a NamedTupleCursor is wanted, so
+every query of the application is counted.
+
+The aggregates can be read at any time through query_stats(). When EQ_DB_QUERY_STATS is set the slowest statements
+are reported at exit, as JSON when it names a .json file and as a text table on stdout when it is '-'.
+
+Example:
+    cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
+    ...
+    print(query_stats().format_report(top=10))
+
+https://www.psycopg.org/docs/advanced.html#subclassing-cursor
+"""
+
+__author__ = "William DeShazer"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import re
+import os
+import json
+import atexit
+from time import perf_counter
+from collections import deque
+from threading import Lock
+from typing import Dict, List, Optional
+from psycopg2.extensions import cursor
+from psycopg2.extras import NamedTupleCursor
+
+STATS_ENV = 'EQ_DB_QUERY_STATS'  # '-' prints the report at exit, a .json path writes it there
+BYTES_ENV = 'EQ_DB_QUERY_BYTES'  # set to also size the rows every fetch returns
+FINGERPRINT_CHARS = 4096  # only the head of huge statements, such as execute_values pages, is fingerprinted
+SAMPLES = 1024  # latest latencies kept per fingerprint for the percentile
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_OPEN_STRING = re.compile(r"'(?:[^']|'')*$")  # a literal cut off by FINGERPRINT_CHARS
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIST = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_LISTS = re.compile(r'(\(\?\)\s*,\s*)+\(\?\)')
+_ARRAY = re.compile(r'ARRAY\[[^\]]*\]', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(query) -> str:
+    """Statement text with literals replaced by ? and repeated value lists collapsed"""
+    if isinstance(query, (bytes, bytearray, memoryview)):
+        query = bytes(query[:FINGERPRINT_CHARS]).decode('utf-8', 'replace')
+    text = query[:FINGERPRINT_CHARS]
+    text = _STRING.sub('?', text)
+    text = _OPEN_STRING.sub('?', text)
+    text = _NUMBER.sub('?', text)
+    text = _ARRAY.sub('ARRAY[?]', text)
+    text = _LIST.sub('(?)', text)
+    text = _LISTS.sub('(?)', text)
+    return _SPACE.sub(' ', text).strip()
+
+
+def _row_bytes(rows) -> int:
+    size = 0
+    for row in rows:
+        for value in row:
+            if isinstance(value, (str, bytes, bytearray, memoryview)):
+                size += len(value)
+            else:
+                size += 8
+    return size
+
+
+class QueryEntry:
+    """Aggregates of one statement fingerprint"""
+
+    def __init__(self, statement: str):
+        self.statement = statement
+        self.calls: int = 0
+        self.total: float = 0.0
+        self.max: float = 0.0
+        self.rows: int = 0
+        self.bytes_sent: int = 0
+        self.bytes_received: int = 0
+        self.samples: deque = deque(maxlen=SAMPLES)
+
+    def percentile(self, fraction: float) -> float:
+        """Latency below which fraction of the recent calls finished"""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def as_dict(self) -> dict:
+        """Aggregates as plain data"""
+        return dict(statement=self.statement, calls=self.calls, total=self.total,
+                    mean=self.total / self.calls if self.calls else 0.0, p95=self.percentile(0.95), max=self.max,
+                    rows=self.rows, bytes_sent=self.bytes_sent, bytes_received=self.bytes_received)
+
+
+class QueryStats:
+    """Thread safe per fingerprint aggregates"""
+
+    def __init__(self, enabled: bool = True, count_bytes: Optional[bool] = None):
+        self.enabled = enabled
+        self.count_bytes = os.environ.get(BYTES_ENV, '') not in ('', '0') if count_bytes is None else count_bytes
+        self._entries: Dict[str, QueryEntry] = {}
+        self._lock = Lock()
+
+    def _entry(self, statement: str) -> QueryEntry:
+        entry = self._entries.get(statement)
+        if entry is None:
+            entry = self._entries.setdefault(statement, QueryEntry(statement))
+        return entry
+
+    def record(self, statement: str, elapsed: float, rows: int = 0, bytes_sent: int = 0):
+        """Count one execution of statement"""
+        with self._lock:
+            entry = self._entry(statement)
+            entry.calls += 1
+            entry.total += elapsed
+            entry.max = max(entry.max, elapsed)
+            entry.rows += max(rows, 0)
+            entry.bytes_sent += bytes_sent
+            entry.samples.append(elapsed)
+
+    def received(self, statement: str, rows: int, size: int):
+        """Count rows fetched for statement. Only cursors without a rowcount, the named ones, add to rows here"""
+        with self._lock:
+            entry = self._entry(statement)
+            entry.rows += rows
+            entry.bytes_received += size
+
+    def report(self, top: Optional[int] = None, sort: str = 'total') -> List[dict]:
+        """Aggregates per fingerprint, largest sort key first"""
+        with self._lock:
+            entries = [entry.as_dict() for entry in self._entries.values()]
+        entries.sort(key=lambda entry: entry[sort], reverse=True)
+        return entries if top is None else entries[:top]
+
+    def format_report(self, top: Optional[int] = 20, sort: str = 'total') -> str:
+        """Slow query report as a text table"""
+        lines = ['{:>7} {:>10} {:>10} {:>10} {:>9} {:>12}  {}'.format('calls', 'total s', 'p95 ms', 'max ms', 'rows',
+                                                                      'bytes in', 'statement')]
+        for entry in self.report(top=top, sort=sort):
+            lines.append('{calls:>7d} {total:>10.3f} {p95_ms:>10.2f} {max_ms:>10.2f} {rows:>9d} {bytes_received:>12d}'
+                         '  {short}'.format(p95_ms=entry['p95'] * 1000, max_ms=entry['max'] * 1000,
+                                            short=entry['statement'][:120], **entry))
+        return '\n'.join(lines)
+
+    def dump(self, path: str, top: Optional[int] = None, sort: str = 'total'):
+        """Write the report as JSON"""
+        with open(path, 'w') as stats_file:
+            json.dump(self.report(top=top, sort=sort), stats_file, indent=2)
+
+    def clear(self):
+        """Forget every aggregate"""
+        with self._lock:
+            self._entries.clear()
+
+
+_QUERY_STATS: Optional[QueryStats] = None
+
+
+def query_stats() -> QueryStats:
+    """Process wide query aggregates, created on first use"""
+    global _QUERY_STATS  # pylint: disable=global-statement
+    if _QUERY_STATS is None:
+        _QUERY_STATS = QueryStats()
+    return _QUERY_STATS
+
+
+class InstrumentedCursorMixin:
+    """Times execute and executemany and counts what the fetch methods return"""
+    _statement: Optional[str] = None
+
+    def _timed(self, method, query, args):
+        stats = query_stats()
+        if stats.enabled is False:
+            return method(query, args)
+
+        before = self.query
+        started = perf_counter()
+        try:
+            return method(query, args)
+        finally:
+            # The text psycopg2 already built for the server, a Composable is only rendered when the statement
+            # failed before anything was sent
+            sent = self.query
+            if sent is None or sent is before:
+                sent = query.as_string(self.connection) if hasattr(query, 'as_string') else query
+            self._statement = fingerprint(sent)
+            # Named cursors only know their rows once they are fetched
+            rows = self.rowcount if getattr(self, 'name', None) is None else 0
+            stats.record(self._statement, perf_counter() - started, rows=rows,
+                         bytes_sent=len(self.query) if self.query is not None else 0)
+
+    def execute(self, query, args=None):
+        return self._timed(super().execute, query, args)
+
+    def executemany(self, query, args):
+        return self._timed(super().executemany, query, args)
+
+    def _fetched(self, rows):
+        if self._statement is None or not rows:
+            return rows
+
+        # Only named cursors count their rows here, and sizes only when asked for
+        stats = query_stats()
+        named = getattr(self, 'name', None) is not None
+        if named or stats.count_bytes:
+            stats.received(self._statement, len(rows) if named else 0,
+                           _row_bytes(rows) if stats.count_bytes else 0)
+        return rows
+
+    def fetchone(self):
+        row = super().fetchone()
+        return row if row is None else self._fetched([row])[0]
+
+    def fetchmany(self, size=None):
+        return self._fetched(super().fetchmany(self.arraysize if size is None else size))
+
+    def fetchall(self):
+        return self._fetched(super().fetchall())
+
+    def __iter__(self):
+        # next() on the base iterator, iterating it with for would come back here for cursors that return self
+        iterator = super().__iter__()
+        rows: list = []
+        try:
+            while True:
+                try:
+                    row = next(iterator)
+                except StopIteration:
+                    return
+                rows.append(row)
+                if len(rows) == self.itersize:
+                    self._fetched(rows)
+                    rows = []
+                yield row
+        finally:
+            self._fetched(rows)
+
+
+class InstrumentedCursor(InstrumentedCursorMixin, cursor):
+    """Plain cursor counted in query_stats()"""
+
+
+class InstrumentedNamedTupleCursor(InstrumentedCursorMixin, NamedTupleCursor):
+    """NamedTupleCursor counted in query_stats()"""
+
+
+@atexit.register
+def _report_query_stats():
+    target = os.environ.get(STATS_ENV)
+    if not target or _QUERY_STATS is None:
+        return
+    if target == '-':
+        print(_QUERY_STATS.format_report())
+    else:
+        _QUERY_STATS.dump(target)
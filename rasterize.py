@@ -0,0 +1,166 @@
+"""
+Rasterize turns the PDF produced by xelatex into PNG data in memory.
+
+Pages are rendered with PyMuPDF and encoded with Pillow, so no extra process is spawned and no PNG ever touches the
+disk. All pages of a multi-page document are rendered from one open document. If PyMuPDF isn't installed the
+ImageMagick convert program is used instead, which is what every compile used to do.
+
+make_thumbnail scales a full render down to THUMBNAIL_DENSITY for lists and tables, which is far cheaper than a
+second rasterization and needs nothing but Pillow.
+
+vectorize turns the pages into gzip compressed SVG instead, with the glyphs as paths so no font is needed to show
+them. It needs PyMuPDF, VECTOR_AVAILABLE tells whether it can be used.
+
+Example:
+    png_data = rasterize_page('LaTeX/eq_db.pdf', density=300)
+    thumbnail = make_thumbnail(png_data)
+    svgz_data = vectorize_page('LaTeX/eq_db.pdf')
+
+PyMuPDF: https://pymupdf.readthedocs.io/en/latest/
+"""
+
+__author__ = "William DeShazer"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import os
+import gzip
+import tempfile
+import subprocess
+from io import BytesIO
+from pathlib import Path
+from typing import List, Optional, Union
+from PIL import Image
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+CONVERT = 'convert.exe' if os.name == 'nt' else 'convert'
+VECTOR_AVAILABLE = fitz is not None
+
+PNG = 'png'  # render outputs, also the render cache variants
+SVG = 'svg'
+
+DENSITY = 300  # dpi
+DEPTH = 8  # bits per channel, lower values are palette quantized
+COMPRESS_LEVEL = 8  # zlib level 0-9, matches the -quality 85 the convert step used
+THUMBNAIL_DENSITY = 100  # dpi, about the size text is shown at on screen
+
+
+def encode_png(image: Image.Image, depth: int = DEPTH, compress_level: int = COMPRESS_LEVEL) -> bytes:
+    """Encode an RGBA image as PNG data"""
+    if depth < 8:
+        image = image.quantize(colors=2 ** depth, method=Image.FASTOCTREE)
+
+    stream = BytesIO()
+    image.save(stream, format='PNG', compress_level=compress_level)
+    return stream.getvalue()
+
+
+def make_thumbnail(png_data: Optional[bytes], density: int = THUMBNAIL_DENSITY, source_density: int = DENSITY,
+                   compress_level: int = COMPRESS_LEVEL) -> Optional[bytes]:
+    """PNG data of a render rendered at source_density scaled down to density. None when there is no render"""
+    if png_data is None:
+        return None
+
+    with Image.open(BytesIO(bytes(png_data))) as image:
+        image = image.convert('RGBA')
+    scale = density / source_density
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return encode_png(image.resize(size, Image.LANCZOS), compress_level=compress_level)
+
+
+def rasterize(pdf: Union[str, Path, bytes], density: int = DENSITY, depth: int = DEPTH,
+              compress_level: int = COMPRESS_LEVEL, pages: Optional[List[int]] = None) -> List[bytes]:
+    """PNG data for every page, or the listed pages, of a PDF given as a path or as bytes"""
+    if fitz is None:
+        return _rasterize_with_convert(pdf, density=density, depth=depth, compress_level=compress_level,
+                                       pages=pages)
+
+    if isinstance(pdf, bytes):
+        document = fitz.open(stream=pdf, filetype='pdf')
+    else:
+        document = fitz.open(str(pdf))
+
+    zoom = density / 72  # PDF user space is 72 points per inch
+    matrix = fitz.Matrix(zoom, zoom)
+
+    png_pages = []
+    try:
+        for page_number in range(document.page_count) if pages is None else pages:
+            pixmap = document[page_number].get_pixmap(matrix=matrix, alpha=True)
+            image = Image.frombytes('RGBA', (pixmap.width, pixmap.height), pixmap.samples)
+            png_pages.append(encode_png(image, depth=depth, compress_level=compress_level))
+    finally:
+        document.close()
+
+    return png_pages
+
+
+def rasterize_page(pdf: Union[str, Path, bytes], page: int = 0, density: int = DENSITY, depth: int = DEPTH,
+                   compress_level: int = COMPRESS_LEVEL) -> Optional[bytes]:
+    """PNG data for a single page. None when the page wasn't rasterized, which only the convert fallback does"""
+    png_pages = rasterize(pdf, density=density, depth=depth, compress_level=compress_level, pages=[page])
+    return png_pages[0] if len(png_pages) > 0 else None
+
+
+def vectorize(pdf: Union[str, Path, bytes], pages: Optional[List[int]] = None) -> List[bytes]:
+    """Gzip compressed SVG data for every page, or the listed pages, of a PDF given as a path or as bytes"""
+    if fitz is None:
+        raise RuntimeError('SVG output needs PyMuPDF')
+
+    if isinstance(pdf, bytes):
+        document = fitz.open(stream=pdf, filetype='pdf')
+    else:
+        document = fitz.open(str(pdf))
+
+    svg_pages = []
+    try:
+        for page_number in range(document.page_count) if pages is None else pages:
+            svg = document[page_number].get_svg_image(text_as_path=True)
+            svg_pages.append(gzip.compress(svg.encode('utf-8'), compresslevel=9))
+    finally:
+        document.close()
+
+    return svg_pages
+
+
+def vectorize_page(pdf: Union[str, Path, bytes], page: int = 0) -> bytes:
+    """Gzip compressed SVG data for a single page"""
+    return vectorize(pdf, pages=[page])[0]
+
+
+def _rasterize_with_convert(pdf: Union[str, Path, bytes], density: int = DENSITY, depth: int = DEPTH,
+                            compress_level: int = COMPRESS_LEVEL, pages: Optional[List[int]] = None) -> List[bytes]:
+    """Fallback through ImageMagick. Works in a scratch directory and reads the pages back"""
+    with tempfile.TemporaryDirectory(prefix='eq_db_raster_') as work_dir:
+        work_dir = Path(work_dir)
+
+        if isinstance(pdf, bytes):
+            pdf_path = work_dir / 'page.pdf'
+            with open(pdf_path, 'wb') as file:
+                file.write(pdf)
+        else:
+            pdf_path = Path(pdf).resolve()
+
+        try:
+            # png32 always writes 8 bit RGBA, so depth only applies to the PyMuPDF path
+            subprocess.run([CONVERT, '-density', str(density), '-depth', '8',
+                            '-quality', str(compress_level * 10 + 5), str(pdf_path),
+                            'png32:' + str(work_dir / 'page-%d.png')],
+                           shell=os.name == 'nt', capture_output=True, text=True, check=True)
+        except subprocess.CalledProcessError as error:
+            print('Failed to make png:')
+            print(error.output)
+
+        png_pages = []
+        page_number = 0
+        while (work_dir / 'page-{}.png'.format(page_number)).exists():
+            if pages is None or page_number in pages:
+                with open(work_dir / 'page-{}.png'.format(page_number), 'rb') as file:
+                    png_pages.append(file.read())
+            page_number += 1
+
+    return png_pages
@@ -0,0 +1,181 @@
+"""
+RenderCache provides a content-addressed store for compiled LaTeX images. A render is identified by a hash of the
+normalized pattern, the full template text and the rasterize settings, so the same (latex, template) pair is only
+ever compiled once at a given density and depth.
+
+The store lives on disk so that it survives restarts. It is bounded in size and evicts the least recently used
+renders first. Hit/miss counters are kept per process.
+
+Example:
+    cache = render_cache()
+    key = cache.key(pattern, template_text)
+    png_data = cache.get(key)
+"""
+
+__author__ = "William DeShazer"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import os
+from hashlib import sha256
+from collections import OrderedDict
+from pathlib import Path
+from threading import RLock
+from typing import Optional
+from rasterize import DENSITY, DEPTH
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / 'LaTeX' / 'render_cache'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def normalize_pattern(pattern: str) -> str:
+    """Normalize a LaTeX pattern so that trivially different text hashes to the same render"""
+    return pattern.replace('\r\n', '\n').strip()
+
+
+def render_key(pattern: str, template_data: str, variant: str = 'png', density: int = DENSITY,
+               depth: int = DEPTH) -> str:
+    """Content address for a render. Variant distinguishes output formats of the same source, density and depth
+       the rasterizations of it"""
+    digest = sha256()
+    for part in (variant, str(density), str(depth), template_data, normalize_pattern(pattern)):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """Size bounded, least recently used, on-disk cache of rendered images"""
+
+    def __init__(self, cache_dir: Optional[Path] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(DEFAULT_CACHE_DIR if cache_dir is None else cache_dir)
+        self.max_bytes = max_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.size: int = 0
+        self._index: OrderedDict = OrderedDict()  # key -> size in bytes, oldest first
+        self._lock = RLock()
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the LRU order from the files already on disk"""
+        entries = []
+        for path in self.cache_dir.iterdir():
+            if path.is_file() and not path.name.endswith('.tmp'):
+                stat = path.stat()
+                entries.append((stat.st_mtime, path.name, stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self.size += size
+
+        self._evict()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key
+
+    @staticmethod
+    def key(pattern: str, template_data: str, variant: str = 'png', density: int = DENSITY, depth: int = DEPTH) -> str:
+        """Convenience wrapper around render_key"""
+        return render_key(pattern, template_data, variant=variant, density=density, depth=depth)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the cached render or None. A hit refreshes the entry's position in the LRU order"""
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as file:
+                    data: bytes = file.read()
+                os.utime(path)
+            except OSError:
+                # Removed from underneath us, treat as a miss
+                self.size -= self._index.pop(key)
+                self.misses += 1
+                return None
+
+            self._index.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes):
+        """Store a render and evict old entries until the store fits in max_bytes"""
+        if data is None:
+            return
+
+        with self._lock:
+            path = self._path(key)
+            tmp_path = path.with_name(path.name + '.tmp')
+
+            with open(tmp_path, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+
+            if key in self._index:
+                self.size -= self._index.pop(key)
+
+            self._index[key] = len(data)
+            self.size += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def lookup(self, pattern: str, template_data: str, variant: str = 'png', density: int = DENSITY,
+               depth: int = DEPTH) -> Optional[bytes]:
+        """Look up a render by its source"""
+        return self.get(self.key(pattern, template_data, variant=variant, density=density, depth=depth))
+
+    def store(self, pattern: str, template_data: str, data: bytes, variant: str = 'png', density: int = DENSITY,
+              depth: int = DEPTH):
+        """Store a render by its source"""
+        self.put(self.key(pattern, template_data, variant=variant, density=density, depth=depth), data)
+
+    def clear(self):
+        """Remove every entry from the store. Counters are left alone"""
+        with self._lock:
+            for key in list(self._index):
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._index.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        """Snapshot of the cache counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                        hit_rate=self.hits / lookups if lookups > 0 else 0.0,
+                        entries=len(self._index), size=self.size, max_bytes=self.max_bytes)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key: str):
+        return key in self._index
+
+
+_RENDER_CACHE: Optional[RenderCache] = None
+
+
+def render_cache() -> RenderCache:
+    """Process wide render cache, created on first use"""
+    global _RENDER_CACHE  # pylint: disable=global-statement
+    if _RENDER_CACHE is None:
+        _RENDER_CACHE = RenderCache()
+    return _RENDER_CACHE
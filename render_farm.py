@@ -0,0 +1,269 @@
+"""
+RenderFarm compiles LaTeX patterns in a pool of worker processes. Every job runs in its own temporary directory with
+its own file stem, so any number of compiles can run at the same time without clobbering each other's files and
+without changing the working directory of the calling process.
+
+Compiles produce png data, or gzip compressed SVG when asked for the SVG output.
+
+Example:
+    farm = render_farm()
+    future = farm.submit(r'\\si{\\km}^3', a_template)
+    png_data = future.result()
+    svgz_data = farm.submit(r'\\si{\\km}^3', a_template, output=SVG).result()
+
+https://docs.python.org/3/library/concurrent.futures.html
+"""
+
+__author__ = "William DeShazer"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import os
+import re
+import atexit
+import shutil
+import pprint
+import tempfile
+import subprocess
+from pathlib import Path
+from threading import Lock
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional, Iterable
+from time_logging import span
+from render_cache import render_cache, render_key, normalize_pattern
+from rasterize import DENSITY, DEPTH, COMPRESS_LEVEL, PNG, SVG, rasterize, rasterize_page, vectorize
+
+SHELL = os.name == 'nt'
+XELATEX = 'xelatex.exe' if os.name == 'nt' else 'xelatex'
+
+BATCH_PAGE_ENV = 'eqdbpage'
+LOG_TAIL_LINES = 20
+
+
+class XeLaTeXError(RuntimeError):
+    """XeLaTeX failed and left no pdf to render. The message ends with the tail of its log"""
+
+
+def batch_document(a_template: str, patterns: List[str]) -> str:
+    """Turn a single equation template into a multi-page document with one pattern per page.
+       Standalone templates are switched into multi mode so each page is cropped like a single compile,
+       any other document class simply gets a page break between patterns"""
+    standalone = re.compile(r'\\documentclass(\[([^\]]*)\])?\{standalone\}')
+    match = standalone.search(a_template)
+
+    if match is None:
+        body = '\n\\clearpage\n'.join(patterns)
+        return a_template.replace('%__REPLACEMENT__TEXT', body)
+
+    options = match.group(2)
+    options = 'multi=' + BATCH_PAGE_ENV if not options else options + ',multi=' + BATCH_PAGE_ENV
+    document = a_template[:match.start()] + '\\documentclass[' + options + ']{standalone}' + a_template[match.end():]
+
+    document = document.replace('\\begin{document}',
+                                '\\newenvironment{' + BATCH_PAGE_ENV + '}{}{}\n\\begin{document}', 1)
+
+    pages = ['\\begin{{{env}}}\n{pattern}\n\\end{{{env}}}'.format(env=BATCH_PAGE_ENV, pattern=pattern)
+             for pattern in patterns]
+    return document.replace('%__REPLACEMENT__TEXT', '\n'.join(pages))
+
+
+def _make_work_dir(work_dir: Optional[str] = None) -> Path:
+    if work_dir is None:
+        return Path(tempfile.mkdtemp(prefix='eq_db_'))
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    return work_dir
+
+
+def run_xelatex(stem: str, work_dir: Path, verbose: bool = False, fmt: Optional[str] = None) -> bool:
+    """Run xelatex on stem.tex inside work_dir, optionally against a preloaded format. Returns False when the run
+       failed, including when xelatex or work_dir can't be found"""
+    command = [XELATEX, stem + '.tex', '-interaction=batchmode']
+    if fmt is not None:
+        command.insert(1, '-fmt=' + fmt)
+
+    try:
+        p_1 = subprocess.run(command, cwd=work_dir, shell=SHELL, capture_output=True, text=True, check=True)
+        if verbose:
+            pprint.PrettyPrinter(indent=8).pprint(p_1)
+    except subprocess.CalledProcessError as error:
+        print(error.output)
+        return False
+    except OSError as error:
+        print('XeLaTeX failed to run:', error)
+        return False
+    return True
+
+
+def log_tail(stem: str, work_dir: Path, lines: int = LOG_TAIL_LINES) -> str:
+    """Last lines of the log xelatex wrote for stem, empty when there is none"""
+    try:
+        with open(work_dir / (stem + '.log'), 'r', errors='replace') as log_file:
+            return ''.join(log_file.readlines()[-lines:])
+    except OSError:
+        return ''
+
+
+def pdf_path(stem: str, work_dir: Path) -> Path:
+    """Location of the PDF xelatex wrote for stem. Raises if the run didn't produce one"""
+    path = work_dir / (stem + '.pdf')
+    if not path.exists():
+        raise FileNotFoundError('XeLaTeX produced no pdf: ' + str(path))
+    return path
+
+
+def render(pattern: str, a_template: str, stem: str = 'eq_db', work_dir: Optional[str] = None,
+           keep: bool = False, verbose: bool = False, density: int = DENSITY, depth: int = DEPTH,
+           compress_level: int = COMPRESS_LEVEL, output: str = PNG) -> Optional[bytes]:
+    """Compile one pattern into png data, or svgz data for the SVG output. Runs entirely inside work_dir, a fresh
+       temporary directory by default, which is removed afterwards unless keep is set. Raises XeLaTeXError when
+       the compile fails, returns None when the pdf couldn't be rasterized"""
+    work_dir = _make_work_dir(work_dir)
+
+    try:
+        with open(work_dir / (stem + '.tex'), 'w') as text_file:
+            text_file.write(a_template.replace('%__REPLACEMENT__TEXT', normalize_pattern(pattern)))
+
+        with span('xelatex', 'render'):
+            compiled = run_xelatex(stem, work_dir, verbose=verbose)
+        # Batchmode also exits non-zero on errors it recovered from, so a failed run that wrote a pdf is still used
+        if compiled is False and not (work_dir / (stem + '.pdf')).exists():
+            raise XeLaTeXError('XeLaTeX could not compile {!r}:\n{}'.format(pattern, log_tail(stem, work_dir)))
+        if output == SVG:
+            with span('vectorize', 'render'):
+                png_data = vectorize(pdf_path(stem, work_dir))[0]
+        else:
+            with span('rasterize', 'render'):
+                png_data = rasterize_page(pdf_path(stem, work_dir), density=density, depth=depth,
+                                          compress_level=compress_level)
+    finally:
+        if keep is False:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        elif verbose:
+            print('Kept LaTeX files in: ', work_dir)
+
+    return png_data
+
+
+def render_pages(patterns: List[str], a_template: str, stem: str = 'eq_db_batch', work_dir: Optional[str] = None,
+                 keep: bool = False, verbose: bool = False, density: int = DENSITY, depth: int = DEPTH,
+                 compress_level: int = COMPRESS_LEVEL, output: str = PNG) -> Optional[List[bytes]]:
+    """Typeset patterns as one multi-page document and split it into one png per page in a single rasterization
+       pass. Returns None when the pages can't be matched up with the patterns"""
+    work_dir = _make_work_dir(work_dir)
+
+    try:
+        with open(work_dir / (stem + '.tex'), 'w') as text_file:
+            text_file.write(batch_document(a_template, [normalize_pattern(pattern) for pattern in patterns]))
+
+        with span('xelatex', 'render', pages=len(patterns)):
+            run_xelatex(stem, work_dir, verbose=verbose)
+
+        try:
+            if output == SVG:
+                with span('vectorize', 'render', pages=len(patterns)):
+                    pages: Optional[List[bytes]] = vectorize(pdf_path(stem, work_dir))
+            else:
+                with span('rasterize', 'render', pages=len(patterns)):
+                    pages = rasterize(pdf_path(stem, work_dir), density=density, depth=depth,
+                                      compress_level=compress_level)
+        except FileNotFoundError:
+            pages = None
+
+        # A missing or an extra page means the document and the patterns are out of step
+        if pages is not None and len(pages) != len(patterns):
+            pages = None
+    finally:
+        if keep is False:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return pages
+
+
+class RenderFarm:
+    """Process pool for LaTeX compiles. Identical (pattern, template) jobs already in flight are shared and
+       results are written to the render cache as they complete"""
+
+    def __init__(self, max_workers: Optional[int] = None, use_cache: bool = True):
+        self.max_workers = os.cpu_count() if max_workers is None else max_workers
+        self.use_cache = use_cache
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, Future] = {}
+        self._lock = Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # Started on first use so importing this module never forks anything
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def submit(self, pattern: str, a_template: str, output: str = PNG) -> Future:
+        """Queue a compile. The future resolves to png data, or svgz data for the SVG output"""
+        key = render_key(pattern, a_template, variant=output)
+
+        if self.use_cache is True:
+            png_data = render_cache().get(key)
+            if png_data is not None:
+                future: Future = Future()
+                future.set_result(png_data)
+                return future
+
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+
+            # The content address doubles as the file stem, so leftover files can be traced back to the job
+            future = self._pool().submit(render, normalize_pattern(pattern), a_template, stem='eq_' + key[:16],
+                                         output=output)
+            self._pending[key] = future
+
+        future.add_done_callback(lambda done: self._finished(key, done))
+        return future
+
+    def _finished(self, key: str, future: Future):
+        with self._lock:
+            self._pending.pop(key, None)
+
+        if self.use_cache is True and not future.cancelled() and future.exception() is None:
+            render_cache().put(key, future.result())
+
+    def map(self, patterns: Iterable[str], a_template: str, output: str = PNG) -> List[Future]:
+        """Queue many compiles against the same template"""
+        return [self.submit(pattern, a_template, output=output) for pattern in patterns]
+
+    def render_many(self, patterns: Iterable[str], a_template: str, output: str = PNG) -> Dict[str, bytes]:
+        """Compile many patterns in parallel and wait for all of them. Returns the render data for each pattern"""
+        patterns = list(patterns)
+        futures = self.map(patterns, a_template, output=output)
+        wait(futures)
+        return {pattern: future.result() for pattern, future in zip(patterns, futures)}
+
+    def pending(self) -> int:
+        """Number of distinct compiles still in flight"""
+        with self._lock:
+            return len(self._pending)
+
+    def shutdown(self, wait_for_jobs: bool = True):
+        """Stop the worker processes. A later submit starts a new pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait_for_jobs)
+            self._executor = None
+
+
+_RENDER_FARM: Optional[RenderFarm] = None
+
+
+def render_farm(max_workers: Optional[int] = None) -> RenderFarm:
+    """Process wide render farm. Passing max_workers replaces the farm if it was sized differently"""
+    global _RENDER_FARM  # pylint: disable=global-statement
+    if _RENDER_FARM is None or (max_workers is not None and max_workers != _RENDER_FARM.max_workers):
+        if _RENDER_FARM is not None:
+            _RENDER_FARM.shutdown()
+        _RENDER_FARM = RenderFarm(max_workers=max_workers)
+    return _RENDER_FARM
+
+
+@atexit.register
+def _shutdown_render_farm():
+    if _RENDER_FARM is not None:
+        _RENDER_FARM.shutdown(wait_for_jobs=False)
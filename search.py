@@ -0,0 +1,93 @@
+"""
+Ranked search over equations, variables and units, answered by the database.
+
+Uses the full-text and trigram indexes from SQL/search_indexes.sql, so a search reads only the matching rows, never
+the whole table. Every word typed is matched as a prefix against name, notes and the words of the LaTeX, and names
+that merely look alike, or contain the text, are found through the trigram index. Hits come back best first and at
+most limit of them.
+
+Example:
+    hits = search_records('cont eq', 'equation', parent_table_name='eqn_group', parent_id=3, limit=20)
+    [hit.name for hit in hits]
+"""
+
+__author__ = "William DeShazer"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import re
+from collections import namedtuple
+from typing import List, Optional
+from psycopg2 import OperationalError, ProgrammingError
+from psycopg2.sql import SQL, Identifier
+from db_utils import my_connect, db_connection
+from time_logging import TimeLogger, span
+
+SEARCH_LIMIT = 50
+WORD = re.compile(r'[^\W_]+')  # tsquery splits on underscores too
+SIMILARITY_WEIGHT = 0.5  # name similarity counts half as much as a full-text match
+
+SearchHit = namedtuple('SearchHit', ['id', 'name', 'rank'])
+
+
+def prefix_query(text: str) -> Optional[str]:
+    """tsquery text that matches every word of text as a prefix, None when there is no word in it"""
+    words = WORD.findall(text.lower())
+    if not words:
+        return None
+    return ' & '.join(word + ':*' for word in words)
+
+
+def search_records(text: str, table_name: str, parent_table_name: Optional[str] = None,
+                   parent_id: Optional[int] = None, limit: int = SEARCH_LIMIT, my_conn: Optional[dict] = None,
+                   t_log: Optional[TimeLogger] = None, verbose: bool = False) -> List[SearchHit]:
+    """Best matches for text in table_name, optionally only the ones associated with parent_id"""
+    if verbose is True and t_log is None:
+        t_log = TimeLogger()
+
+    ts_query = prefix_query(text)
+    if ts_query is None:
+        return []
+
+    table_id_name = table_name + '_id'
+    vector = 'eq_db_search_vector(t.name, t.notes, t.latex)'
+    sql = 'SELECT t.{table_id}, t.name, ' \
+          'ts_rank_cd(' + vector + ', q.ts) + %(weight)s * similarity(t.name, %(text)s) AS rank ' \
+          'FROM {table} t, to_tsquery(\'simple\', %(ts_query)s) AS q(ts) ' \
+          'WHERE (' + vector + ' @@ q.ts OR t.name %% %(text)s OR t.name ILIKE %(like)s)'
+
+    names = dict(table=Identifier(table_name), table_id=Identifier(table_id_name))
+    if parent_id is not None and parent_table_name is not None:
+        sql += ' AND EXISTS (SELECT 1 FROM {join_table} j WHERE j.{table_id} = t.{table_id} ' \
+               'AND j.{parent_id} = %(parent_id)s)'
+        names.update(join_table=Identifier(table_name + '_' + parent_table_name),
+                     parent_id=Identifier(parent_table_name + '_id'))
+    sql += ' ORDER BY rank DESC, t.name LIMIT %(limit)s'
+
+    query = SQL(sql).format(**names)
+    like = '%' + text.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+    my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    if verbose is True:
+        t_log.new_event('Searching {} for: {}'.format(table_name, text))
+
+    with db_connection(my_conn) as conn, span('search', 'db', table=table_name):
+        cur = conn.cursor()
+        try:
+            cur.execute(query, dict(text=text.strip(), ts_query=ts_query, like=like, weight=SIMILARITY_WEIGHT,
+                                    parent_id=None if parent_id is None else int(parent_id), limit=int(limit)))
+            hits = [SearchHit(int(an_id), name, float(rank)) for an_id, name, rank in cur.fetchall()]
+        except (OperationalError, ProgrammingError) as error:
+            # ProgrammingError most likely means SQL/search_indexes.sql hasn't been run on this database
+            print(error)
+            hits = []
+            conn.rollback()
+        else:
+            conn.commit()
+        cur.close()
+
+    if verbose is True:
+        t_log.new_event('{} hits in {}'.format(len(hits), table_name))
+
+    return hits
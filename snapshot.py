@@ -0,0 +1,85 @@
+"""
+Snapshot keeps a local copy of pulled tables so a start only has to fetch what changed since the last run.
+
+Each table is written as a pickled DataFrame together with the largest modified_at in it, and optionally the images
+and thumbnails the table's image stores held, to a file per table. A load compares that stamp and a cheap id listing
+against the database and re-reads only the rows that differ. Snapshots are tied to the database they came from and
+are ignored when they were written for another one, or by another snapshot format.
+
+Example:
+    snap = Snapshot('equation')
+    saved = snap.load(db_params)
+    snap.save(data_df, db_params, images=store.snapshot())
+"""
+
+__author__ = "William DeShazer"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import os
+import pickle
+from pathlib import Path
+from datetime import timedelta
+from typing import Dict, Optional
+from pandas import DataFrame, Timestamp
+
+DEFAULT_SNAPSHOT_DIR = Path(__file__).resolve().parent / 'LaTeX' / 'snapshot'
+SNAPSHOT_FORMAT = 1
+TRANSIENT_COLUMNS = ('latex_obj',)  # rebuilt on load, they hold connections and loaders
+# modified_at is the start of the writing transaction, so one that committed after the snapshot was taken can carry
+# an earlier time. Rows this close to the stamp are read again to be safe
+STAMP_MARGIN = timedelta(minutes=5)
+
+
+def database_identity(db_params: dict) -> tuple:
+    """What a snapshot has to match to be reused"""
+    return db_params.get('host'), db_params.get('port'), db_params.get('database', db_params.get('dbname'))
+
+
+class Snapshot:
+    """On-disk copy of one table's frame and images"""
+
+    def __init__(self, table_name: str, snapshot_dir: Optional[Path] = None):
+        self.table_name = table_name
+        self.snapshot_dir = Path(DEFAULT_SNAPSHOT_DIR if snapshot_dir is None else snapshot_dir)
+
+    def path(self) -> Path:
+        """Snapshot file of the table"""
+        return self.snapshot_dir / (self.table_name + '.pkl')
+
+    def save(self, data_df: DataFrame, db_params: dict, images: Optional[Dict[int, bytes]] = None,
+             thumbnails: Optional[Dict[int, bytes]] = None):
+        """Write the frame, its modified_at stamp, images and thumbnails. The file is replaced in one step, so a crash
+           never leaves half a snapshot behind"""
+        data_df = data_df.drop(columns=[column for column in TRANSIENT_COLUMNS if column in data_df.columns])
+        stamp = data_df['modified_at'].max() if 'modified_at' in data_df.columns and len(data_df) > 0 else None
+
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path().with_suffix('.tmp')
+        with open(temp_path, 'wb') as file:
+            pickle.dump(dict(format=SNAPSHOT_FORMAT, database=database_identity(db_params), stamp=stamp,
+                             data=data_df, images={} if images is None else images,
+                             thumbnails={} if thumbnails is None else thumbnails),
+                        file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path())
+
+    def load(self, db_params: dict) -> Optional[dict]:
+        """Saved snapshot with keys stamp, data, images and thumbnails. None when there is no usable snapshot. The stamp
+           is already moved back by STAMP_MARGIN"""
+        try:
+            with open(self.path(), 'rb') as file:
+                saved = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+
+        if saved.get('format') != SNAPSHOT_FORMAT or saved.get('database') != database_identity(db_params) or \
+                not isinstance(saved.get('stamp'), Timestamp):
+            return None
+
+        saved['stamp'] = saved['stamp'].to_pydatetime() - STAMP_MARGIN
+        return saved
+
+    def remove(self):
+        """Delete the snapshot, the next load pulls the table in full"""
+        if self.path().exists():
+            self.path().unlink()
@@ -0,0 +1,45 @@
+"""
+Load the data stores the main window needs at the same time instead of one after another.
+
+Every store is built in its own worker thread, so each read_sql runs on its own pooled connection and the slowest
+table sets the startup time rather than the sum of all of them. Each load is logged when it starts and when it
+finishes, which makes the overlap visible in the TimeLogger output.
+
+Example:
+    loads = start_loading(dict(eqn_grp=EquationGroup, eq=GroupedEquations), t_log=t_log)
+    eqn_grp = loads['eqn_grp'].result()
+
+https://docs.python.org/3/library/concurrent.futures.html#threadpoolexecutor
+"""
+
+__author__ = "William DeShazer"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+from time import monotonic
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from time_logging import TimeLogger, span
+
+
+def _load(name: str, loader: Callable[[], Any], t_log: Optional[TimeLogger] = None) -> Any:
+    if t_log is not None:
+        t_log.new_event('Start loading: ' + name)
+    started = monotonic()
+    with span('load ' + name, 'startup'):
+        data_store = loader()
+    if t_log is not None:
+        t_log.new_event('Finished loading: {} ({:.3f} s)'.format(name, monotonic() - started))
+    return data_store
+
+
+def start_loading(loaders: Dict[str, Callable[[], Any]], max_workers: Optional[int] = None,
+                  t_log: Optional[TimeLogger] = None) -> Dict[str, Future]:
+    """Run every loader in its own thread and return a future for each, keyed like loaders. The loaders must open
+       their own connections, which every data store does through the shared pool"""
+    executor = ThreadPoolExecutor(max_workers=len(loaders) if max_workers is None else max_workers,
+                                  thread_name_prefix='startup')
+    futures = {name: executor.submit(_load, name, loader, t_log) for name, loader in loaders.items()}
+    # The threads finish the queued loads and then exit, nothing waits on them here
+    executor.shutdown(wait=False)
+    return futures
@@ -11,14 +11,14 @@ __version__ = "0.1.0"
 __license__ = "MIT"
 
 from collections import namedtuple
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Dict, Iterable
 from pathlib import Path
 from pandas import DataFrame, read_sql
 from psycopg2.sql import SQL, Identifier, Literal, Placeholder
 from psycopg2 import DatabaseError
-from psycopg2.extras import NamedTupleCursor
-from time_logging import TimeLogger
-from db_utils import my_connect
+from query_stats import InstrumentedNamedTupleCursor
+from time_logging import TimeLogger, span
+from db_utils import my_connect, db_connection
 
 
 class NoRecordIDError(UserWarning):
@@ -28,6 +28,19 @@ class NoRecordIDError(UserWarning):
 TemplateRecord = namedtuple('TemplateRecord', ['id', 'data', 'created_at', 'created_by'])
 TemplateRecordInput = namedtuple('TemplateRecordInput', ['data', 'created_by'])
 
+# Template text by id, memoized by latex_data.template_data. Nothing stamps template rows with a version, so the
+# entries are dropped when TemplateTable deletes a row and by forget_template_data when another client changes one
+TEMPLATE_DATA: Dict[int, str] = {}
+
+
+def forget_template_data(versions: Optional[Iterable[int]] = None):
+    """Drop memoized template text, all of it or just that of versions"""
+    if versions is None:
+        TEMPLATE_DATA.clear()
+    else:
+        for version in versions:
+            TEMPLATE_DATA.pop(int(version), None)
+
 
 class TemplateTable:
     """Class to handle database managment of templates"""
@@ -57,10 +70,10 @@ class TemplateTable:
             self.my_conn = my_conn
 
         my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-        conn = my_conn['conn']
         self.my_conn = my_conn
 
-        out_data = read_sql(query, con=conn, index_col='id')
+        with db_connection(my_conn) as conn, span('read_sql', 'db', table=table):
+            out_data = read_sql(query, con=conn, index_col='id')
 
         if verbose:
             t_log.new_event('Extracting records from Table: ' + table)
@@ -82,7 +95,6 @@ class TemplateTable:
             self.my_conn = my_conn
 
         my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-        conn = my_conn['conn']
 
         query = SQL('INSERT INTO {table} ({fields}) VALUES ({values})'
                     ).format(table=Identifier(table_name),
@@ -90,22 +102,23 @@ class TemplateTable:
                              values=SQL(', ').join(map(Placeholder, new_record._fields))
                              )
 
-        if verbose:
-            t_log.new_event(query.as_string(conn))
+        with db_connection(my_conn) as conn:
+            if verbose:
+                t_log.new_event(query.as_string(conn))
 
-        cur = conn.cursor(cursor_factory=NamedTupleCursor)
+            cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-        if verbose:
-            t_log.new_event('Adding new record to Table: {aTable}'.format(aTable=table_name))
+            if verbose:
+                t_log.new_event('Adding new record to Table: {aTable}'.format(aTable=table_name))
 
-        try:
-            cur.execute(query, new_record._asdict())
-        except DatabaseError as error:
-            print(error)
+            try:
+                cur.execute(query, new_record._asdict())
+            except DatabaseError as error:
+                print(error)
 
-        conn.commit()
+            conn.commit()
 
-        cur.close()
+            cur.close()
 
         self.pull_data()
 
@@ -129,8 +142,6 @@ class TemplateTable:
             t_log = TimeLogger()
 
         my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-        conn = my_conn['conn']
-        cur = conn.cursor()
 
         sql: str = 'DELETE FROM {table} WHERE id IN ({values});'
         query = SQL(sql).format(values=SQL(', ').join(map(Literal, id_tup)),
@@ -141,14 +152,19 @@ class TemplateTable:
 
         if verbose is True:
             t_log.new_event("execute_values() done")
-        try:
-            cur.execute(query, id_tup)
-            conn.commit()
-        except DatabaseError as error:
-            print("Error: %s" % error)
-            conn.rollback()
+
+        with db_connection(my_conn) as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(query, id_tup)
+                conn.commit()
+            except DatabaseError as error:
+                print("Error: %s" % error)
+                conn.rollback()
             cur.close()
 
+        forget_template_data(id_tup)
+
     @staticmethod
     def import_template_from_file(path: str = 'LaTeX', filename: str = 'eq_template.tex'):
         p = Path(path, filename)
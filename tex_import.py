@@ -0,0 +1,246 @@
+"""
+Bulk import of the equations in a LaTeX document.
+
+equation and align environments are streamed out of the .tex file and loaded with COPY FROM STDIN in a single
+transaction, so the number of round trips doesn't depend on the number of equations. Images are not compiled during
+the import. compile_imported renders every imported record afterwards in one batch pass.
+
+Example:
+    python tex_import.py LaTeX/AllEquations.tex --group 1 --compile --verbose
+
+COPY: https://www.postgresql.org/docs/current/sql-copy.html
+"""
+
+__author__ = "William DeShazer"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import re
+import csv
+import argparse
+from io import StringIO
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Union
+from psycopg2.sql import SQL, Identifier
+from psycopg2 import OperationalError, DatabaseError
+from psycopg2.extras import execute_values
+from db_utils import my_connect, db_connection
+from latex_data import available_templates, compile_patterns, vector_output
+from rasterize import SVG, make_thumbnail
+from grouped_physics_object import ORDER_GAP
+from time_logging import TimeLogger
+
+ENVIRONMENTS = ('equation', 'equation*', 'align', 'align*')
+BEGIN = re.compile(r'\\begin\{(' + '|'.join(re.escape(env) for env in ENVIRONMENTS) + r')\}')
+LABEL = re.compile(r'\\label\{([^}]*)\}')
+
+
+class TexEquation(NamedTuple):
+    """One display environment found in a .tex file"""
+    name: str
+    latex: str
+    environment: str
+    line: int
+
+
+def _strip_comment(line: str) -> str:
+    # A % starts a comment unless it is escaped as \%
+    match = re.search(r'(?<!\\)%', line)
+    return line if match is None else line[:match.start()]
+
+
+def iter_tex_equations(path: Union[str, Path]) -> Iterator[TexEquation]:
+    """Yield the equation and align environments of a .tex file one at a time. The label, when there is one, becomes
+       the name, otherwise the file and line number do. align bodies are wrapped in aligned so they typeset inside
+       the equation template like any other pattern"""
+    path = Path(path)
+    environment: Optional[str] = None
+    body: List[str] = []
+    start = 0
+
+    with open(path, 'r', encoding='utf-8') as tex_file:
+        for line_number, line in enumerate(tex_file, start=1):
+            line = _strip_comment(line)
+
+            while line:
+                if environment is None:
+                    match = BEGIN.search(line)
+                    if match is None:
+                        break
+                    environment = match.group(1)
+                    start = line_number
+                    body = []
+                    line = line[match.end():]
+                    continue
+
+                end = '\\end{' + environment + '}'
+                position = line.find(end)
+                if position < 0:
+                    body.append(line)
+                    break
+
+                body.append(line[:position])
+                line = line[position + len(end):]
+
+                latex = ''.join(body)
+                label = LABEL.search(latex)
+                latex = LABEL.sub('', latex).strip()
+                if environment.startswith('align'):
+                    latex = '\\begin{aligned}\n' + latex + '\n\\end{aligned}'
+                name = label.group(1) if label is not None else '{}:{}'.format(path.name, start)
+
+                if latex:
+                    yield TexEquation(name=name, latex=latex, environment=environment, line=start)
+                environment = None
+
+
+def _copy(cur, table_name: str, columns: List[str], rows: List[tuple]):
+    """COPY rows into a table. CSV keeps the backslashes in LaTeX literal, None goes in as NULL"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(rows)
+    buffer.seek(0)
+
+    query = SQL('COPY {table} ({fields}) FROM STDIN WITH (FORMAT csv)').format(
+        table=Identifier(table_name), fields=SQL(', ').join(map(Identifier, columns)))
+    cur.copy_expert(query.as_string(cur), buffer)
+
+
+def import_tex(path: Union[str, Path], parent_id: Optional[int] = None, table_name: str = 'equation',
+               parent_table_name: str = 'eqn_group', template_id: Optional[int] = None, unit_id: int = 1,
+               type_name: str = 'Unassigned', created_by: Optional[str] = None, my_conn: Optional[dict] = None,
+               t_log: Optional[TimeLogger] = None, verbose: bool = False) -> List[int]:
+    """Load every equation of a .tex file in one transaction and return the new ids in document order. With a
+       parent_id the equations are also appended to that group in document order. Images are left empty, see
+       compile_imported"""
+    if verbose is True and t_log is None:
+        t_log = TimeLogger()
+
+    my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
+    if created_by is None:
+        created_by = my_conn['db_params']['user']
+    if template_id is None:
+        template_id = available_templates(my_conn=my_conn, t_log=t_log, verbose=verbose)[-1]
+
+    equations = list(iter_tex_equations(path))
+    if len(equations) == 0:
+        return []
+
+    if verbose is True:
+        t_log.new_event('Importing {} equations from: {}'.format(len(equations), path))
+
+    table_id = table_name + '_id'
+    join_table = table_name + '_' + parent_table_name
+    ids: List[int] = []
+
+    with db_connection(my_conn) as conn:
+        cur = conn.cursor()
+
+        try:
+            # Ids are drawn from the sequence up front because COPY can't return them
+            cur.execute('SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                        (table_name, table_id, len(equations)))
+            ids = [row[0] for row in cur.fetchall()]
+
+            _copy(cur, table_name,
+                  [table_id, 'name', 'latex', 'template_id', 'dimensions', 'unit_id', 'type_name', 'created_by'],
+                  [(an_id, equation.name, equation.latex, template_id, 1, unit_id, type_name, created_by)
+                   for an_id, equation in zip(ids, equations)])
+
+            if parent_id is not None:
+                query = SQL('SELECT COALESCE(MAX(insertion_order), 0) FROM {table} WHERE {parent_id} = %s').format(
+                    table=Identifier(join_table), parent_id=Identifier(parent_table_name + '_id'))
+                cur.execute(query, (parent_id,))
+                last = cur.fetchone()[0]
+
+                _copy(cur, join_table,
+                      [table_id, parent_table_name + '_id', 'insertion_order', 'insertion_order_prev', 'inserted_by'],
+                      [(an_id, parent_id, last + (i + 1) * ORDER_GAP, last + (i + 1) * ORDER_GAP, created_by)
+                       for i, an_id in enumerate(ids)])
+        except (OperationalError, DatabaseError) as error:
+            print(error)
+            conn.rollback()
+            ids = []
+
+        conn.commit()
+        cur.close()
+
+    if verbose is True:
+        t_log.new_event('Imported {} equations into: {}'.format(len(ids), table_name))
+
+    return ids
+
+
+def compile_imported(ids: List[int], table_name: str = 'equation', my_conn: Optional[dict] = None,
+                     t_log: Optional[TimeLogger] = None, verbose: bool = False):
+    """Render the records that have no image yet in one batch compile per template and store all images with one
+       statement"""
+    if verbose is True and t_log is None:
+        t_log = TimeLogger()
+
+    table_id = table_name + '_id'
+    my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    query = SQL('SELECT {table_id}, latex, template_id FROM {table} '
+                'WHERE {table_id} = ANY(%s) AND image IS NULL').format(table=Identifier(table_name),
+                                                                       table_id=Identifier(table_id))
+    with db_connection(my_conn) as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(query, (list(ids),))
+        except OperationalError as error:
+            print(error)
+        records = cur.fetchall()
+        cur.close()
+
+    rows = []
+    vector_rows = []
+    for template_id in {record[2] for record in records}:
+        group = [record for record in records if record[2] == template_id]
+        images = compile_patterns([record[1] for record in group], version=template_id,
+                                  my_conn=my_conn, t_log=t_log, verbose=verbose)
+        rows.extend((record[0], images[record[1]], make_thumbnail(images[record[1]])) for record in group)
+        if vector_output():
+            vectors = compile_patterns([record[1] for record in group], version=template_id, output=SVG,
+                                       my_conn=my_conn, t_log=t_log, verbose=verbose)
+            vector_rows.extend((record[0], vectors[record[1]]) for record in group)
+
+    sql = 'UPDATE {table} SET image = data.image, thumbnail = data.thumbnail, compiled_at = now(), ' \
+          'image_is_dirty = FALSE FROM (VALUES %s) AS data ({table_id}, image, thumbnail) ' \
+          'WHERE {table}.{table_id} = data.{table_id}'
+    query = SQL(sql).format(table=Identifier(table_name), table_id=Identifier(table_id))
+    vector_query = SQL('UPDATE {table} SET svg = data.svg FROM (VALUES %s) AS data ({table_id}, svg) '
+                       'WHERE {table}.{table_id} = data.{table_id}').format(table=Identifier(table_name),
+                                                                              table_id=Identifier(table_id))
+
+    with db_connection(my_conn) as conn:
+        cur = conn.cursor()
+        try:
+            execute_values(cur, query, rows, page_size=max(len(rows), 1))
+            if len(vector_rows) > 0:
+                execute_values(cur, vector_query, vector_rows, page_size=len(vector_rows))
+        except OperationalError as error:
+            print(error)
+        conn.commit()
+        cur.close()
+
+    if verbose is True:
+        t_log.new_event('Compiled {} imported records'.format(len(rows)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import the equations of a LaTeX document')
+    parser.add_argument("tex_file", help='str: LaTeX document to import')
+    parser.add_argument("--group", dest='group', type=int, help='int: Equation group to append the equations to',
+                        default=None)
+    parser.add_argument("--template", dest='template', type=int, help='int: Template id, latest when not given',
+                        default=None)
+    parser.add_argument("--compile", dest='compile', help='Render the imported equations', action='store_true')
+    parser.add_argument("--verbose", dest='verbose', help='Output run messages', action='store_true')
+    args = parser.parse_args()
+
+    new_ids = import_tex(args.tex_file, parent_id=args.group, template_id=args.template, verbose=args.verbose)
+    print('Imported {} equations'.format(len(new_ids)))
+
+    if args.compile is True:
+        compile_imported(new_ids, verbose=args.verbose)
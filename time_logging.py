@@ -1,10 +1,34 @@
 """
 Time keeping utilities for logging events in programs
+
+TimeLogger prints a line per event. SpanProfiler records nested spans with perf_counter_ns timestamps per thread and
+exports them as Chrome trace events, which chrome://tracing or https://ui.perfetto.dev show on a timeline. Profiling
+is off unless EQ_DB_TRACE names a file, then the trace is written there when the process exits.
+
+Example:
+    with span('pull equations', 'db', table='equation'):
+        ...
+
+    @traced()
+    def refresh_equation_details(self):
+        ...
+
+https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
 """
+import os
+import json
+import atexit
+from collections import deque
 from datetime import datetime
-from time import sleep
-from dataclasses import dataclass
-from typing import List
+from time import sleep, perf_counter_ns
+from dataclasses import dataclass, field
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock, local, get_ident, current_thread
+from typing import Any, Callable, Dict, List, Optional
+
+TRACE_ENV = 'EQ_DB_TRACE'  # file the Chrome trace is written to at exit, profiling is off when unset
+MAX_SPANS = 1000000  # spans kept before the oldest are dropped
 
 
 @dataclass
@@ -35,24 +59,30 @@ class LoggedTime:
 
 @dataclass
 class TimeLogger:
-    """Used to Log Times In the system"""
-    start_time: LoggedTime = LoggedTime(event_message='Start Time')
+    """Used to Log Times In the system. Every event is also an instant on the span profiler's timeline"""
+    start_time: LoggedTime = field(default_factory=lambda: LoggedTime(event_message='Start Time'))
     new_event_time: LoggedTime = None
     last_event_time: LoggedTime = None
     logged_times: List[LoggedTime] = None
+    lock: Lock = field(default_factory=Lock, repr=False, compare=False)  # loads log from several threads at once
+    echo: bool = True  # print each event as it is logged
 
     def __post_init__(self):
         self.last_event_time = self.start_time
         self.new_event_time = self.start_time
         self.logged_times = [self.start_time]
-        self.start_time.message()
+        if self.echo is True:
+            self.start_time.message()
 
     def new_event(self, message: str):
         """The method to log events"""
-        self.last_event_time = self.new_event_time
-        self.new_event_time = LoggedTime(event_message=message, start_time=self.last_event_time.event_time)
-        self.logged_times.append(self.new_event_time)
-        self.new_event_time.message()
+        profiler().instant(message, 'time_log')
+        with self.lock:
+            self.last_event_time = self.new_event_time
+            self.new_event_time = LoggedTime(event_message=message, start_time=self.last_event_time.event_time)
+            self.logged_times.append(self.new_event_time)
+            if self.echo is True:
+                self.new_event_time.message()
 
     def history(self):
         """Shows history of all logged events"""
@@ -70,6 +100,167 @@ class TimeLogger:
         return delta
 
 
+@dataclass
+# pylint: disable=too-many-instance-attributes
+class Span:
+    """One timed stretch of work on one thread. end_ns is None for an instant"""
+    name: str
+    category: str
+    start_ns: int
+    end_ns: Optional[int] = None
+    thread_id: int = None
+    thread_name: str = None
+    depth: int = 0  # number of spans open around it on the same thread
+    parent: Optional[str] = None
+    args: Dict[str, Any] = None
+
+    def duration_ns(self) -> int:
+        """Length of the span, 0 for an instant or a span still open"""
+        return 0 if self.end_ns is None else self.end_ns - self.start_ns
+
+
+class SpanProfiler:
+    """Collects nested spans from any number of threads. A disabled profiler records nothing and costs a flag
+       check per span"""
+
+    def __init__(self, enabled: bool = False, max_spans: int = MAX_SPANS):
+        self.enabled = enabled
+        self.max_spans = max_spans
+        self.spans: deque = deque(maxlen=max_spans)
+        self.dropped: int = 0
+        self.origin_ns = perf_counter_ns()
+        self._local = local()
+        self._lock = Lock()
+
+    def _stack(self) -> List[Span]:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _new_span(self, name: str, category: str, args: Dict[str, Any]) -> Span:
+        stack = self._stack()
+        thread = current_thread()
+        return Span(name=name, category=category, start_ns=perf_counter_ns(), thread_id=get_ident(),
+                    thread_name=thread.name, depth=len(stack), parent=stack[-1].name if stack else None,
+                    args=args)
+
+    def _record(self, a_span: Span):
+        with self._lock:
+            if len(self.spans) == self.max_spans:
+                self.dropped += 1
+            self.spans.append(a_span)
+
+    @contextmanager
+    def span(self, name: str, category: str = 'app', **args):
+        """Time the with block as a span nested in whatever span is open on this thread"""
+        if self.enabled is False:
+            yield None
+            return
+
+        a_span = self._new_span(name, category, args)
+        stack = self._stack()
+        stack.append(a_span)
+        try:
+            yield a_span
+        finally:
+            a_span.end_ns = perf_counter_ns()
+            stack.pop()
+            self._record(a_span)
+
+    def instant(self, name: str, category: str = 'event', **args):
+        """Mark a point in time on this thread"""
+        if self.enabled is True:
+            self._record(self._new_span(name, category, args))
+
+    def clear(self):
+        """Forget every recorded span"""
+        with self._lock:
+            self.spans.clear()
+            self.dropped = 0
+
+    def summary(self) -> Dict[str, dict]:
+        """Count, total and longest duration in seconds per span name"""
+        totals: Dict[str, dict] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for a_span in spans:
+            if a_span.end_ns is None:
+                continue
+            total = totals.setdefault(a_span.name, dict(count=0, total=0.0, max=0.0))
+            seconds = a_span.duration_ns() / 1e9
+            total['count'] += 1
+            total['total'] += seconds
+            total['max'] = max(total['max'], seconds)
+        return totals
+
+    def chrome_trace(self) -> dict:
+        """Recorded spans in the Chrome trace event format, timestamps in microseconds since the profiler started"""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+
+        events = []
+        threads: Dict[int, str] = {}
+        for a_span in spans:
+            threads[a_span.thread_id] = a_span.thread_name
+            event = dict(name=a_span.name, cat=a_span.category, pid=pid, tid=a_span.thread_id,
+                         ts=(a_span.start_ns - self.origin_ns) / 1000, args=a_span.args or {})
+            if a_span.end_ns is None:
+                event.update(ph='i', s='t')
+            else:
+                event.update(ph='X', dur=a_span.duration_ns() / 1000)
+            events.append(event)
+
+        events.extend(dict(name='thread_name', ph='M', pid=pid, tid=thread_id, args=dict(name=thread_name))
+                      for thread_id, thread_name in threads.items())
+        return dict(traceEvents=events, displayTimeUnit='ms', otherData=dict(dropped=self.dropped))
+
+    def write_trace(self, path: str):
+        """Write the Chrome trace to path"""
+        with open(path, 'w') as trace_file:
+            json.dump(self.chrome_trace(), trace_file, default=str)
+
+
+_PROFILER: Optional[SpanProfiler] = None
+
+
+def profiler() -> SpanProfiler:
+    """Process wide span profiler, enabled when EQ_DB_TRACE is set"""
+    global _PROFILER  # pylint: disable=global-statement
+    if _PROFILER is None:
+        _PROFILER = SpanProfiler(enabled=bool(os.environ.get(TRACE_ENV)))
+    return _PROFILER
+
+
+def span(name: str, category: str = 'app', **args):
+    """Context manager timing a block on the process wide profiler"""
+    return profiler().span(name, category, **args)
+
+
+def traced(name: Optional[str] = None, category: str = 'app') -> Callable:
+    """Decorator timing every call of a function, named after its qualified name by default. Goes below
+       pyqtSlot on Qt slots"""
+    def decorate(func: Callable) -> Callable:
+        span_name = func.__qualname__ if name is None else name
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            a_profiler = profiler()
+            if a_profiler.enabled is False:
+                return func(*args, **kwargs)
+            with a_profiler.span(span_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@atexit.register
+def _write_trace():
+    path = os.environ.get(TRACE_ENV)
+    if path and _PROFILER is not None and _PROFILER.spans:
+        _PROFILER.write_trace(path)
+
+
 def main():
     """Example Use of TimeLogger"""
     time_log = TimeLogger()
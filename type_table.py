@@ -16,8 +16,8 @@ from numpy import logical_not
 from psycopg2.sql import SQL, Identifier, Literal
 from psycopg2 import DatabaseError
 from psycopg2.extras import execute_values
-from time_logging import TimeLogger
-from db_utils import my_connect
+from time_logging import TimeLogger, span
+from db_utils import my_connect, db_connection
 
 
 class NoRecordIDError(UserWarning):
@@ -49,9 +49,9 @@ class TypeTable:
             self.my_conn = my_conn
 
         my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-        conn = my_conn['conn']
 
-        out_data = read_sql(query, con=conn, index_col='type_name')
+        with db_connection(my_conn) as conn, span('read_sql', 'db', table=table):
+            out_data = read_sql(query, con=conn, index_col='type_name')
 
         if verbose:
             t_log.new_event('Extracting records from Table: ' + table)
@@ -71,33 +71,33 @@ class TypeTable:
             self.my_conn = my_conn
 
         my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-        conn = my_conn['conn']
 
-        cur = conn.cursor()
+        with db_connection(my_conn) as conn:
+            cur = conn.cursor()
 
-        self.types_df = self.types_df.append(new_data)
+            self.types_df = self.types_df.append(new_data)
 
-        sql = 'INSERT INTO {table} (type_name) VALUES %s;'
-        query = SQL(sql).format(table=Identifier(self.name))
+            sql = 'INSERT INTO {table} (type_name) VALUES %s;'
+            query = SQL(sql).format(table=Identifier(self.name))
 
-        tuples = [tuple([x]) for x in new_data.index]
+            tuples = [tuple([x]) for x in new_data.index]
 
-        if verbose is True:
-            print(query.as_string(cur))
-            print('Values', tuples)
-            t_log.new_event('Loading: ' + self.name)
-
-        try:
-            execute_values(cur, query, tuples)
-            conn.commit()
-        except DatabaseError as error:
-            print("Error: %s" % error)
-            conn.rollback()
-            cur.close()
+            if verbose is True:
+                print(query.as_string(cur))
+                print('Values', tuples)
+                t_log.new_event('Loading: ' + self.name)
 
-        if verbose is True:
-            t_log.new_event("execute_values() done")
-        cur.close()
+            try:
+                execute_values(cur, query, tuples)
+                conn.commit()
+            except DatabaseError as error:
+                print("Error: %s" % error)
+                conn.rollback()
+                cur.close()
+
+            if verbose is True:
+                t_log.new_event("execute_values() done")
+            cur.close()
 
     def types(self):
         """Returns Types as Numpy"""
@@ -142,8 +142,6 @@ class TypeTable:
             t_log = TimeLogger()
 
         my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-        conn = my_conn['conn']
-        cur = conn.cursor()
 
         if verbose is True:
             t_log.new_event(type(types))
@@ -156,17 +154,21 @@ class TypeTable:
                                 table=Identifier(self.name)
                                 )
 
-        if verbose is True:
-            print(query.as_string(cur))
-            t_log.new_event('Values' + str(types))
-            t_log.new_event('Pulling Data for: ' + self.name)
-
-        try:
-            cur.execute(query, types)
-            conn.commit()
-        except DatabaseError as error:
-            print("Error: %s" % error)
-            conn.rollback()
+        with db_connection(my_conn) as conn:
+            cur = conn.cursor()
+
+            if verbose is True:
+                print(query.as_string(cur))
+                t_log.new_event('Values' + str(types))
+                t_log.new_event('Pulling Data for: ' + self.name)
+
+            try:
+                cur.execute(query, types)
+                conn.commit()
+            except DatabaseError as error:
+                print("Error: %s" % error)
+                conn.rollback()
+
             cur.close()
 
         self.reinitialize_types_df(my_conn=my_conn, t_log=t_log, verbose=verbose)
@@ -174,8 +176,6 @@ class TypeTable:
         if verbose is True:
             t_log.new_event("execute_values() done")
 
-        cur.close()
-
     def index(self, type_name: str) -> int:
         """Convenience function to return the location of a type with the DataFrame"""
         return self.types_df.index.get_loc(type_name)
@@ -6,16 +6,19 @@ __author__ = "William DeShazer"
 __version__ = "0.1.0"
 __license__ = "MIT"
 
+import atexit
 from collections import namedtuple
 from warnings import warn
 from typing import Optional, List, Tuple
-from pandas import DataFrame, read_sql, Series
+from pandas import DataFrame, read_sql, Series, concat
 from psycopg2.sql import SQL, Identifier, Placeholder, Composed
 from psycopg2 import OperationalError
-from psycopg2.extras import NamedTupleCursor
+from query_stats import InstrumentedNamedTupleCursor
 from latex_data import LatexData
-from time_logging import TimeLogger
-from db_utils import my_connect
+from time_logging import TimeLogger, span
+from db_utils import my_connect, db_connection
+from snapshot import Snapshot
+from search import SearchHit, search_records, SEARCH_LIMIT
 
 
 class NoRecordIDError(UserWarning):
@@ -30,9 +33,45 @@ def generic_pull_data(table_name: str = None, my_conn: Optional[dict] = None,
     query = SQL('SELECT * FROM {table}').format(table=Identifier(table_name))
 
     my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-    conn = my_conn['conn']
 
-    data_df = read_sql(query, con=conn, index_col=table_id_name)
+    with db_connection(my_conn) as conn, span('read_sql', 'db', table=table_name):
+        data_df = read_sql(query, con=conn, index_col=table_id_name)
+    return data_df
+
+
+def generic_snapshot_pull_data(snapshot: Snapshot, table_name: str = None, my_conn: Optional[dict] = None,
+                               t_log: Optional[TimeLogger] = None, verbose: bool = False) -> DataFrame:
+    """Table from the local snapshot, with rows modified since it was written, added or deleted read again. Falls
+       back to a full pull when there is no usable snapshot"""
+    table_id_name: str = table_name + '_id'
+
+    my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
+    saved = snapshot.load(my_conn['db_params'])
+    if saved is None:
+        return generic_pull_data(table_name=table_name, my_conn=my_conn, t_log=t_log, verbose=verbose)
+
+    data_df: DataFrame = saved['data']
+    modified_query = SQL('SELECT {table_id} FROM {table} WHERE modified_at > %s').format(
+        table=Identifier(table_name), table_id=Identifier(table_id_name))
+    ids_query = SQL('SELECT {table_id} FROM {table}').format(table=Identifier(table_name),
+                                                             table_id=Identifier(table_id_name))
+
+    with db_connection(my_conn) as conn:
+        cur = conn.cursor()
+        cur.execute(modified_query, (saved['stamp'],))
+        changed = {row[0] for row in cur.fetchall()}
+        cur.execute(ids_query)
+        current = {row[0] for row in cur.fetchall()}
+        cur.close()
+
+        changed.update(current.symmetric_difference(data_df.index))
+        if len(changed) > 0:
+            query = SQL('SELECT * FROM {table} WHERE {table_id} = ANY(%s)').format(
+                table=Identifier(table_name), table_id=Identifier(table_id_name))
+            with span('read_sql', 'db', table=table_name, rows=len(changed)):
+                changed_df = read_sql(query, con=conn, params=(sorted(changed),), index_col=table_id_name)
+            data_df = concat([data_df[~data_df.index.isin(changed)], changed_df]).sort_index()
+
     return data_df
 
 
@@ -51,7 +90,6 @@ def generic_new_record_db(table_name: str = None, data_df: Optional[DataFrame] =
         new_record = {}
 
     my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-    conn = my_conn['conn']
     db_params = my_conn['db_params']
 
     next_id: int = generic_record_count(data_df) + 1
@@ -64,7 +102,9 @@ def generic_new_record_db(table_name: str = None, data_df: Optional[DataFrame] =
     if latex is None:
         latex = LatexData()
 
-    new_record.update(name=name, notes=notes, latex=latex.latex, image=latex.image, compiled_at=latex.compiled_at,
+    new_record.update(name=name, notes=notes, latex=latex.latex, image=latex.image,
+                      thumbnail=latex.thumbnail_image(), **add_field('svg', latex.vector_image()),
+                      compiled_at=latex.compiled_at,
                       template_id=latex.template_id, created_by=created_by)
 
     query = SQL('INSERT INTO {table} ({fields}) VALUES ({values})'
@@ -72,21 +112,22 @@ def generic_new_record_db(table_name: str = None, data_df: Optional[DataFrame] =
                          fields=SQL(', ').join(map(Identifier, new_record.keys())),
                          values=SQL(', ').join(map(Placeholder, new_record.keys())))
 
-    if verbose:
-        print(query.as_string(conn))
+    with db_connection(my_conn) as conn:
+        if verbose:
+            print(query.as_string(conn))
 
-    cur = conn.cursor(cursor_factory=NamedTupleCursor)
+        cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-    if verbose:
-        print('Adding new record to Table: {aTable}'.format(aTable=table_name))
+        if verbose:
+            print('Adding new record to Table: {aTable}'.format(aTable=table_name))
 
-    try:
-        cur.execute(query, new_record)
-    except OperationalError as error:
-        print(error)
+        try:
+            cur.execute(query, new_record)
+        except OperationalError as error:
+            print(error)
 
-    conn.commit()
-    cur.close()
+        conn.commit()
+        cur.close()
     updated_df = \
         generic_pull_data(table_name=table_name, my_conn=my_conn, t_log=t_log, verbose=verbose)
     return updated_df
@@ -102,20 +143,25 @@ def add_field(key: str = None, value=None):
 
 UnitRecord = \
     namedtuple('UnitRecord',
-               ['Index', 'name', 'latex', 'notes', 'image', 'template_id', 'image_is_dirty',  'created_at',
-                'created_by', 'modified_at',  'modified_by',  'compiled_at', 'type_name'])
+               ['Index', 'name', 'latex', 'notes', 'image', 'thumbnail', 'svg', 'template_id', 'image_is_dirty',
+                'created_at', 'created_by', 'modified_at',  'modified_by',  'compiled_at', 'type_name'])
 
 
 class Unit:
     """Class for managing and interfacing with Postgres Table eqn_group"""
-    def __init__(self, my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None, verbose: bool = False):
-        """Constructor for eqn_group"""
+    def __init__(self, my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None, verbose: bool = False,
+                 use_snapshot: bool = False):
+        """Constructor for eqn_group. use_snapshot starts from the local snapshot and saves a new one at exit"""
         self.table_name = 'unit'
         self.all_records_df: Optional[DataFrame] = None
         self.all_records: Optional[List[Tuple]] = None
         self.my_conn = my_conn
+        self.snapshot: Optional[Snapshot] = Snapshot(self.table_name) if use_snapshot is True else None
         self.pull_data(my_conn=my_conn, t_log=t_log, verbose=verbose)
 
+        if self.snapshot is not None:
+            atexit.register(self.save_snapshot)
+
     def id_name(self):
         """Convenience method to return id_name"""
         return self.table_name + '_id'
@@ -124,10 +170,26 @@ class Unit:
         """Method to pull data from database"""
         if my_conn is None:
             my_conn = self.my_conn
-        self.all_records_df = generic_pull_data(table_name=self.table_name, my_conn=my_conn,
-                                                t_log=t_log, verbose=verbose)
+        if self.snapshot is not None and self.all_records_df is None:
+            self.all_records_df = generic_snapshot_pull_data(self.snapshot, table_name=self.table_name,
+                                                             my_conn=my_conn, t_log=t_log, verbose=verbose)
+        else:
+            self.all_records_df = generic_pull_data(table_name=self.table_name, my_conn=my_conn,
+                                                    t_log=t_log, verbose=verbose)
         self.all_records = list(self.all_records_df.itertuples())
 
+    def save_snapshot(self):
+        """Write the table to the local snapshot"""
+        if self.snapshot is not None and self.all_records_df is not None:
+            self.snapshot.save(self.all_records_df, my_connect(my_conn=self.my_conn)['db_params'])
+
+    def search(self, text: str, limit: int = SEARCH_LIMIT, my_conn: Optional[dict] = None,
+               t_log: Optional[TimeLogger] = None, verbose: bool = False) -> List[SearchHit]:
+        """Best matches for text, searched in the database"""
+        if my_conn is None:
+            my_conn = self.my_conn
+        return search_records(text, self.table_name, limit=limit, my_conn=my_conn, t_log=t_log, verbose=verbose)
+
     def new_record(self, name: str = None, latex: LatexData = None,
                    new_record: dict = None, notes: str = None, created_by: str = None,
                    my_conn: Optional[dict] = None, t_log: Optional[TimeLogger] = None, verbose: bool = False
@@ -166,7 +228,6 @@ class Unit:
                 my_conn = self.my_conn
 
             my_conn = my_connect(my_conn=my_conn, t_log=t_log, verbose=verbose)
-            conn = my_conn['conn']
             db_params = my_conn['db_params']
 
             data.update(add_field('name', name))
@@ -174,6 +235,8 @@ class Unit:
             if latex is not None:
                 data.update(latex=latex.latex)
                 data.update(image=latex.image)
+                data.update(thumbnail=latex.thumbnail_image())
+                data.update(add_field('svg', latex.vector_image()))
                 data.update(template_id=latex.template_id)
                 data.update(compiled_at=latex.compiled_at)
             data.update(add_field('created_by', created_by))
@@ -204,26 +267,27 @@ class Unit:
 
                 data.update(where_key=an_id)
 
-                cur = conn.cursor(cursor_factory=NamedTupleCursor)
+                with db_connection(my_conn) as conn:
+                    cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor)
 
-                if verbose:
-                    print(query.as_string(conn))
-                    print(cur.mogrify(query, data))
+                    if verbose:
+                        print(query.as_string(conn))
+                        print(cur.mogrify(query, data))
 
-                try:
-                    cur.execute(query, data)
-                except OperationalError as error:
-                    print(error)
+                    try:
+                        cur.execute(query, data)
+                    except OperationalError as error:
+                        print(error)
 
-                conn.commit()
+                    conn.commit()
 
-                cur.close()
+                    cur.close()
 
                 self.pull_data(my_conn=my_conn, t_log=t_log, verbose=verbose)
 
     def record(self, an_id: int = None):
         """Returns individual record based on id"""
-        record_series: List = self.all_records_df.loc[an_id].to_list()
-        record_series.insert(0, an_id)
-        record = UnitRecord(*record_series)
+        # By name, thumbnail and svg sit elsewhere in tables they were added to later, and svg may be missing
+        row = self.all_records_df.loc[an_id]
+        record = UnitRecord(an_id, *[row.get(field) for field in UnitRecord._fields[1:]])
         return record
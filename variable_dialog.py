@@ -9,7 +9,6 @@ __license__ = "MIT"
 from typing import Optional
 from PyQt5.uic import loadUi  # noqa
 # from PyQt5.QtGui import QPainter, QColor, QIcon, QBrush
-from PyQt5.QtGui import QPixmap, QImage
 from PyQt5.QtWidgets import (
     QApplication, QTextEdit, QMessageBox, QAbstractItemView,
     QListWidget, QDialog, QDialogButtonBox, QGraphicsView, QPushButton,
@@ -19,6 +18,7 @@ from db_utils import my_connect
 from variables import GroupedVariables
 # from unit import Unit
 from time_logging import TimeLogger
+from pixmap_cache import pixmap_cache
 
 
 class VariableDialog(QDialog):
@@ -77,11 +77,12 @@ class VariableDialog(QDialog):
         self.dimension_l_edit.setText(str(record.dimensions))
         self.variable_latex_l_edit.setText(record.latex)
 
-        img = QImage.fromData(record.image)
-        pixmap = QPixmap.fromImage(img)
+        pixmap = pixmap_cache().record_pixmap(var, record.Index, record.compiled_at,
+                                              self.latex_g_view.devicePixelRatioF())
 
         scene = self.scene
-        scene.addPixmap(pixmap)
+        if pixmap is not None:
+            scene.addPixmap(pixmap)
         # self.latex_graphicbox.setScene(scene)
         self.latex_g_view.show()
         self.notes_text_edit.setText(record.notes)
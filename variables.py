@@ -12,10 +12,11 @@ from grouped_physics_object import GroupedPhysicsObject, add_field
 from physics_objects import PhysicsObjects, PhysicsObject
 from latex_data import LatexData
 
+# Rows of grouped_data, which leaves the image, thumbnail and svg blobs in the database
 GroupedVariableRecord = \
     namedtuple('VariableRecord',
                ['insertion_order', 'insertion_order_prev', 'insertion_date',
-                'inserted_by', 'name', 'latex', 'notes', 'image', 'template_id',
+                'inserted_by', 'name', 'latex', 'notes', 'template_id',
                 'image_is_dirty', 'created_at', 'created_by', 'modified_at',
                 'modified_by', 'compiled_at', 'dimensions', 'unit_id', 'type_name',
                 'latex_obj'])